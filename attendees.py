@@ -0,0 +1,393 @@
+# attendees.py
+import bisect
+import heapq
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter
+
+from batch import parse_attendees
+
+logger = logging.getLogger(__name__)
+
+# Letters that don't decompose into a base letter and a combining mark
+FOLDED_LETTERS = str.maketrans({
+    "ø": "o", "æ": "ae", "œ": "oe", "ð": "d", "þ": "th", "đ": "d", "ł": "l", "ı": "i",
+})
+
+# Characters that split a name into searchable words
+WORD_SEPARATORS = re.compile(r"[\s\-'’.,]+")
+
+# Trigrams shared by more than this fraction of the distinct words carry
+# little information and are skipped by the fuzzy search
+COMMON_TRIGRAM_FRACTION = 0.05
+
+# How alike (shared trigrams over all trigrams) a word must be to a query
+# word to count as a fuzzy match, e.g. "grase" and "grace" score 0.33
+MIN_SIMILARITY = 0.3
+
+
+def normalize(text):
+    """
+    Fold a name for searching: case, accents and diacritics are ignored
+    ("Zoë Ólafsdóttir" matches "zoe olafsdottir") and whitespace collapsed.
+    """
+    text = unicodedata.normalize("NFKD", str(text or "").casefold())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return " ".join(text.translate(FOLDED_LETTERS).split())
+
+
+def words(text):
+    """The normalised words of a name, e.g. both halves of a double-barrelled name"""
+    return [w for w in WORD_SEPARATORS.split(normalize(text)) if w]
+
+
+def trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class AttendeeIndex:
+    """
+    In-memory search index over the registered attendees.
+
+    Every word of an attendee's name is kept in a sorted list, so a
+    prefix search is a binary search. The distinct words are also indexed
+    by trigram for fuzzy matches that tolerate typos. Attendees are added and removed
+    one by one, and `replace` only applies the difference between the old
+    and the new list, so updating a list of thousands doesn't rebuild the
+    index.
+    """
+
+    def __init__(self):
+        self._attendees = {}
+        self._ids_by_key = {}
+        # Every word of every name, sorted, and the attendee each belongs to
+        self._words = []
+        self._word_ids = []
+        self._sort_keys = {}
+        self._name_words = {}
+        # Distinct words: how many attendees have each, and their trigrams
+        self._word_counts = Counter()
+        self._trigrams = {}
+        self._gram_counts = {}
+        self._next_id = 1
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._attendees)
+
+    def add(self, attendee):
+        """
+        Index an attendee.
+
+        Args:
+            attendee (dict): `first_name`, `last_name` and any label options
+
+        Returns:
+            int: The attendee's id in the index
+        """
+        with self._lock:
+            attendee_id = self._add(attendee)
+            self._insert_words(attendee_id)
+            return attendee_id
+
+    def remove(self, attendee_id):
+        """Remove an attendee from the index; returns False if it wasn't there"""
+        with self._lock:
+            if attendee_id not in self._attendees:
+                return False
+            self._delete_words(attendee_id)
+            self._remove(attendee_id)
+            return True
+
+    def replace(self, attendees):
+        """
+        Make the index hold exactly `attendees`, adding and removing only
+        the ones that changed.
+
+        Returns:
+            tuple: (added, removed) counts
+        """
+        by_key = {}
+        for attendee in attendees:
+            by_key.setdefault(self._key(attendee), []).append(attendee)
+        with self._lock:
+            # Attendees that are no longer on the list (or listed fewer times)
+            removed = []
+            for key, ids in self._ids_by_key.items():
+                removed.extend(ids[len(by_key.get(key, ())):])
+            added = []
+            for key, listed in by_key.items():
+                added.extend(listed[len(self._ids_by_key.get(key, ())):])
+
+            if len(added) + len(removed) > len(self._attendees) // 10:
+                # Large change: rebuild the word list in one pass and sort it
+                gone = set(removed)
+                for attendee_id in removed:
+                    self._remove(attendee_id)
+                for attendee in added:
+                    self._add(attendee)
+                entries = [e for e in zip(self._words, self._word_ids) if e[1] not in gone]
+                for attendee_id in self._ids_since(len(added)):
+                    entries.extend((word, attendee_id) for word in self._name_words[attendee_id])
+                entries.sort()
+                self._words = [word for word, _ in entries]
+                self._word_ids = [attendee_id for _, attendee_id in entries]
+            else:
+                for attendee_id in removed:
+                    self._delete_words(attendee_id)
+                    self._remove(attendee_id)
+                for attendee in added:
+                    self._insert_words(self._add(attendee))
+            return len(added), len(removed)
+
+    def search(self, query, limit=10):
+        """
+        Find attendees by name.
+
+        Every word of the query must start a word of the attendee's name,
+        in any order ("lov ada" finds Ada Lovelace). Names matching whole
+        words rank first, then by last and first name. If that finds fewer
+        than `limit` attendees, names where the query words start or are
+        spelled like words of the name fill up the results, most alike
+        first.
+
+        Returns:
+            list: Attendee dicts with their `id` and `match` ("prefix" or "fuzzy")
+        """
+        terms = words(query)
+        if not terms:
+            return []
+        with self._lock:
+            candidates, exact_sets = None, []
+            # Longest words first: they match the fewest names
+            for term in sorted(terms, key=len, reverse=True):
+                matches, exact = self._prefix(term)
+                candidates = matches if candidates is None else candidates & matches
+                exact_sets.append(exact)
+                if not candidates:
+                    break
+
+            # Names where every query word is a whole word come first
+            whole = candidates.intersection(*exact_sets)
+            ranked = heapq.nsmallest(limit, whole, key=self._sort_keys.__getitem__)
+            if len(ranked) < limit:
+                ranked += heapq.nsmallest(limit - len(ranked), candidates - whole,
+                                          key=self._sort_keys.__getitem__)
+            results = [dict(self._attendees[i], id=i, match="prefix") for i in ranked]
+            if len(results) < limit:
+                for attendee_id in self._fuzzy(terms, limit - len(results), exclude=candidates):
+                    results.append(dict(self._attendees[attendee_id], id=attendee_id, match="fuzzy"))
+            return results
+
+    # --- Internals (called with the lock held) ---
+
+    @staticmethod
+    def _key(attendee):
+        return tuple(sorted(attendee.items()))
+
+    def _ids_since(self, count):
+        """Ids of the last `count` attendees added"""
+        return range(self._next_id - count, self._next_id)
+
+    def _insert_words(self, attendee_id):
+        for word in self._name_words[attendee_id]:
+            index = bisect.bisect_right(self._words, word)
+            self._words.insert(index, word)
+            self._word_ids.insert(index, attendee_id)
+
+    def _delete_words(self, attendee_id):
+        for word in self._name_words[attendee_id]:
+            start = bisect.bisect_left(self._words, word)
+            end = bisect.bisect_right(self._words, word, start)
+            index = self._word_ids.index(attendee_id, start, end)
+            del self._words[index]
+            del self._word_ids[index]
+
+    def _add(self, attendee):
+        attendee_id = self._next_id
+        self._next_id += 1
+        self._attendees[attendee_id] = dict(attendee)
+        self._ids_by_key.setdefault(self._key(attendee), []).append(attendee_id)
+        self._sort_keys[attendee_id] = (normalize(attendee.get("last_name")), normalize(attendee.get("first_name")))
+        name_words = self._name_words[attendee_id] = frozenset(
+            words(f"{attendee.get('first_name') or ''} {attendee.get('last_name') or ''}")
+        )
+        for word in name_words:
+            if not self._word_counts[word]:
+                grams = trigrams(word)
+                for gram in grams:
+                    self._trigrams.setdefault(gram, set()).add(word)
+                self._gram_counts[word] = len(grams)
+            self._word_counts[word] += 1
+        return attendee_id
+
+    def _remove(self, attendee_id):
+        for word in self._name_words.pop(attendee_id):
+            self._word_counts[word] -= 1
+            if not self._word_counts[word]:
+                del self._word_counts[word]
+                del self._gram_counts[word]
+                for gram in trigrams(word):
+                    self._trigrams[gram].discard(word)
+                    if not self._trigrams[gram]:
+                        del self._trigrams[gram]
+        key = self._key(self._attendees[attendee_id])
+        ids = self._ids_by_key[key]
+        ids.remove(attendee_id)
+        if not ids:
+            del self._ids_by_key[key]
+        del self._attendees[attendee_id]
+        del self._sort_keys[attendee_id]
+
+    def _prefix(self, term):
+        """Ids with a word starting with `term`, and those with a word equal to it"""
+        start = bisect.bisect_left(self._words, term)
+        end = bisect.bisect_left(self._words, term + "\U0010ffff", start)
+        exact_end = bisect.bisect_right(self._words, term, start, end)
+        return set(self._word_ids[start:end]), set(self._word_ids[start:exact_end])
+
+    def _exact(self, word):
+        start = bisect.bisect_left(self._words, word)
+        return self._word_ids[start:bisect.bisect_right(self._words, word, start)]
+
+    def _similar_words(self, term):
+        """Distinct words spelled like `term`, with their similarity to it"""
+        query = trigrams(term)
+        if len(term) < 3:
+            return {}
+        too_common = max(50, len(self._word_counts) * COMMON_TRIGRAM_FRACTION)
+        shared = Counter()
+        for gram in query:
+            similar = self._trigrams.get(gram)
+            if similar and len(similar) <= too_common:
+                shared.update(similar)
+        scores = {}
+        for word, count in shared.items():
+            similarity = count / (len(query) + self._gram_counts[word] - count)
+            if similarity >= MIN_SIMILARITY:
+                scores[word] = similarity
+        return scores
+
+    def _fuzzy(self, terms, limit, exclude):
+        """
+        Ids of the attendees where every term starts or is spelled like a
+        word of the name, most alike first, leaving out `exclude`.
+        """
+        matches = []
+        for term in terms:
+            prefixed = self._prefix(term)[0]
+            similar = self._similar_words(term)
+            size = len(prefixed) + sum(self._word_counts[word] for word in similar)
+            matches.append((size, prefixed, similar))
+        # Score the attendees matching the most selective term, then check
+        # only those against the other terms
+        matches.sort(key=lambda m: m[0])
+        _, prefixed, similar = matches[0]
+        scores = dict.fromkeys(prefixed, 1.0)
+        for word, similarity in similar.items():
+            for attendee_id in self._exact(word):
+                if similarity > scores.get(attendee_id, 0):
+                    scores[attendee_id] = similarity
+        for _, prefixed, similar in matches[1:]:
+            for attendee_id in list(scores):
+                if attendee_id in prefixed:
+                    scores[attendee_id] += 1.0
+                    continue
+                best = max((similar.get(word, 0) for word in self._name_words[attendee_id]), default=0)
+                if best:
+                    scores[attendee_id] += best
+                else:
+                    del scores[attendee_id]
+        sort_keys = self._sort_keys
+        return heapq.nsmallest(
+            limit,
+            (i for i in scores if i not in exclude),
+            key=lambda i: (-scores[i], sort_keys[i]),
+        )
+
+
+class AttendeeList:
+    """
+    The registered attendees, loaded from a CSV or JSON Lines file into
+    an AttendeeIndex.
+
+    The file is checked for changes at most every `check_interval`
+    seconds when the index is used, so every server process picks up a
+    new list; changes are applied to the index incrementally. If a new
+    file can't be read, the previous list stays searchable until the
+    file changes again.
+    """
+
+    def __init__(self, path, check_interval=1.0):
+        self.path = path
+        self.check_interval = check_interval
+        self.index = AttendeeIndex()
+        self.loaded_at = None
+        self.error = None
+        self._mtime = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def search(self, query, limit=10):
+        self.refresh()
+        return self.index.search(query, limit)
+
+    def refresh(self, force=False):
+        """Apply changes to the attendee file to the index"""
+        now = time.monotonic()
+        if not force and now - self._checked_at < self.check_interval:
+            return
+        with self._lock:
+            self._checked_at = now
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+            except FileNotFoundError:
+                mtime = None
+            if mtime == self._mtime:
+                return
+            try:
+                if mtime is None:
+                    attendees = []
+                else:
+                    with open(self.path, "rb") as f:
+                        attendees = [a for a in parse_attendees(f.read(), self.path)
+                                     if a["first_name"] or a["last_name"]]
+            except Exception as e:
+                # Keep serving the previous list; retry once the file changes
+                logger.error("Could not read attendee list %s, keeping the previous one: %s", self.path, e)
+                self._mtime = mtime
+                self.error = str(e)
+                return
+            self.index.replace(attendees)
+            self._mtime = mtime
+            self.error = None
+            self.loaded_at = time.time()
+
+    def save(self, data):
+        """
+        Replace the attendee file with an uploaded list (CSV or JSON Lines).
+
+        Returns:
+            tuple: (added, removed) counts
+        """
+        attendees = [a for a in parse_attendees(data, self.path) if a["first_name"] or a["last_name"]]
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, self.path)
+        with self._lock:
+            changes = self.index.replace(attendees)
+            self._mtime = os.stat(self.path).st_mtime_ns
+            self._checked_at = time.monotonic()
+            self.error = None
+            self.loaded_at = time.time()
+        return changes
+
+    def stats(self):
+        self.refresh()
+        return {"path": self.path, "attendees": len(self.index), "loaded_at": self.loaded_at, "error": self.error}
@@ -0,0 +1,252 @@
+# batch.py
+import csv
+import io
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+from functions import lp_profiles
+from label_templates import render_params, resolve_params
+from printer_manager.backends import get_backend
+
+logger = logging.getLogger(__name__)
+
+
+# Column names accepted for the attendee's names in uploaded files
+FIRST_NAME_FIELDS = ("first_name", "firstname", "first name", "vorname")
+LAST_NAME_FIELDS = ("last_name", "lastname", "last name", "nachname")
+
+# Per-row label options that may override the batch defaults
+LABEL_OPTIONS = ("layout", "font_size", "width", "height", "template", "color_mode")
+
+# Pause the batch after this many labels in a row failed to print
+MAX_CONSECUTIVE_FAILURES = 3
+
+
+def parse_attendees(data, filename=""):
+    """
+    Parse an uploaded attendee list.
+
+    Args:
+        data (bytes): File contents, CSV with a header row or JSON Lines
+        filename (str): Original file name, used to tell the formats apart
+
+    Returns:
+        list: One dict per attendee with `first_name`, `last_name` and any
+            label options present in the row
+    """
+    text = data.decode("utf-8-sig")
+    if filename.lower().endswith((".jsonl", ".ndjson")) or text.lstrip().startswith("{"):
+        rows = [json.loads(line) for line in text.splitlines() if line.strip()]
+    else:
+        rows = list(csv.DictReader(io.StringIO(text)))
+
+    attendees = []
+    for row in rows:
+        fields = {str(k).strip().lower(): v for k, v in row.items() if k is not None}
+        first_name = next((fields[f] for f in FIRST_NAME_FIELDS if fields.get(f)), None)
+        last_name = next((fields[f] for f in LAST_NAME_FIELDS if fields.get(f)), None)
+        attendee = {"first_name": first_name, "last_name": last_name}
+        for option in LABEL_OPTIONS:
+            if fields.get(option) not in (None, ""):
+                value = fields[option]
+                attendee[option] = value if option in ("layout", "template", "color_mode") or value == "auto" else int(value)
+        attendees.append(attendee)
+    return attendees
+
+
+# Labels rendered per task sent to a worker process, to amortise the IPC cost
+RENDER_CHUNK_SIZE = 8
+
+
+def render_batch_labels(chunk, method, address, model):
+    """
+    Render labels and convert them for the printer (runs in a worker process).
+
+    Returns:
+        list: (params, payload, error) per label, in the order given;
+            params has the fitted layout and font size
+    """
+    backend = get_backend(method, address, model)
+    results = []
+    for params in chunk:
+        try:
+            params = resolve_params(params)
+            image = render_params(params)
+            results.append((params, backend.prepare(image), None))
+        except Exception as e:
+            results.append((params, None, str(e)))
+    return results
+
+
+class Batch:
+    """
+    A list of attendee labels rendered in parallel and printed in order.
+
+    Labels are rendered in a process pool and each one is sent to the
+    printer as soon as it (and every label before it) is ready, so
+    printing starts while the rest of the batch is still rendering.
+    """
+
+    def __init__(self, attendees, printer, workers=None, render_only=False, on_label=None,
+                 on_printed=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.attendees = attendees
+        self.total = len(attendees)
+        self.printer = printer
+        self.workers = workers or os.cpu_count() or 1
+        self.render_only = render_only
+        self.on_label = on_label
+        self.on_printed = on_printed
+        self.state = "queued"
+        self.error = None
+        self.rendered = 0
+        self.printed = 0
+        self.failed = 0
+        self.failures = []
+        self.timestamps = {"queued": time.time()}
+        self._resume = threading.Event()
+        self._resume.set()
+        self._cancelled = False
+        self._lock = threading.Lock()
+
+    def start(self):
+        threading.Thread(target=self._run, name=f"batch-{self.id}", daemon=True).start()
+
+    def pause(self):
+        if self._set_state("paused", only_from=("queued", "rendering", "printing")):
+            self._resume.clear()
+            return True
+        return False
+
+    def resume(self):
+        state = "rendering" if self.render_only else "printing"
+        if self._set_state(state, only_from=("paused",)):
+            with self._lock:
+                self.error = None
+            self._resume.set()
+            return True
+        return False
+
+    def cancel(self):
+        if self._set_state("cancelled", only_from=("queued", "rendering", "printing", "paused")):
+            self._cancelled = True
+            self._resume.set()
+            return True
+        return False
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "id": self.id,
+                "state": self.state,
+                "error": self.error,
+                "total": self.total,
+                "rendered": self.rendered,
+                "printed": self.printed,
+                "failed": self.failed,
+                "failures": list(self.failures[:100]),
+                "render_only": self.render_only,
+                "printer": self.printer.get("address"),
+                "timestamps": dict(self.timestamps),
+            }
+
+    @property
+    def finished(self):
+        return self.state in ("done", "failed", "cancelled")
+
+    def _set_state(self, state, only_from=None, error=None):
+        with self._lock:
+            if only_from and self.state not in only_from:
+                return False
+            self.state = state
+            self.timestamps[state] = time.time()
+            if error is not None:
+                self.error = error
+            return True
+
+    def _fail_label(self, index, error):
+        with self._lock:
+            self.failed += 1
+            self.failures.append({"row": index + 1, "error": error})
+
+    def _run(self):
+        method = self.printer.get("method", "system")
+        address = self.printer.get("address")
+        model = self.printer.get("model", "QL-820NWB")
+        backend = get_backend(method, address, model, profiles=lp_profiles)
+
+        self._set_state("rendering", only_from=("queued",))
+        consecutive_failures = 0
+        try:
+            valid = []
+            for index, params in enumerate(self.attendees):
+                if params.get("first_name") and params.get("last_name"):
+                    valid.append((index, params))
+                else:
+                    self._fail_label(index, "Missing first or last name")
+
+            # Spawn rather than fork: the server's threads may hold locks
+            # (metrics, logging) at fork time, which a forked child would
+            # wait on forever
+            with ProcessPoolExecutor(max_workers=self.workers,
+                                     mp_context=multiprocessing.get_context("spawn")) as executor:
+                chunks = []
+                for start in range(0, len(valid), RENDER_CHUNK_SIZE):
+                    chunk = valid[start:start + RENDER_CHUNK_SIZE]
+                    future = executor.submit(
+                        render_batch_labels, [params for _, params in chunk], method, address, model
+                    )
+                    chunks.append((chunk, future))
+
+                if not self.render_only:
+                    self._set_state("printing", only_from=("rendering",))
+                for chunk, future in chunks:
+                    try:
+                        results = future.result()
+                    except Exception as e:
+                        results = [(params, None, str(e)) for _, params in chunk]
+
+                    # Labels are handed over strictly in file order
+                    for (index, _), (params, payload, error) in zip(chunk, results):
+                        self._resume.wait()
+                        if self._cancelled:
+                            executor.shutdown(wait=False, cancel_futures=True)
+                            return
+                        if error is not None:
+                            self._fail_label(index, f"Render failed: {error}")
+                            continue
+                        with self._lock:
+                            self.rendered += 1
+                        if self.on_label:
+                            self.on_label(params, payload)
+                        if self.render_only:
+                            continue
+
+                        if backend.send(payload):
+                            consecutive_failures = 0
+                            with self._lock:
+                                self.printed += 1
+                            if self.on_printed:
+                                self.on_printed(index, params)
+                        else:
+                            consecutive_failures += 1
+                            self._fail_label(index, "Print failed")
+                            if consecutive_failures >= MAX_CONSECUTIVE_FAILURES:
+                                # Don't burn through the rest of the list on a dead printer
+                                self.pause()
+                                with self._lock:
+                                    self.error = "Paused after repeated print failures"
+
+            self._set_state("done", only_from=("rendering", "printing"))
+        except Exception as e:
+            logger.error("Error in batch %s: %s", self.id, e)
+            self._set_state("failed", error=str(e))
+        finally:
+            # Finished batches are kept for their progress report only
+            self.attendees = []
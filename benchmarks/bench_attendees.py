@@ -0,0 +1,69 @@
+"""
+Benchmark the check-in attendee search.
+
+Usage:
+    python benchmarks/bench_attendees.py [--attendees 50000] [--runs 50]
+
+Indexes a synthetic attendee list, then reports the time to apply a small
+change to it and the p50/max latency of typical typeahead queries: single
+letters, prefixes, first and last name together, accented names and typos.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from attendees import AttendeeIndex  # noqa: E402
+
+FIRST_NAMES = [
+    "Ada", "Grace", "Alan", "Barbara", "Edsger", "Katherine", "Linus", "Margaret", "Jürgen", "Zoë",
+    "José", "Søren", "Łukasz", "Ana", "Maximilian", "Chloé", "Mia", "Noah", "Olivia", "Liam",
+]
+SYLLABLES = [
+    "an", "ber", "chen", "dor", "el", "fin", "gar", "hol", "is", "jo", "ka", "lo", "mar", "nov", "os",
+    "pet", "qu", "ros", "son", "tal", "ul", "ver", "wen", "xi", "yam", "zu", "ó", "dótt", "ir", "sch",
+]
+
+QUERIES = ["a", "ma", "mar", "katherin", "zoe", "jurgen", "soren", "lukasz", "grase", "ada lo", "lo ada", "xyzzy"]
+
+
+def attendee(rng):
+    last_name = "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))).capitalize()
+    return {"first_name": rng.choice(FIRST_NAMES) + rng.choice(["", "a", "o", "ie"]), "last_name": last_name}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--attendees", type=int, default=50000)
+    parser.add_argument("--runs", type=int, default=50)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    attendees = [attendee(rng) for _ in range(args.attendees)]
+    index = AttendeeIndex()
+    start = time.perf_counter()
+    index.replace(attendees)
+    print(f"index {len(index)} attendees: {time.perf_counter() - start:.2f} s")
+
+    changed = attendees[:-10] + [attendee(rng) for _ in range(10)]
+    start = time.perf_counter()
+    added, removed = index.replace(changed)
+    print(f"apply change (+{added} -{removed}): {(time.perf_counter() - start) * 1000:.1f} ms\n")
+
+    print(f"{'query':<12}{'p50 ms':>8}{'max ms':>8}{'results':>9}")
+    for query in QUERIES:
+        timings = []
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            results = index.search(query, 10)
+            timings.append((time.perf_counter() - start) * 1000)
+        print(f"{query:<12}{statistics.median(timings):>8.2f}{max(timings):>8.2f}{len(results):>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Benchmark auto-fitting names onto a label.
+
+Usage:
+    python benchmarks/bench_autofit.py [--width 731] [--height 300]
+
+Fits a corpus of long and non-ASCII names with layout="auto" and reports
+the time per fit in three situations: empty metric caches (every glyph
+measured for the first time), new names made of already measured glyphs
+(the usual case on a running server) and names seen before. Each result
+is checked against an exact measurement to make sure nothing overflows.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+import functions  # noqa: E402
+
+NAMES = [
+    ("Ada", "Lovelace"),
+    ("Li", "Na"),
+    ("Maximilian-Alexander", "von Hohenzollern-Sigmaringen"),
+    ("Anna-Katharina", "Schmidt-Wellenburg"),
+    ("Jürgen", "Müller-Lüdenscheidt"),
+    ("Zoë", "Ólafsdóttir"),
+    ("Björk", "Guðmundsdóttir"),
+    ("François", "Ça-Été-Désiré"),
+    ("Łukasz", "Wąsowski-Żółtański"),
+    ("Dvořák", "Šťastný"),
+    ("Søren", "Kierkegaard"),
+    ("José María", "García de la Fuente"),
+    ("Nguyễn", "Thị Minh Khai"),
+    ("Oluwaseun", "Adebayo-Ogunlesi"),
+    ("Rhiannon", "Llewellyn-Fflewddur"),
+    ("Christopher", "Montgomery-Worthington III"),
+    ("Hubert Blaine", "Wolfeschlegelsteinhausenbergerdorff"),
+    ("Kai", "Ö"),
+    ("Ángel", "Ñúñez"),
+    ("Gülşen", "Yıldırım"),
+    ("Αλέξανδρος", "Παπαδόπουλος"),
+    ("Дмитрий", "Шостакович"),
+    ("Mary-Elizabeth", "O'Sullivan-Fitzgerald"),
+    ("Jean-Baptiste", "Poquelin"),
+    ("Friedrich", "Dürrenmatt"),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--width", type=int, default=731)
+    parser.add_argument("--height", type=int, default=300)
+    args = parser.parse_args()
+
+    # Load the reference font outside the timed region, as a running server would have
+    functions.get_font(functions.FONT_PATH, functions.METRICS_REFERENCE_SIZE)
+
+    results = {}
+    for run in ("cold", "new", "repeat"):
+        if run == "cold":
+            functions.glyph_metrics.cache_clear()
+        if run != "repeat":
+            functions.estimate_text_bbox.cache_clear()
+            functions.text_bbox.cache_clear()
+        timings = []
+        for first, last in NAMES:
+            start = time.perf_counter()
+            results[(first, last)] = functions.auto_fit(first, last, args.width, args.height)
+            timings.append((time.perf_counter() - start) * 1000)
+        print(f"{run:<6} mean {statistics.mean(timings):.3f} ms  "
+              f"median {statistics.median(timings):.3f} ms  max {max(timings):.3f} ms")
+
+    overflows = 0
+    print(f"\n{'name':<50}{'layout':<14}{'size':>5}")
+    for (first, last), (layout, size) in results.items():
+        fits = functions.label_fits(first, last, layout, size, args.width, args.height)
+        overflows += not fits
+        print(f"{first + ' ' + last:<50}{layout:<14}{size:>5}{'' if fits else '  OVERFLOW'}")
+    print(f"\n{len(results)} names, {overflows} overflowing")
+    return 1 if overflows else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,125 @@
+"""
+Compare per-label latency of the lp and direct brother_ql backends.
+
+Usage:
+    python benchmarks/bench_backends.py [--labels 50]
+
+The lp backend runs against a fake `lp` script that reads the document
+from stdin, and the brother_ql backend sends raster instructions to a
+local fake TCP printer that records every byte it receives. Both numbers
+therefore measure our side of the pipeline only: conversion, process
+spawn or socket connect, and transfer. Requires brother_ql.
+"""
+import argparse
+import os
+import socketserver
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from functions import render_label  # noqa: E402
+from printer_manager.backends import (  # noqa: E402
+    BROTHER_QL_AVAILABLE,
+    BrotherQLBackend,
+    LpBackend,
+)
+
+FAKE_LP = """#!/bin/sh
+cat > /dev/null
+echo "request id is fake-1"
+"""
+
+
+class FakePrinter(socketserver.ThreadingTCPServer):
+    """TCP server on a free local port that stores each job it receives"""
+
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self):
+        self.jobs = []
+        super().__init__(("127.0.0.1", 0), FakePrinterHandler)
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+
+class FakePrinterHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        chunks = []
+        while True:
+            data = self.request.recv(65536)
+            if not data:
+                break
+            chunks.append(data)
+        self.server.jobs.append(b"".join(chunks))
+
+
+def time_backend(backend, image, labels):
+    timings = []
+    payloads = []
+    for _ in range(labels):
+        start = time.perf_counter()
+        payload = backend.prepare(image)
+        if not backend.send(payload):
+            raise RuntimeError(f"{backend.name} backend failed to print")
+        timings.append(time.perf_counter() - start)
+        payloads.append(payload)
+    return timings, payloads
+
+
+def report(name, timings):
+    timings = sorted(t * 1000 for t in timings)
+    p50 = statistics.median(timings)
+    p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+    print(f"{name:<12}{p50:>10.2f} ms{p99:>10.2f} ms")
+    return p50
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--labels", type=int, default=50, help="labels per backend")
+    args = parser.parse_args()
+
+    if not BROTHER_QL_AVAILABLE:
+        sys.exit("brother_ql is not installed")
+
+    image = render_label("Ada", "Lovelace")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        lp_path = os.path.join(tmp, "lp")
+        with open(lp_path, "w") as f:
+            f.write(FAKE_LP)
+        os.chmod(lp_path, 0o755)
+        os.environ["PATH"] = tmp + os.pathsep + os.environ["PATH"]
+
+        printer = FakePrinter()
+        threading.Thread(target=printer.serve_forever, daemon=True).start()
+
+        lp_timings, _ = time_backend(LpBackend("fake"), image, args.labels)
+        ql_backend = BrotherQLBackend(f"tcp://127.0.0.1:{printer.port}")
+        ql_timings, payloads = time_backend(ql_backend, image, args.labels)
+
+        # Give the server a moment to finish reading the last job
+        deadline = time.time() + 2
+        while len(printer.jobs) < args.labels and time.time() < deadline:
+            time.sleep(0.01)
+        printer.shutdown()
+
+        assert printer.jobs == payloads, "fake printer did not receive the raster data intact"
+
+        print(f"{'backend':<12}{'p50':>13}{'p99':>13}")
+        lp_p50 = report("lp", lp_timings)
+        ql_p50 = report("brother_ql", ql_timings)
+        print(f"\nbrother_ql is {lp_p50 / ql_p50:.1f}x faster per label (p50); "
+              f"{len(printer.jobs)} jobs received intact, {len(payloads[0])} bytes each")
+
+
+if __name__ == "__main__":
+    main()
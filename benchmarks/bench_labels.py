@@ -0,0 +1,61 @@
+"""
+Benchmark label rendering throughput with and without the font cache.
+
+Usage:
+    python benchmarks/bench_labels.py [--labels 200]
+
+"uncached" clears the font and text measurement caches before every
+label, which is what create_simple_label did before the cache existed
+(re-reading and re-parsing the TTF for each label).
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import functions  # noqa: E402
+
+NAMES = [
+    ("Ada", "Lovelace"),
+    ("Grace", "Hopper"),
+    ("Jürgen", "Müller"),
+    ("Alan", "Turing"),
+    ("Zoë", "Ólafsdóttir"),
+]
+
+
+def run(layout, labels, cached):
+    functions.clear_text_caches()
+    start = time.perf_counter()
+    for i in range(labels):
+        if not cached:
+            functions.clear_text_caches()
+        first, last = NAMES[i % len(NAMES)]
+        functions.create_simple_label(first, last, layout=layout)
+    return labels / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--labels", type=int, default=200, help="labels per run")
+    args = parser.parse_args()
+
+    # Render into a scratch directory so the label archive is left alone
+    with tempfile.TemporaryDirectory() as tmp:
+        os.symlink(os.path.join(ROOT, "font"), os.path.join(tmp, "font"))
+        os.chdir(tmp)
+
+        print(f"{'layout':<14}{'uncached':>14}{'cached':>14}{'speedup':>10}")
+        for layout in ("side_by_side", "stacked"):
+            before = run(layout, args.labels, cached=False)
+            after = run(layout, args.labels, cached=True)
+            print(f"{layout:<14}{before:>10.1f} l/s{after:>10.1f} l/s{after / before:>9.2f}x")
+        functions.label_archive.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,358 @@
+"""
+Stage-by-stage benchmark of the render-and-print path, with a regression check.
+
+Usage:
+    python benchmarks/bench_suite.py [--samples 30] [--rounds 3] [--output results.json]
+        [--baseline benchmarks/baseline.json] [--threshold 0.25]
+        [--min-delta-ms 0.25] [--retries 3] [--update-baseline] [--advisory]
+
+Every stage is timed on its own: font loading, text measurement,
+auto-fit, drawing, PNG encoding and raster conversion for both layouts,
+a range of label sizes and short to long names, plus sending to a fake
+`lp` and to a fake network printer, the /print-simple request itself and
+a label's whole trip from request to printer.
+
+Results (p50/p99/mean latency and throughput per stage) are printed and
+written as JSON. Each stage is timed in `--rounds` rounds. A check keeps
+the round with the lowest p50, since noise only ever makes a stage
+slower; a baseline keeps the median round, so a lucky round doesn't set
+a bar later runs can't reach. The calibration always keeps its median
+round.
+
+The run fails (exit status 1) when a stage's p50 is more than
+`--threshold` and `--min-delta-ms` slower than in the baseline
+(benchmarks/baseline.json), even after being re-measured `--retries`
+times; --advisory only reports it. Timings are compared relative to a
+fixed calibration workload, which absorbs the machine being uniformly
+faster or slower than when the baseline was taken, but baselines are
+still best regenerated (--update-baseline) on the machine that runs the
+check.
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import PIL  # noqa: E402
+
+import functions  # noqa: E402
+from bench_backends import FAKE_LP, FakePrinter  # noqa: E402
+from printer_manager.backends import BROTHER_QL_AVAILABLE, BrotherQLBackend, LpBackend  # noqa: E402
+
+LAYOUTS = ("side_by_side", "stacked")
+
+# Label sizes: native 62 mm head width, the default, and a tall label
+SIZES = ((696, 271), (731, 300), (731, 500))
+
+NAMES = {
+    "short": ("Al", "Li"),
+    "medium": ("Ada", "Lovelace"),
+    "long": ("Maximilian-Alexander", "Schwarzenberg-Ólafsdóttir"),
+}
+
+DEFAULT_BASELINE = os.path.join(ROOT, "benchmarks", "baseline.json")
+
+
+def measure(fn, samples, setup=None, warmup=2):
+    """Time `fn` `samples` times; `setup` runs untimed before each call"""
+    for _ in range(warmup):
+        if setup:
+            setup()
+        fn()
+    timings = []
+    for _ in range(samples):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return summarize(timings)
+
+
+def measure_rounds(fn, samples, setup=None, rounds=1, typical=False):
+    """Time `fn` in `rounds` rounds; keep the round with the lowest p50, or the median one if `typical`"""
+    results = sorted((measure(fn, samples, setup) for _ in range(rounds)), key=lambda r: r["p50_ms"])
+    return results[len(results) // 2] if typical else results[0]
+
+
+def summarize(timings):
+    ordered = sorted(t * 1000 for t in timings)
+    mean = statistics.mean(ordered)
+    return {
+        "n": len(ordered),
+        "p50_ms": statistics.median(ordered),
+        "p99_ms": ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))],
+        "mean_ms": mean,
+        "per_second": 1000 / mean if mean else None,
+    }
+
+
+def calibrate():
+    """
+    Fixed workload timed with every run. Comparisons are made relative to
+    it, so a machine that is uniformly slower (a busy CI host, a CPU
+    running at a lower clock) doesn't show up as a regression. It takes
+    about as long as a stage: a longer workload is hit by CPU throttling
+    far more often than the stages are, and then misjudges the machine.
+    """
+    from PIL import Image, ImageDraw
+
+    image = Image.new("RGB", (240, 100), "white")
+    draw = ImageDraw.Draw(image)
+    for i in range(0, 240, 6):
+        draw.line((i, 0, 240 - i, 100), fill="black", width=3)
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG", compress_level=1)
+    return sum(i * i for i in range(2000))
+
+
+def render_stages():
+    """Rendering stages for every layout, label size and name length"""
+    stages = {}
+    ql_backend = BrotherQLBackend("tcp://127.0.0.1:9", timeout=1) if BROTHER_QL_AVAILABLE else None
+
+    # Loading the font doesn't depend on the name
+    stages["font_load"] = (lambda: functions.get_font(functions.FONT_PATH, 120), functions.clear_text_caches)
+
+    for length, (first, last) in NAMES.items():
+        text = f"{first} {last}"
+        stages[f"measure/{length}"] = (
+            lambda text=text: functions.text_bbox(text, functions.FONT_PATH, 120),
+            functions.text_bbox.cache_clear,
+        )
+
+        for width, height in SIZES:
+            size = f"{width}x{height}"
+            stages[f"auto_fit/{size}/{length}"] = (
+                lambda first=first, last=last, width=width, height=height:
+                    functions.auto_fit(first, last, width=width, height=height),
+                functions.estimate_text_bbox.cache_clear,
+            )
+            for layout in LAYOUTS:
+                _, font_size = functions.auto_fit(first, last, width=width, height=height, layout=layout)
+                options = dict(layout=layout, font_size=font_size, width=width, height=height)
+                image = functions.render_label(first, last, **options)
+                key = f"{layout}/{size}/{length}"
+                stages[f"draw/{key}"] = (
+                    lambda first=first, last=last, options=options:
+                        functions.render_label(first, last, **options),
+                    None,
+                )
+                stages[f"encode_png/{key}"] = (lambda image=image: functions.encode_label(image), None)
+                if ql_backend:
+                    stages[f"raster/{key}"] = (lambda image=image: ql_backend.prepare(image), None)
+    return stages
+
+
+def send_stages(printer):
+    """Delivery to the fake lp and the fake network printer"""
+    image = functions.render_label("Ada", "Lovelace", font_size=150)
+    lp = LpBackend("fake")
+    payload = lp.prepare(image)
+    stages = {"send_lp": (lambda: lp.send(payload), None)}
+    if BROTHER_QL_AVAILABLE:
+        ql = BrotherQLBackend(f"tcp://127.0.0.1:{printer.port}")
+        raster = ql.prepare(image)
+        stages["send_tcp"] = (lambda: ql.send(raster), None)
+    return stages
+
+
+def request_stages(routes, printer):
+    """The /print-simple request path and a label's trip from request to printer"""
+    if BROTHER_QL_AVAILABLE:
+        routes.printer_pool.add("network", f"127.0.0.1:{printer.port}", "QL-820NWB")
+    else:
+        routes.printer_pool.add("system", "fake", "QL-820NWB")
+    client = routes.app.test_client()
+    finished = {}
+    counter = iter(range(10 ** 9))
+
+    def on_change(job):
+        if job.finished and job.id in finished:
+            finished[job.id].set()
+
+    routes.print_queue.on_change(on_change)
+
+    def post():
+        return client.post("/print-simple", json={
+            "first_name": "Ada",
+            "last_name": f"Lovelace {next(counter)}",
+            "layout": "auto",
+            "font_size": "auto",
+        })
+
+    def drain():
+        # Time each request against an empty queue
+        while routes.print_queue.pending():
+            time.sleep(0.001)
+
+    def print_one():
+        done = threading.Event()
+        job_id = post().get_json()["job_id"]
+        finished[job_id] = done
+        if not routes.print_queue.get(job_id).finished:
+            done.wait(10)
+
+    return {"request": (post, drain), "end_to_end": (print_one, None)}
+
+
+def compare(results, baseline, threshold, min_delta_ms):
+    """
+    Stages whose p50 regressed past the threshold.
+
+    Baseline timings are first scaled by how much slower or faster the
+    calibration workload ran this time, or right next to the stage if it
+    was re-measured (`calibration_ms`).
+
+    Returns:
+        list: (stage, expected p50, measured p50) per regressed stage
+    """
+    old_results = baseline.get("results", {})
+    regressions = []
+    for stage, old in old_results.items():
+        new = results.get(stage)
+        if new is None or stage == "calibration":
+            continue
+        expected = old["p50_ms"] * _scale(results, new, old_results)
+        if new["p50_ms"] - expected > min_delta_ms and new["p50_ms"] > expected * (1 + threshold):
+            regressions.append((stage, expected, new["p50_ms"]))
+    return regressions
+
+
+def _scale(results, new, old_results):
+    if "calibration" not in old_results or "calibration" not in results:
+        return 1.0
+    return new.get("calibration_ms", results["calibration"]["p50_ms"]) / old_results["calibration"]["p50_ms"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--samples", type=int, default=30, help="timed runs per stage and round")
+    parser.add_argument("--rounds", type=int, default=3,
+                        help="rounds per stage (default: 3)")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="allowed p50 slowdown per stage, as a fraction (default: 0.25)")
+    parser.add_argument("--min-delta-ms", type=float, default=0.25,
+                        help="ignore slowdowns smaller than this, which are noise (default: 0.25)")
+    parser.add_argument("--retries", type=int, default=3,
+                        help="times to re-measure a stage that looks slower before failing")
+    parser.add_argument("--update-baseline", action="store_true",
+                        help="store this run as the new baseline instead of comparing")
+    parser.add_argument("--advisory", action="store_true",
+                        help="report regressions without failing the run")
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output) if args.output else None
+    baseline_path = os.path.abspath(args.baseline)
+
+    # Run in a scratch directory so printer state, the job journal and
+    # archived labels don't touch the checkout
+    with tempfile.TemporaryDirectory() as tmp:
+        os.symlink(os.path.join(ROOT, "font"), os.path.join(tmp, "font"))
+        lp_path = os.path.join(tmp, "lp")
+        with open(lp_path, "w") as f:
+            f.write(FAKE_LP)
+        os.chmod(lp_path, 0o755)
+        os.environ["PATH"] = tmp + os.pathsep + os.environ["PATH"]
+        os.chdir(tmp)
+
+        printer = FakePrinter()
+        threading.Thread(target=printer.serve_forever, daemon=True).start()
+        # Keep the server's log output out of the report
+        os.environ.setdefault("LOG_LEVEL", "WARNING")
+        import routes
+
+        stages = {"calibration": (calibrate, None)}
+        stages.update(render_stages())
+        stages.update(send_stages(printer))
+        stages.update(request_stages(routes, printer))
+        try:
+            results = {
+                name: measure_rounds(fn, args.samples, setup, args.rounds,
+                                     typical=args.update_baseline or name == "calibration")
+                for name, (fn, setup) in stages.items()
+            }
+
+            baseline = None
+            if not args.update_baseline and os.path.exists(baseline_path):
+                with open(baseline_path) as f:
+                    baseline = json.load(f)
+                # Re-measure suspected regressions so a noisy moment on a
+                # shared machine doesn't fail the run. The calibration is
+                # timed again right before each one, since the machine's
+                # speed drifts over a run; keep the better relative p50
+                old_results = baseline.get("results", {})
+                for _ in range(args.retries):
+                    for stage, _, _ in compare(results, baseline, args.threshold, args.min_delta_ms):
+                        fn, setup = stages[stage]
+                        calibration = measure_rounds(calibrate, args.samples, rounds=args.rounds, typical=True)
+                        retry = measure_rounds(fn, args.samples, setup, args.rounds)
+                        retry["calibration_ms"] = calibration["p50_ms"]
+                        if (retry["p50_ms"] / _scale(results, retry, old_results)
+                                < results[stage]["p50_ms"] / _scale(results, results[stage], old_results)):
+                            results[stage] = retry
+        finally:
+            routes.shutdown(timeout=10)
+            printer.shutdown()
+
+    report = {
+        "meta": {
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "pillow": PIL.__version__,
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "samples": args.samples,
+            "rounds": args.rounds,
+            "brother_ql": BROTHER_QL_AVAILABLE,
+        },
+        "results": results,
+    }
+
+    print(f"{'stage':<48}{'p50':>10}{'p99':>10}{'per s':>10}")
+    for stage, r in results.items():
+        print(f"{stage:<48}{r['p50_ms']:>8.2f}ms{r['p99_ms']:>8.2f}ms{r['per_second']:>10.0f}")
+
+    if output:
+        with open(output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults written to {output}")
+
+    if args.update_baseline:
+        with open(baseline_path, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline written to {baseline_path}")
+        return
+
+    if baseline is None:
+        print("No baseline to compare against; create one with --update-baseline")
+        return
+    meta = baseline.get("meta", {})
+    if (meta.get("platform"), meta.get("cpus"), meta.get("python")) != (
+            report["meta"]["platform"], report["meta"]["cpus"], report["meta"]["python"]):
+        print(f"\nThe baseline was taken on {meta.get('platform')} ({meta.get('cpus')} CPUs, "
+              f"Python {meta.get('python')}); timings from another machine are only a rough guide")
+    regressions = compare(results, baseline, args.threshold, args.min_delta_ms)
+    if regressions:
+        print(f"\n{len(regressions)} stages regressed by more than {args.threshold:.0%}:")
+        for stage, old, new in regressions:
+            print(f"  {stage}: expected {old:.2f} ms, measured {new:.2f} ms")
+        if not args.advisory:
+            sys.exit(1)
+        return
+    print(f"\nNo stage regressed by more than {args.threshold:.0%} against the baseline")
+
+
+if __name__ == "__main__":
+    main()
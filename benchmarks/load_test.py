@@ -0,0 +1,146 @@
+"""
+Load-test a running server: latency of /print-simple and /api/printer/status
+under concurrent clients.
+
+Usage:
+    python benchmarks/load_test.py [--url http://localhost:5555]
+        [--clients 16] [--duration 10] [--endpoint print|status|both]
+
+Each client keeps one HTTP connection open and sends requests back to
+back for the given duration. /print-simple only queues the job, so its
+latency is the request path (validation, journaling, queueing) and not
+printing. To exercise the whole pipeline without a printer, run the
+server with a fake `lp` on the PATH and connect a "system" printer, e.g.:
+
+    mkdir -p /tmp/fakebin && printf '#!/bin/sh\\ncat >/dev/null\\n' > /tmp/fakebin/lp
+    chmod +x /tmp/fakebin/lp
+    PATH=/tmp/fakebin:$PATH gunicorn -c gunicorn.conf.py wsgi:app
+    curl -X POST localhost:5555/api/printer/connect \\
+         -H 'Content-Type: application/json' -d '{"method": "system", "address": "fake"}'
+"""
+import argparse
+import http.client
+import json
+import statistics
+import threading
+import time
+from collections import Counter
+from urllib.parse import urlparse
+
+FIRST_NAMES = ["Ada", "Grace", "Alan", "Barbara", "Edsger", "Katherine", "Linus", "Margaret"]
+LAST_NAMES = ["Lovelace", "Hopper", "Turing", "Liskov", "Dijkstra", "Johnson", "Torvalds", "Hamilton"]
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class Client(threading.Thread):
+    """Sends requests over one keep-alive connection until the deadline"""
+
+    def __init__(self, url, endpoint, deadline, index):
+        super().__init__(daemon=True)
+        self.url = url
+        self.endpoint = endpoint
+        self.deadline = deadline
+        self.index = index
+        self.latencies = []
+        self.statuses = Counter()
+        self.errors = Counter()
+
+    def request(self, conn, n):
+        if self.endpoint == "status":
+            conn.request("GET", "/api/printer/status")
+        else:
+            body = json.dumps({
+                "first_name": FIRST_NAMES[n % len(FIRST_NAMES)],
+                "last_name": f"{LAST_NAMES[self.index % len(LAST_NAMES)]}{n}",
+                "layout": "auto",
+                "font_size": "auto",
+            })
+            conn.request("POST", "/print-simple", body=body,
+                         headers={"Content-Type": "application/json"})
+        response = conn.getresponse()
+        response.read()
+        return response.status
+
+    def run(self):
+        conn = http.client.HTTPConnection(self.url.hostname, self.url.port or 80, timeout=30)
+        n = 0
+        while time.monotonic() < self.deadline:
+            start = time.perf_counter()
+            try:
+                status = self.request(conn, n)
+            except (OSError, http.client.HTTPException) as e:
+                self.errors[type(e).__name__] += 1
+                conn.close()
+                conn = http.client.HTTPConnection(self.url.hostname, self.url.port or 80, timeout=30)
+                continue
+            self.latencies.append(time.perf_counter() - start)
+            self.statuses[status] += 1
+            n += 1
+        conn.close()
+
+
+def run(url, endpoint, clients, duration):
+    deadline = time.monotonic() + duration
+    workers = [Client(url, endpoint, deadline, i) for i in range(clients)]
+    start = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - start
+
+    latencies = [l for w in workers for l in w.latencies]
+    statuses = sum((w.statuses for w in workers), Counter())
+    errors = sum((w.errors for w in workers), Counter())
+    result = {
+        "endpoint": endpoint,
+        "clients": clients,
+        "requests": len(latencies),
+        "requests_per_second": len(latencies) / elapsed,
+        "statuses": dict(statuses),
+        "errors": dict(errors),
+    }
+    if latencies:
+        result.update({
+            "p50_ms": percentile(latencies, 0.50) * 1000,
+            "p90_ms": percentile(latencies, 0.90) * 1000,
+            "p99_ms": percentile(latencies, 0.99) * 1000,
+            "max_ms": max(latencies) * 1000,
+            "mean_ms": statistics.mean(latencies) * 1000,
+        })
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--url", default="http://localhost:5555")
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10, help="seconds per endpoint")
+    parser.add_argument("--endpoint", choices=("print", "status", "both"), default="both")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    url = urlparse(args.url)
+    endpoints = ("status", "print") if args.endpoint == "both" else (args.endpoint,)
+    results = [run(url, endpoint, args.clients, args.duration) for endpoint in endpoints]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for r in results:
+        path = "/api/printer/status" if r["endpoint"] == "status" else "/print-simple"
+        print(f"{path} with {r['clients']} clients: {r['requests']} requests, "
+              f"{r['requests_per_second']:.0f} req/s")
+        if r["requests"]:
+            print(f"  p50 {r['p50_ms']:.2f} ms  p90 {r['p90_ms']:.2f} ms  "
+                  f"p99 {r['p99_ms']:.2f} ms  max {r['max_ms']:.2f} ms")
+        print(f"  statuses {r['statuses']}" + (f"  errors {r['errors']}" if r["errors"] else ""))
+
+
+if __name__ == "__main__":
+    main()
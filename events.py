@@ -0,0 +1,102 @@
+# events.py
+import json
+import queue
+import threading
+
+
+class EventBus:
+    """
+    Fan-out of server events to Server-Sent Events subscribers.
+
+    Each subscriber gets its own bounded queue. A subscriber that falls too
+    far behind is dropped; browsers' EventSource reconnects on its own and
+    receives a fresh snapshot.
+    """
+
+    def __init__(self, max_backlog=100, keepalive=15):
+        self.max_backlog = max_backlog
+        self.keepalive = keepalive
+        self._subscribers = set()
+        self._last = {}
+        self._closed = False
+        self._lock = threading.Lock()
+
+    def publish(self, event, data, key=None):
+        """
+        Send an event to all subscribers.
+
+        Args:
+            event (str): Event name, e.g. "printer" or "job"
+            data (dict): JSON-serialisable payload
+            key (str, optional): If given, an event identical to the last
+                one published with the same key is suppressed
+        """
+        payload = json.dumps(data, sort_keys=True)
+        with self._lock:
+            if key is not None:
+                if self._last.get(key) == payload:
+                    return
+                self._last[key] = payload
+            subscribers = list(self._subscribers)
+
+        message = f"event: {event}\ndata: {payload}\n\n"
+        for q in subscribers:
+            try:
+                q.put_nowait(message)
+            except queue.Full:
+                self._drop(q)
+
+    def stream(self, initial=()):
+        """
+        Generator yielding SSE-formatted messages for one client.
+
+        Args:
+            initial (iterable): (event, data) pairs sent first as a snapshot
+        """
+        q = queue.Queue(maxsize=self.max_backlog)
+        with self._lock:
+            if self._closed:
+                return
+            self._subscribers.add(q)
+        try:
+            for event, data in initial:
+                yield f"event: {event}\ndata: {json.dumps(data, sort_keys=True)}\n\n"
+            while True:
+                try:
+                    message = q.get(timeout=self.keepalive)
+                except queue.Empty:
+                    # Comment line keeps proxies from closing an idle connection
+                    yield ": keepalive\n\n"
+                    continue
+                if message is None:
+                    return
+                yield message
+        finally:
+            self._drop(q)
+
+    def close(self):
+        """End every stream, e.g. so a server can shut down gracefully"""
+        with self._lock:
+            self._closed = True
+            subscribers = list(self._subscribers)
+        for q in subscribers:
+            self._drop(q)
+
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+    def _drop(self, q):
+        with self._lock:
+            if q not in self._subscribers:
+                return
+            self._subscribers.discard(q)
+        # Wake the stream so it can finish; make room if the queue is full
+        try:
+            q.put_nowait(None)
+        except queue.Full:
+            try:
+                q.get_nowait()
+            except queue.Empty:
+                pass
+            q.put_nowait(None)
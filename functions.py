@@ -1,15 +1,248 @@
 from PIL import Image, ImageDraw, ImageFont
-import re
-import subprocess
+from functools import lru_cache
+import hashlib
+import io
 import os
-import json
+import logging
+from label_archive import LabelArchive
+from metrics import span
+from printer_manager.backends import LpBackend
+from printer_manager.profiles import OptionProfiles
+from state_store import StateStore
+
+logger = logging.getLogger(__name__)
 
-# Create necessary directories
-os.makedirs("img", exist_ok=True)
 printer_state_file = "printer_state.json"
 
+# Printer state shared by all server processes; the JSON file is only
+# read once to migrate state saved by older versions
+printer_state_store = StateStore(
+    os.environ.get("PRINTER_STATE_DB", "printer_state.db"),
+    legacy_path=printer_state_file,
+)
+
+# The lp options each printer accepted, tried first on its next label
+lp_profiles = OptionProfiles(printer_state_store)
+
+# Archived copies of rendered labels, deduplicated and bounded in size and age
+label_archive = LabelArchive(
+    os.environ.get("LABEL_ARCHIVE", "label_archive.db"),
+    max_bytes=int(os.environ.get("LABEL_ARCHIVE_MB", 512)) * 1024 * 1024,
+    retention_days=float(os.environ.get("LABEL_ARCHIVE_DAYS", 30)),
+    default_event=os.environ.get("LABEL_EVENT", "default"),
+)
+
+# Keep a copy of every printed label in the label archive (off by default)
+ARCHIVE_LABELS = os.environ.get("ARCHIVE_LABELS", "0") == "1"
+
+# Font used for all labels
+FONT_PATH = "./font/Dia-Black.ttf"
+
+# Glyph metrics are measured once at this size and scaled linearly
+METRICS_REFERENCE_SIZE = 1000
+
+# Auto-fit limits: smallest font size and blank space kept around the text
+MIN_FONT_SIZE = 8
+AUTO_FIT_MARGIN = 8
+
+# Below this size auto-fit checks its estimate with an exact measurement
+EXACT_FIT_BELOW = 32
+
+# Printable width in dots of 62 mm endless labels on the QL-800 series;
+# 1-bit labels are drawn at this width so nothing is resampled later
+NATIVE_WIDTH = int(os.environ.get("LABEL_NATIVE_WIDTH", 696))
+
+# How a label becomes the printer's black and white dots:
+#   "threshold" - 1 bit per pixel, pixels darker than LABEL_THRESHOLD are printed
+#   "dither"    - 1 bit per pixel, Floyd-Steinberg dithering for logos and photos
+#   "rgb"       - full color at the requested size, left to the printer driver
+COLOR_MODES = ("threshold", "dither", "rgb")
+DEFAULT_COLOR_MODE = os.environ.get("LABEL_COLOR_MODE", "threshold")
+THRESHOLD = int(os.environ.get("LABEL_THRESHOLD", 128))
+_THRESHOLD_TABLE = [255 if value >= THRESHOLD else 0 for value in range(256)]
+
+# Width in pixels of the grayscale previews served by /api/preview
+PREVIEW_WIDTH = int(os.environ.get("LABEL_PREVIEW_WIDTH", 366))
+
+
+@lru_cache(maxsize=int(os.environ.get("FONT_CACHE_SIZE", 64)))
+def get_font(path, size):
+    """
+    Load a TrueType font, reusing already parsed fonts.
+
+    Fonts are kept in a process-wide LRU cache keyed by (path, size), so
+    the TTF file is only read and parsed once per size.
+    """
+    # Only reached on a cache miss
+    with span("font_load"):
+        return ImageFont.truetype(font=path, size=size)
+
+
+@lru_cache(maxsize=None)
+def font_file_hash(path):
+    """SHA-256 of a font file, so cached labels are invalidated when the font changes"""
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+@lru_cache(maxsize=int(os.environ.get("TEXT_BBOX_CACHE_SIZE", 4096)))
+def text_bbox(text, path, size):
+    """
+    Return the bounding box (left, top, right, bottom) of `text`.
+
+    Measurements are memoized per (text, path, size) because the same
+    names and sizes are measured again on reprints and previews.
+    """
+    return get_font(path, size).getbbox(text)
+
+
+def measure_text(text, path, size):
+    """Return the (width, height) of the bounding box of `text`"""
+    bbox = text_bbox(text, path, size)
+    return bbox[2] - bbox[0], bbox[3] - bbox[1]
+
+
+@lru_cache(maxsize=8192)
+def glyph_metrics(char, path):
+    """
+    Advance and ink box of a single character at METRICS_REFERENCE_SIZE.
+
+    Returns:
+        tuple: (advance, ink) where ink is (left, top, right, bottom), or
+            None for characters that draw nothing, such as spaces
+    """
+    font = get_font(path, METRICS_REFERENCE_SIZE)
+    left, top, right, bottom = font.getbbox(char)
+    ink = (left, top, right, bottom) if right > left and bottom > top else None
+    return font.getlength(char), ink
+
+
+@lru_cache(maxsize=int(os.environ.get("TEXT_BBOX_CACHE_SIZE", 4096)))
+def estimate_text_bbox(text, path):
+    """
+    Bounding box of `text` at METRICS_REFERENCE_SIZE, built from cached glyph metrics.
+
+    Glyph metrics scale linearly with the font size, so this gives the
+    bounding box at any size without laying the text out again.
+    """
+    x = 0
+    left = top = float("inf")
+    right = bottom = float("-inf")
+    for char in text:
+        advance, ink = glyph_metrics(char, path)
+        if ink:
+            left = min(left, x + ink[0])
+            top = min(top, ink[1])
+            right = max(right, x + ink[2])
+            bottom = max(bottom, ink[3])
+        x += advance
+    if left == float("inf"):
+        return (0, 0, 0, 0)
+    return (left, top, right, bottom)
+
+
+def clear_text_caches():
+    """
+    Drop the parsed fonts and every cached text measurement, e.g. to time
+    rendering from a cold start. Benchmarks use this instead of clearing
+    the individual caches, so they keep working when the caching changes.
+    """
+    get_font.cache_clear()
+    text_bbox.cache_clear()
+    glyph_metrics.cache_clear()
+    estimate_text_bbox.cache_clear()
+
+
+def _estimated_bbox(text, path, size):
+    # Scaled up slightly so hinting at small sizes can't push the text over
+    scale = size / METRICS_REFERENCE_SIZE * 1.01
+    return tuple(v * scale for v in estimate_text_bbox(text, path))
+
+
+def label_fits(first_name, last_name, layout, font_size, width, height,
+               margin=0, bbox=text_bbox):
+    """
+    Check whether the text stays inside the label when drawn by render_label.
+    
+    Args:
+        layout (str): Either "side_by_side" or "stacked"
+        margin (int): Blank space to keep along every edge
+        bbox (callable): Measures (text, path, size); the exact text_bbox
+            or the cheaper _estimated_bbox
+    
+    Returns:
+        bool: True if every line's ink is within the margins
+    """
+    if layout == "side_by_side":
+        lines = [(f"{first_name} {last_name}", font_size)]
+    else:
+        lines = [(first_name, font_size), (last_name, int(font_size * 0.8))]
+    boxes = [bbox(text, FONT_PATH, size) for text, size in lines]
+    
+    # Mirror the positioning in render_label
+    heights = [b[3] - b[1] for b in boxes]
+    spacing = font_size // 10
+    y = (height - (sum(heights) + spacing * (len(boxes) - 1))) // 2
+    for box, line_height in zip(boxes, heights):
+        x = (width - (box[2] - box[0])) // 2
+        if x + box[0] < margin or x + box[2] > width - margin:
+            return False
+        if y + box[1] < margin or y + box[3] > height - margin:
+            return False
+        y += line_height + spacing
+    return True
+
+
+def auto_fit(first_name, last_name, width=731, height=300, layout="auto",
+             max_font_size=None, margin=AUTO_FIT_MARGIN):
+    """
+    Find the largest font size (and optionally the layout) that fits the label.
+    
+    Binary-searches the font size using estimates from cached glyph
+    metrics. Only small results, where hinting makes the estimate less
+    reliable, are confirmed with an exact measurement.
+    
+    Args:
+        first_name (str): First name
+        last_name (str): Last name
+        width (int): Label width in pixels
+        height (int): Label height in pixels
+        layout (str): "side_by_side", "stacked", or "auto" to pick
+            whichever allows the larger font
+        max_font_size (int, optional): Upper bound for the font size
+        margin (int): Blank space to keep along every edge
+    
+    Returns:
+        tuple: (layout, font_size)
+    """
+    layouts = ("side_by_side", "stacked") if layout == "auto" else (layout,)
+    upper = max_font_size or height * 2
+    
+    best = None
+    for candidate in layouts:
+        low, high = MIN_FONT_SIZE, upper
+        while low < high:
+            size = (low + high + 1) // 2
+            if label_fits(first_name, last_name, candidate, size, width, height,
+                          margin, bbox=_estimated_bbox):
+                low = size
+            else:
+                high = size - 1
+        
+        # At small sizes hinting can round every glyph up, so confirm the
+        # estimate exactly and step down in the rare case it was too optimistic
+        size = low
+        while (MIN_FONT_SIZE < size < EXACT_FIT_BELOW
+               and not label_fits(first_name, last_name, candidate, size, width, height, margin)):
+            size -= 1
+        
+        if best is None or size > best[1]:
+            best = (candidate, size)
+    
+    return best
+
 def load_printer_state():
-    """Load printer state from file or return default state"""
+    """Return the printer state from the state store, or the default state"""
     default_state = {
         "connected": False,
         "method": None,
@@ -20,18 +253,17 @@ def load_printer_state():
     }
     
     try:
-        if os.path.exists(printer_state_file):
-            with open(printer_state_file, 'r') as f:
-                return json.load(f)
+        # Served from memory unless another process changed the state
+        return printer_state_store.get("printer", default_state)
     except Exception as e:
-        print(f"Error loading printer state: {e}")
+        logger.warning("Error loading printer state: %s", e)
     
     return default_state
 
-def create_simple_label(first_name, last_name, layout="side_by_side", 
-                     font_size=300, width=731, height=300):
+def render_label(first_name, last_name, layout="side_by_side",
+                 font_size=300, width=731, height=300, color_mode=None):
     """
-    Create a label with fixed dimensions and font size.
+    Render a label in memory with fixed dimensions and font size.
     
     Args:
         first_name (str): First name
@@ -40,47 +272,131 @@ def create_simple_label(first_name, last_name, layout="side_by_side",
         font_size (int): Font size to use (exact size, no auto-scaling)
         width (int): Label width in pixels
         height (int): Label height in pixels
+        color_mode (str): One of COLOR_MODES (default: LABEL_COLOR_MODE).
+            The 1-bit modes draw the label scaled to NATIVE_WIDTH
         
     Returns:
-        str: Path to the created image
+        PIL.Image.Image: The rendered label, mode "1" or "RGB"
     """
-    # Create white background image with specified dimensions
-    image = Image.new("RGB", (width, height), "white")
+    color_mode = check_color_mode(color_mode)
+    if color_mode == "rgb":
+        image = Image.new("RGB", (width, height), "white")
+    else:
+        # Scale the layout rather than the pixels: drawing straight at the
+        # head width in grayscale is cheaper than resampling a finished label
+        width, height, scale = native_size(width, height)
+        font_size = max(1, int(font_size * scale))
+        image = Image.new("L", (width, height), "white")
     draw = ImageDraw.Draw(image)
+    draw_name(draw, first_name, last_name, layout, font_size, (0, 0, width, height))
+    return to_bitmap(image, color_mode)
+
+def check_color_mode(color_mode):
+    """Return the color mode to render with, rejecting unknown ones"""
+    color_mode = color_mode or DEFAULT_COLOR_MODE
+    if color_mode not in COLOR_MODES:
+        raise ValueError(f"Unknown color mode {color_mode!r}, expected one of {', '.join(COLOR_MODES)}")
+    return color_mode
+
+def native_size(width, height):
+    """
+    Scale a label size to the printer's head width.
+
+    Returns:
+        tuple: (width, height, scale)
+    """
+    return scaled_size(width, height, NATIVE_WIDTH)
+
+def scaled_size(width, height, target_width):
+    """
+    Scale a label size to `target_width`, keeping its aspect ratio.
+
+    Returns:
+        tuple: (width, height, scale)
+    """
+    scale = target_width / width
+    return target_width, max(1, round(height * scale)), scale
+
+def render_preview(first_name, last_name, layout="side_by_side",
+                   font_size=300, width=731, height=300, preview_width=None, color_mode=None):
+    """
+    Render a downscaled preview of a label in memory.
+
+    The layout is drawn straight at the preview size with the font scaled
+    to match, like the 1-bit labels at the printer's head width, so a
+    preview costs a fraction of a full render and shares its font and
+    text measurement caches.
+
+    Args:
+        preview_width (int): Width of the preview (default: LABEL_PREVIEW_WIDTH),
+            never more than the label's own width
+        color_mode (str): One of COLOR_MODES (default: LABEL_COLOR_MODE);
+            the 1-bit modes are applied so the preview looks like the print
+
+    Returns:
+        PIL.Image.Image: The preview, mode "1", or "L" for "rgb"
+    """
+    color_mode = check_color_mode(color_mode)
+    preview_width, preview_height, scale = scaled_size(width, height, min(preview_width or PREVIEW_WIDTH, width))
+    image = Image.new("L", (preview_width, preview_height), "white")
+    draw_name(ImageDraw.Draw(image), first_name, last_name, layout,
+              max(1, int(font_size * scale)), (0, 0, preview_width, preview_height))
+    return to_bitmap(image, color_mode)
+
+def to_bitmap(image, color_mode):
+    """
+    Convert a grayscale label to 1 bit per pixel.
+
+    Returns:
+        PIL.Image.Image: A mode "1" image, or `image` unchanged for "rgb"
+    """
+    if color_mode == "rgb":
+        return image
+    if color_mode == "dither":
+        return image.convert("1", dither=Image.Dither.FLOYDSTEINBERG)
+    return image.point(_THRESHOLD_TABLE, "1")
+
+def draw_name(draw, first_name, last_name, layout, font_size, box, fill="black"):
+    """
+    Draw the attendee's name centered in a box.
+    
+    Args:
+        draw (ImageDraw.ImageDraw): Where to draw
+        first_name (str): First name
+        last_name (str): Last name
+        layout (str): Either "side_by_side" or "stacked"
+        font_size (int): Font size to use (exact size, no auto-scaling)
+        box (tuple): (x, y, width, height) of the area to center the name in
+        fill: Text color
+    """
+    left, top, width, height = box
     
     # Load font with exact specified size
-    font = ImageFont.truetype(font='./font/Dia-Black.ttf', size=font_size)
+    font = get_font(FONT_PATH, font_size)
     
     if layout == "side_by_side":
         # Side by side layout - both names on same line
         text = f"{first_name} {last_name}"
         
         # Get text dimensions
-        bbox = draw.textbbox((0, 0), text, font=font)
-        text_width = bbox[2] - bbox[0]
-        text_height = bbox[3] - bbox[1]
+        text_width, text_height = measure_text(text, FONT_PATH, font_size)
         
         # Center text both horizontally and vertically
-        x = (width - text_width) // 2
-        y = (height - text_height) // 2
+        x = left + (width - text_width) // 2
+        y = top + (height - text_height) // 2
         
         # Draw the text
-        draw.text((x, y), text, fill="black", font=font)
+        draw.text((x, y), text, fill=fill, font=font)
         
     else:  # stacked layout
         # Calculate slightly smaller font for last name
         first_font = font
-        last_font = ImageFont.truetype(font='./font/Dia-Black.ttf', size=int(font_size * 0.8))
+        last_font_size = int(font_size * 0.8)
+        last_font = get_font(FONT_PATH, last_font_size)
         
         # Get text dimensions
-        first_bbox = draw.textbbox((0, 0), first_name, font=first_font)
-        last_bbox = draw.textbbox((0, 0), last_name, font=last_font)
-        
-        first_width = first_bbox[2] - first_bbox[0]
-        first_height = first_bbox[3] - first_bbox[1]
-        
-        last_width = last_bbox[2] - last_bbox[0]
-        last_height = last_bbox[3] - last_bbox[1]
+        first_width, first_height = measure_text(first_name, FONT_PATH, font_size)
+        last_width, last_height = measure_text(last_name, FONT_PATH, last_font_size)
         
         # Calculate vertical spacing between names
         spacing = font_size // 10
@@ -89,37 +405,79 @@ def create_simple_label(first_name, last_name, layout="side_by_side",
         total_height = first_height + spacing + last_height
         
         # Center content vertically
-        start_y = (height - total_height) // 2
+        start_y = top + (height - total_height) // 2
         
         # Center each name horizontally
-        first_x = (width - first_width) // 2
-        last_x = (width - last_width) // 2
+        first_x = left + (width - first_width) // 2
+        last_x = left + (width - last_width) // 2
         
         # Draw the text
-        draw.text((first_x, start_y), first_name, fill="black", font=first_font)
-        draw.text((last_x, start_y + first_height + spacing), last_name, fill="black", font=last_font)
+        draw.text((first_x, start_y), first_name, fill=fill, font=first_font)
+        draw.text((last_x, start_y + first_height + spacing), last_name, fill=fill, font=last_font)
+
+def encode_label(image, format="PNG"):
+    """Encode a rendered label into bytes that can be sent to the printer"""
+    buffer = io.BytesIO()
+    # Labels are printed once; fast compression beats a smaller file here
+    image.save(buffer, format=format, compress_level=1)
+    return buffer.getvalue()
+
+def archive_label(data, first_name, last_name, job_id=None, event=None):
+    """
+    Keep a copy of an encoded label in the label archive.
     
-    # Create a file path
-    path = re.sub(r'\s+', '', f"./img/{first_name}{last_name}.png")
+    The label is written in the background; identical labels are stored
+    once.
     
-    # Save the image
-    image.save(path)
-    print(f"Created label at {path} with dimensions {width}x{height}, font size {font_size}")
+    Returns:
+        str or None: SHA-256 of the label, None if it couldn't be queued
+    """
+    return label_archive.add(data, first_name, last_name, job_id=job_id, event=event)
+
+def create_simple_label(first_name, last_name, layout="side_by_side", 
+                     font_size=300, width=731, height=300, color_mode=None, archive=None):
+    """
+    Create a label with fixed dimensions and font size.
     
-    return path
+    Args:
+        first_name (str): First name
+        last_name (str): Last name
+        layout (str): Either "side_by_side" or "stacked"
+        font_size (int): Font size to use (exact size, no auto-scaling)
+        width (int): Label width in pixels
+        height (int): Label height in pixels
+        color_mode (str): One of COLOR_MODES (default: LABEL_COLOR_MODE)
+        archive (bool): Also keep the label in the label archive
+            (default: ARCHIVE_LABELS)
+        
+    Returns:
+        bytes: The encoded label (PNG), which print_name can print
+    """
+    image = render_label(first_name, last_name, layout=layout,
+                         font_size=font_size, width=width, height=height, color_mode=color_mode)
+    data = encode_label(image)
+    if ARCHIVE_LABELS if archive is None else archive:
+        digest = archive_label(data, first_name, last_name)
+        logger.debug("Archived label %s with dimensions %sx%s, font size %s", digest, width, height, font_size)
+    
+    return data
 
-def print_name(path, printer_address=None):
+def print_name(label, printer_address=None):
     """
     Print an image using the system printer.
     
     Args:
-        path (str): Path to the image file to print
+        label (str or bytes): Path to the image file to print, or the
+            encoded image itself, which is piped to `lp` through stdin
         printer_address (str, optional): Printer address to use.
             If None, will use the address from the stored printer state.
     
     Returns:
         bool: True if print was successful, False otherwise
     """
+    in_memory = isinstance(label, (bytes, bytearray))
+    description = f"<{len(label)} bytes>" if in_memory else label
+    
     try:
         # If no printer_address provided, get it from the saved state
         if printer_address is None:
@@ -127,34 +485,13 @@ def print_name(path, printer_address=None):
             printer_address = printer_state.get("address")
             
             if not printer_address or not printer_state.get("connected", False):
-                print(f"No printer connected. Image saved at: {path}")
+                logger.warning("No printer connected. Label not printed: %s", description)
                 return False
         
-        print(f"Printing image {path} to printer {printer_address}")
-        
-        # Simple printing command
-        cmd = ["lp", "-d", printer_address, path]
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=10)
-        
-        if result.returncode == 0:
-            print("Print successful.")
-            return True
-        else:
-            print(f"Print failed: {result.stderr}")
-            # Try alternative options if the basic command fails
-            alternative_cmds = [
-                ["lp", "-d", printer_address, "-o", "raw", path],  # Try with raw option
-                ["lp", "-d", printer_address, "-o", "media=Custom.62x100mm", path]  # Try with media size
-            ]
-            
-            for alt_cmd in alternative_cmds:
-                print(f"Trying alternative command: {' '.join(alt_cmd)}")
-                alt_result = subprocess.run(alt_cmd, capture_output=True, text=True, timeout=10)
-                if alt_result.returncode == 0:
-                    print("Print successful with alternative options.")
-                    return True
-            
-            return False
+        logger.debug("Printing image %s to printer %s", description, printer_address)
+        
+        # lp tries its alternative option sets if the basic command fails
+        return LpBackend(printer_address, profiles=lp_profiles).send(label)
     except Exception as e:
-        print(f"Exception during printing: {e}")
+        logger.error("Exception during printing: %s", e)
         return False
\ No newline at end of file
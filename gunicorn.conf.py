@@ -0,0 +1,56 @@
+# gunicorn.conf.py
+# Production server settings: gunicorn -c gunicorn.conf.py wsgi:app
+import os
+import signal
+import time
+
+bind = f"{os.environ.get('HOST', '0.0.0.0')}:{os.environ.get('PORT', 5555)}"
+
+# Each worker process has its own print queue, job list and batches, so
+# job and batch status requests must reach the worker that accepted the
+# job. One worker with many threads is the safe default; printer state
+# and the job journal are shared, so more workers can be used behind a
+# sticky load balancer.
+workers = int(os.environ.get("WEB_WORKERS", 1))
+
+# Threads per worker. Every open event stream (/api/events) holds one.
+worker_class = "gthread"
+threads = int(os.environ.get("WEB_THREADS", 32))
+
+timeout = int(os.environ.get("WEB_TIMEOUT", 30))
+keepalive = 5
+
+# Seconds a stopping worker gets to finish requests and drain the print queue
+graceful_timeout = int(os.environ.get("SHUTDOWN_TIMEOUT", 30))
+
+# The app starts background threads (print workers, health monitor) at
+# import time, and those don't survive a fork
+preload_app = False
+
+accesslog = os.environ.get("WEB_ACCESS_LOG")
+
+
+def post_worker_init(worker):
+    """Start the graceful shutdown as soon as the worker is told to stop"""
+    handle_exit = worker.handle_exit
+
+    def handle_term(sig, frame):
+        from routes import begin_shutdown
+
+        worker.shutdown_started = time.monotonic()
+        # Refuse new jobs and end event streams, which would otherwise
+        # keep the worker waiting until graceful_timeout
+        begin_shutdown()
+        handle_exit(sig, frame)
+
+    signal.signal(signal.SIGTERM, handle_term)
+
+
+def worker_exit(server, worker):
+    """Finish the queued print jobs before the worker process exits"""
+    from routes import shutdown
+
+    started = getattr(worker, "shutdown_started", time.monotonic())
+    # Leave a second before the arbiter kills the worker
+    remaining = graceful_timeout - (time.monotonic() - started) - 1
+    shutdown(timeout=max(0, remaining))
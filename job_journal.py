@@ -0,0 +1,407 @@
+# job_journal.py
+import json
+import logging
+import os
+import queue
+import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# fcntl is POSIX-only; on Windows the journal lock falls back to msvcrt
+try:
+    import fcntl
+    FCNTL_AVAILABLE = True
+except ImportError:
+    import msvcrt
+    FCNTL_AVAILABLE = False
+
+
+# How journal writes reach the disk:
+#   "always" - every record is fsynced before append() returns
+#   "batch"  - records are grouped for up to `flush_interval` seconds and
+#              fsynced together; a crash can lose the last interval
+#   "none"   - records are handed to the OS without fsync
+SYNC_MODES = ("always", "batch", "none")
+
+
+def attendee_key(first_name, last_name):
+    """Normalised name used to recognise an attendee across prints"""
+    name = f"{first_name or ''} {last_name or ''}"
+    return re.sub(r"\s+", " ", name).strip().casefold()
+
+
+class JobJournal:
+    """
+    Append-only JSON Lines journal of print jobs and their outcomes.
+
+    Every submitted job is journaled with its parameters and every
+    finished job with its outcome, so jobs that were queued or printing
+    when the server stopped can be replayed on the next start. The journal
+    also keeps an in-memory index of printed attendees, so checking
+    whether someone already has a label is a dict lookup.
+
+    Records are written by a background thread that groups concurrent
+    appends into a single write (and fsync, depending on `sync`). The
+    journal is compacted when it is opened, and by the writer whenever it
+    has grown past `compact_bytes` and to twice its size after the last
+    compaction: finished jobs are folded into one summary record per
+    printed attendee.
+
+    Several server processes can share a journal. Only the first one to
+    open it replays and compacts it; the others pick up records written
+    by their siblings when they look up an attendee. While running, a
+    process only compacts the journal when no other process has it open.
+    """
+
+    def __init__(self, path, sync="batch", flush_interval=0.05, max_batch=512, compact_bytes=16 * 1024 * 1024):
+        if sync not in SYNC_MODES:
+            raise ValueError(f"sync must be one of {', '.join(SYNC_MODES)}")
+        self.path = path
+        self.sync = sync
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.compact_bytes = compact_bytes
+        self._printed = {}
+        # Jobs printed by this process whose record hasn't been read back
+        # from the file yet, so they aren't counted twice
+        self._unread = set()
+        self._offset = 0
+        self._compacted_size = 0
+        self._owner = False
+        self._unfinished = []
+        self._pending = queue.Queue()
+        self._lock = threading.Lock()
+        # Serializes reading the file and replacing it, so no range is read twice
+        self._read_lock = threading.Lock()
+        self._writer = None
+        self._lock_file = None
+        self._open()
+
+    # --- Writing ---
+
+    def record(self, job):
+        """Journal a job's submission or outcome (use as a JobQueue callback)"""
+        if job.state == "queued":
+            self.append({"op": "queued", "id": job.id, "t": time.time(), "params": job.params})
+        elif job.state == "done":
+            self._record_printed(job.id, job.params, job.result.get("printer"))
+        elif job.state == "failed":
+            self.append({"op": "failed", "id": job.id, "t": time.time(), "error": job.error})
+
+    def record_printed(self, job_id, params, printer=None):
+        """Journal a label printed outside the job queue, e.g. by a batch"""
+        self._record_printed(job_id, params, printer)
+
+    def append(self, record):
+        """
+        Add a record to the journal.
+
+        With sync="always" this blocks until the record is on disk.
+        """
+        written = threading.Event() if self.sync == "always" else None
+        self._pending.put((json.dumps(record, ensure_ascii=False) + "\n", written))
+        self._start_writer()
+        if written is not None:
+            written.wait()
+
+    def close(self):
+        """Write out pending records, stop the writer thread and release the lock"""
+        with self._lock:
+            writer, self._writer = self._writer, None
+            lock_file, self._lock_file = self._lock_file, None
+        if writer is not None:
+            self._pending.put(None)
+            writer.join()
+        if lock_file is not None:
+            lock_file.close()
+
+    # --- Reading ---
+
+    def unfinished(self):
+        """
+        Jobs that were submitted but never finished, oldest first.
+
+        Only the process that replays the journal gets these; it returns
+        them once, so each job is replayed a single time.
+
+        Returns:
+            list: (job_id, params) pairs
+        """
+        with self._lock:
+            jobs, self._unfinished = self._unfinished, []
+        return jobs
+
+    def printed(self, first_name, last_name):
+        """
+        Look up whether an attendee's label has been printed.
+
+        Returns:
+            dict or None: `first_name`, `last_name`, `job_id` and
+                `printed_at` of the most recent print and the number of
+                times it was printed, or None
+        """
+        self._catch_up()
+        with self._lock:
+            entry = self._printed.get(attendee_key(first_name, last_name))
+            return dict(entry) if entry else None
+
+    def stats(self):
+        with self._lock:
+            return {
+                "path": self.path,
+                "sync": self.sync,
+                "printed_attendees": len(self._printed),
+                "pending_writes": self._pending.qsize(),
+            }
+
+    # --- Internals ---
+
+    def _record_printed(self, job_id, params, printer):
+        record = {
+            "op": "done",
+            "id": job_id,
+            "t": time.time(),
+            "first_name": params.get("first_name"),
+            "last_name": params.get("last_name"),
+            "printer": printer,
+        }
+        # Index right away; the writer may not have flushed the record yet
+        with self._lock:
+            _count(self._printed, record)
+            self._unread.add(job_id)
+        self.append(record)
+
+    def _apply(self, record, queued=None, finished=None):
+        """Update the index (and replay bookkeeping) with one record read from the file"""
+        op = record.get("op")
+        if op == "queued" and queued is not None:
+            queued[record["id"]] = record.get("params") or {}
+        elif op in ("done", "failed") and finished is not None:
+            finished.add(record["id"])
+
+        if op == "done" and record["id"] in self._unread:
+            # Printed here and already counted
+            self._unread.discard(record["id"])
+        else:
+            _count(self._printed, record)
+
+    def _open(self):
+        # Every process holds a shared lock while it uses the journal; only
+        # a process that can get it exclusively is alone and may replay it
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        self._lock_file = open(self.path + ".lock", "a")
+        self._owner = _try_lock_exclusive(self._lock_file)
+        if not self._owner:
+            _lock_shared(self._lock_file)
+
+        queued, finished = {}, set()
+        self._offset = self._read_from(0, queued, finished)
+        if self._owner:
+            self._unfinished = [(job_id, params) for job_id, params in queued.items()
+                                if job_id not in finished]
+            self._compact(self._printed, self._unfinished)
+            # Downgrade so other processes can open the journal
+            _lock_shared(self._lock_file)
+
+    def _read_from(self, offset, queued=None, finished=None):
+        """Apply the complete records after `offset`; returns the new offset"""
+        try:
+            with open(self.path, "rb") as f:
+                f.seek(offset)
+                data = f.read()
+        except FileNotFoundError:
+            return offset
+
+        # A record still being written (or cut off by a crash) has no newline yet
+        end = data.rfind(b"\n") + 1
+        with self._lock:
+            for line in data[:end].splitlines():
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    logger.warning("Skipping corrupt journal record: %r", line[:80])
+                    continue
+                self._apply(record, queued, finished)
+        return offset + end
+
+    def _catch_up(self):
+        """Pick up records appended by other processes"""
+        with self._read_lock:
+            try:
+                size = os.path.getsize(self.path)
+            except OSError:
+                return
+            if size > self._offset:
+                self._offset = self._read_from(self._offset)
+
+    def _compact(self, printed, unfinished):
+        """Rewrite the journal as printed summaries plus the unfinished jobs"""
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            for entry in printed.values():
+                f.write(json.dumps(dict(entry, op="printed"), ensure_ascii=False) + "\n")
+            for job_id, params in unfinished:
+                f.write(json.dumps({"op": "queued", "id": job_id, "params": params},
+                                   ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self._offset = self._compacted_size = os.path.getsize(self.path)
+
+    def _compact_if_large(self, fd):
+        """
+        Compact the journal if it has grown enough and no other process
+        has it open (run by the writer between writes).
+
+        Returns:
+            int: The file descriptor to append to from now on
+        """
+        size = os.fstat(fd).st_size
+        if size < max(self.compact_bytes, 2 * self._compacted_size):
+            return fd
+        # Only a process that is alone may replace the file: siblings would
+        # keep appending to the old one. msvcrt can't upgrade a lock, but
+        # there the owner holds its exclusive lock all along
+        if FCNTL_AVAILABLE and not _try_lock_exclusive(self._lock_file):
+            return fd
+        if not FCNTL_AVAILABLE and not self._owner:
+            return fd
+        try:
+            with self._read_lock:
+                self._offset = self._read_from(self._offset)
+                # Summarize the file rather than the index: the index already
+                # counts prints whose records are still waiting to be written
+                printed, queued, finished = _scan(self.path)
+                self._compact(printed, [(job_id, params) for job_id, params in queued.items()
+                                        if job_id not in finished])
+            logger.info("Compacted the job journal from %d to %d bytes", size, self._compacted_size)
+        except OSError as e:
+            logger.error("Error compacting job journal: %s", e)
+            return fd
+        finally:
+            _lock_shared(self._lock_file)
+        os.close(fd)
+        return os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+    def _start_writer(self):
+        with self._lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_loop, name="job-journal", daemon=True)
+                self._writer.start()
+
+    def _write_loop(self):
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            while True:
+                item = self._pending.get()
+                if item is None:
+                    return
+                batch = [item]
+                if self.sync == "batch":
+                    # Give concurrent jobs a moment to join this write
+                    deadline = time.monotonic() + self.flush_interval
+                    while len(batch) < self.max_batch:
+                        try:
+                            item = self._pending.get(timeout=max(0, deadline - time.monotonic()))
+                        except queue.Empty:
+                            break
+                        batch.append(item)
+                        if item is None:
+                            break
+                else:
+                    while len(batch) < self.max_batch:
+                        try:
+                            batch.append(self._pending.get_nowait())
+                        except queue.Empty:
+                            break
+
+                stop = batch[-1] is None
+                records = [b for b in batch if b is not None]
+                try:
+                    # One write per batch keeps records from different
+                    # processes from interleaving
+                    os.write(fd, "".join(line for line, _ in records).encode("utf-8"))
+                    if self.sync != "none":
+                        os.fsync(fd)
+                except OSError as e:
+                    logger.error("Error writing job journal: %s", e)
+                for _, written in records:
+                    if written is not None:
+                        written.set()
+                if stop:
+                    return
+                fd = self._compact_if_large(fd)
+        finally:
+            os.close(fd)
+
+
+def _count(printed, record):
+    """Fold a `printed` summary or `done` record into an index of printed attendees"""
+    op = record.get("op")
+    key = attendee_key(record.get("first_name"), record.get("last_name"))
+    if op == "printed":
+        # Summary of earlier prints written by compaction
+        printed[key] = {k: record[k] for k in ("first_name", "last_name", "job_id", "printed_at", "count")}
+    elif op == "done":
+        previous = printed.get(key)
+        printed[key] = {
+            "first_name": record.get("first_name"),
+            "last_name": record.get("last_name"),
+            "job_id": record["id"],
+            "printed_at": record.get("t"),
+            "count": (previous["count"] if previous else 0) + 1,
+        }
+
+
+def _scan(path):
+    """
+    Read a journal file from the start without touching any index.
+
+    Returns:
+        tuple: (printed attendees by key, dict of queued job id to params,
+            set of finished job ids)
+    """
+    printed, queued, finished = {}, {}, set()
+    with open(path, "rb") as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            op = record.get("op")
+            if op == "queued":
+                queued[record["id"]] = record.get("params") or {}
+            elif op in ("done", "failed"):
+                finished.add(record["id"])
+            _count(printed, record)
+    return printed, queued, finished
+
+
+def _try_lock_exclusive(lock_file):
+    """Lock the journal's lock file exclusively without waiting; False if another process holds it"""
+    try:
+        if FCNTL_AVAILABLE:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+        return True
+    except OSError:
+        return False
+
+
+def _lock_shared(lock_file):
+    """
+    Hold a shared lock on the journal's lock file.
+
+    msvcrt has no shared locks: on Windows the process that replayed the
+    journal keeps its exclusive lock and the others hold none, so the
+    journal is replayed by the first process only while it runs.
+    """
+    if FCNTL_AVAILABLE:
+        fcntl.flock(lock_file, fcntl.LOCK_SH)
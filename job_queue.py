@@ -0,0 +1,287 @@
+# job_queue.py
+import logging
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+# Lifecycle of a print job, in order
+JOB_STATES = ("queued", "rendering", "printing", "done", "failed")
+
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the queue is at capacity"""
+
+
+class QueueClosedError(Exception):
+    """Raised when a job is submitted after the queue was closed"""
+
+
+class PrintJob:
+    """A single label print request and its progress"""
+
+    def __init__(self, params, job_id=None):
+        self.id = job_id or uuid.uuid4().hex[:12]
+        self.params = params
+        self.state = "queued"
+        self.error = None
+        self.result = {}
+        self.timestamps = {"queued": time.time()}
+        self.lock = threading.Lock()
+        # Set once the "queued" notification went out, so callbacks never
+        # see a later state before it
+        self.submitted = threading.Event()
+
+    def set_state(self, state, error=None):
+        with self.lock:
+            self.state = state
+            self.timestamps[state] = time.time()
+            if error is not None:
+                self.error = error
+
+    @property
+    def finished(self):
+        return self.state in ("done", "failed")
+
+    def to_dict(self):
+        with self.lock:
+            return {
+                "id": self.id,
+                "state": self.state,
+                "error": self.error,
+                "params": dict(self.params),
+                "result": dict(self.result),
+                "timestamps": dict(self.timestamps),
+            }
+
+
+class JobQueue:
+    """
+    Bounded queue of print jobs drained by a pool of worker threads.
+
+    Each job goes through two stages: `render(job)` produces whatever the
+    printer needs (e.g. an image path) and `print_label(job, rendered)`
+    sends it to the printer and returns True on success. Either stage may
+    raise; the exception message is recorded on the job.
+
+    With `print_batch`, a worker takes up to `batch_size` jobs at once,
+    waiting up to `batch_wait` seconds for more to arrive after the first,
+    renders each of them and sends them together with
+    `print_batch(jobs, rendered)`, which returns a success flag per job.
+    A lone job still goes through `print_label`.
+    """
+
+    def __init__(self, render, print_label, workers=2, max_queued=100, max_history=500,
+                 print_batch=None, batch_size=1, batch_wait=0):
+        self.render = render
+        self.print_label = print_label
+        self.print_batch = print_batch
+        self.batch_size = max(1, batch_size) if print_batch else 1
+        self.batch_wait = batch_wait
+        self.workers = workers
+        self.max_history = max_history
+        self._queue = queue.Queue(maxsize=max_queued)
+        self._jobs = OrderedDict()
+        self._jobs_lock = threading.Lock()
+        self._threads = []
+        self._started = False
+        self._closed = False
+        self._start_lock = threading.Lock()
+        self._callbacks = []
+
+    def on_change(self, callback):
+        """Register a callback invoked with the job on every state change"""
+        self._callbacks.append(callback)
+
+    def start(self):
+        """Start the worker threads (idempotent)"""
+        with self._start_lock:
+            if self._started:
+                return
+            for i in range(self.workers):
+                t = threading.Thread(target=self._worker, name=f"print-worker-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+            self._started = True
+
+    def submit(self, params, job_id=None):
+        """
+        Enqueue a new print job.
+
+        Args:
+            params (dict): Label parameters for the job
+            job_id (str, optional): Id to use instead of a new one, e.g.
+                when replaying a job from the journal
+
+        Returns:
+            PrintJob: The queued job
+
+        Raises:
+            QueueFullError: If the queue is at capacity
+            QueueClosedError: If the queue no longer accepts jobs
+        """
+        if self._closed:
+            raise QueueClosedError("Print queue is shutting down")
+        self.start()
+        job = PrintJob(params, job_id)
+        with self._jobs_lock:
+            self._jobs[job.id] = job
+            self._trim_history()
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            with self._jobs_lock:
+                self._jobs.pop(job.id, None)
+            raise QueueFullError("Print queue is full, try again shortly")
+        self._notify(job)
+        job.submitted.set()
+        return job
+
+    def get(self, job_id):
+        with self._jobs_lock:
+            return self._jobs.get(job_id)
+
+    def list(self, limit=None):
+        """Return jobs newest first"""
+        with self._jobs_lock:
+            jobs = list(reversed(self._jobs.values()))
+        return jobs[:limit] if limit else jobs
+
+    def pending(self):
+        """Number of jobs waiting for a worker"""
+        return self._queue.qsize()
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def close(self):
+        """Stop accepting jobs; queued jobs are still processed"""
+        self._closed = True
+
+    def shutdown(self, wait=True, timeout=None):
+        """
+        Stop accepting jobs and stop the workers once the queue has been drained.
+
+        Args:
+            wait (bool): Block until the workers have exited
+            timeout (float, optional): Maximum seconds to wait in total
+
+        Returns:
+            bool: True if every worker exited (always True without wait)
+        """
+        self.close()
+        with self._start_lock:
+            threads, self._threads = self._threads, []
+            self._started = False
+        for _ in threads:
+            self._queue.put(None)
+        if not wait:
+            return True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for t in threads:
+            t.join(None if deadline is None else max(0, deadline - time.monotonic()))
+        return not any(t.is_alive() for t in threads)
+
+    def _trim_history(self):
+        # Drop the oldest finished jobs once we exceed the history limit
+        excess = len(self._jobs) - self.max_history
+        if excess <= 0:
+            return
+        for job_id in [j.id for j in self._jobs.values() if j.finished][:excess]:
+            del self._jobs[job_id]
+
+    def _worker(self):
+        while True:
+            jobs, stop = self._take()
+            try:
+                for job in jobs:
+                    job.submitted.wait()
+                if len(jobs) == 1:
+                    self._run(jobs[0])
+                elif jobs:
+                    self._run_batch(jobs)
+            finally:
+                for _ in range(len(jobs) + stop):
+                    self._queue.task_done()
+            if stop:
+                return
+
+    def _take(self):
+        """
+        Take the next job, plus any that are queued (or arrive within
+        `batch_wait`) up to `batch_size`.
+
+        Returns:
+            tuple: (jobs, stop); stop is True if the worker was told to exit
+        """
+        job = self._queue.get()
+        if job is None:
+            return [], True
+        jobs = [job]
+        deadline = time.monotonic() + self.batch_wait
+        while len(jobs) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                job = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if job is None:
+                return jobs, True
+            jobs.append(job)
+        return jobs, False
+
+    def _set_state(self, job, state, error=None):
+        job.set_state(state, error)
+        self._notify(job)
+
+    def _notify(self, job):
+        for callback in self._callbacks:
+            try:
+                callback(job)
+            except Exception as e:
+                logger.error("Error in job state callback: %s", e)
+
+    def _run(self, job):
+        try:
+            self._set_state(job, "rendering")
+            rendered = self.render(job)
+            self._set_state(job, "printing")
+            if self.print_label(job, rendered):
+                self._set_state(job, "done")
+            else:
+                self._set_state(job, "failed", error=job.result.get("error", "Print failed"))
+        except Exception as e:
+            logger.error("Error processing print job %s: %s", job.id, e)
+            self._set_state(job, "failed", error=str(e))
+
+    def _run_batch(self, jobs):
+        rendered_jobs, rendered = [], []
+        for job in jobs:
+            try:
+                self._set_state(job, "rendering")
+                rendered.append(self.render(job))
+                rendered_jobs.append(job)
+            except Exception as e:
+                logger.error("Error processing print job %s: %s", job.id, e)
+                self._set_state(job, "failed", error=str(e))
+        if not rendered_jobs:
+            return
+
+        for job in rendered_jobs:
+            self._set_state(job, "printing")
+        try:
+            results = self.print_batch(rendered_jobs, rendered)
+            errors = [None] * len(rendered_jobs)
+        except Exception as e:
+            logger.error("Error printing %d jobs together: %s", len(rendered_jobs), e)
+            results, errors = [False] * len(rendered_jobs), [str(e)] * len(rendered_jobs)
+        for job, success, error in zip(rendered_jobs, results, errors):
+            if success:
+                self._set_state(job, "done")
+            else:
+                self._set_state(job, "failed", error=error or job.result.get("error", "Print failed"))
@@ -0,0 +1,387 @@
+# label_archive.py
+import csv
+import hashlib
+import io
+import logging
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+import zipfile
+
+from metrics import span
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    hash TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    data BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS labels (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    event TEXT NOT NULL,
+    job_id TEXT,
+    first_name TEXT,
+    last_name TEXT,
+    hash TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS labels_event ON labels (event, id);
+CREATE INDEX IF NOT EXISTS labels_hash ON labels (hash);
+CREATE INDEX IF NOT EXISTS labels_created ON labels (created_at);
+"""
+
+# Most labels deleted per step when the archive is over its size limit
+PRUNE_STEP = 256
+
+
+class LabelArchive:
+    """
+    Bounded archive of rendered labels in a single SQLite file.
+
+    Every archived label is a row with the attendee's name, its job and
+    event; the PNG itself is stored once per content hash, so reprints
+    and attendees with identical labels share one copy. Labels older than
+    `retention_days` are deleted, and when the stored images exceed
+    `max_bytes` the oldest labels go first.
+
+    `add` only hashes the label and queues it: a background thread writes
+    queued labels in one transaction per batch, so archiving never waits
+    for the disk on the request path. The same thread prunes the archive
+    when it starts and every `prune_interval` seconds, also while no
+    labels arrive. Several server processes can share an archive;
+    SQLite serialises their writes.
+    """
+
+    def __init__(self, path, max_bytes=512 * 1024 * 1024, retention_days=30, default_event="default",
+                 prune_interval=60.0, max_pending=1000, max_batch=256, busy_timeout=5.0):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.retention_days = retention_days
+        self.default_event = default_event
+        self.prune_interval = prune_interval
+        self.max_batch = max_batch
+        self.busy_timeout = busy_timeout
+        self._pending = queue.Queue(max_pending)
+        self._conn = None
+        self._pid = None
+        self._writer = None
+        self._lock = threading.Lock()
+
+    # --- Writing ---
+
+    def add(self, data, first_name, last_name, job_id=None, event=None):
+        """
+        Queue an encoded label for the archive.
+
+        Args:
+            data (bytes): The encoded label (PNG)
+            event (str): Event the label belongs to (default: `default_event`)
+
+        Returns:
+            str or None: SHA-256 of the label, or None if the archive is
+                too far behind and the label was dropped
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        record = (event or self.default_event, job_id, first_name, last_name, digest, data, time.time())
+        try:
+            self._pending.put_nowait(record)
+        except queue.Full:
+            logger.warning("Label archive is %d labels behind, not archiving %s %s",
+                           self._pending.qsize(), first_name, last_name)
+            return None
+        self.start()
+        return digest
+
+    def start(self):
+        """Start the writer thread, which prunes the archive right away"""
+        with self._lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_loop, name="label-archive", daemon=True)
+                self._writer.start()
+
+    def flush(self):
+        """Wait until the labels queued so far are written"""
+        if self._writer is None:
+            return
+        written = threading.Event()
+        self._pending.put(written)
+        written.wait()
+
+    def close(self):
+        """Write out queued labels and stop the writer thread"""
+        with self._lock:
+            writer, self._writer = self._writer, None
+        if writer is not None:
+            self._pending.put(None)
+            writer.join()
+
+    def prune(self, now=None):
+        """
+        Delete labels past the retention period, then the oldest labels
+        until the stored images fit in `max_bytes`.
+
+        Returns:
+            int: Number of labels deleted
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            conn = self._connection()
+            deleted = 0
+            if self.retention_days:
+                cutoff = now - self.retention_days * 86400
+                deleted += conn.execute("DELETE FROM labels WHERE created_at < ?", (cutoff,)).rowcount
+            self._delete_orphans(conn)
+            while True:
+                images, stored = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM blobs").fetchone()
+                if stored <= self.max_bytes:
+                    break
+                # Roughly as many labels as it takes to free the excess
+                step = min(PRUNE_STEP, -(-(stored - self.max_bytes) * images // stored))
+                step = conn.execute(
+                    "DELETE FROM labels WHERE id IN (SELECT id FROM labels ORDER BY id LIMIT ?)",
+                    (step,),
+                ).rowcount
+                self._delete_orphans(conn)
+                if not step:
+                    break
+                deleted += step
+            if deleted:
+                # Hand the freed pages back to the file system
+                conn.execute("PRAGMA incremental_vacuum")
+        if deleted:
+            logger.info("Pruned %d labels from the label archive", deleted)
+        return deleted
+
+    # --- Reading ---
+
+    def get(self, label_id):
+        """
+        Returns:
+            tuple or None: (label dict, PNG bytes)
+        """
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT labels.id, event, job_id, first_name, last_name, labels.hash, created_at, size, data "
+                "FROM labels JOIN blobs ON blobs.hash = labels.hash WHERE labels.id = ?",
+                (label_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        return _label_dict(row[:8]), row[8]
+
+    def labels(self, event=None, limit=100, before=None):
+        """
+        List archived labels, newest first.
+
+        Args:
+            event (str): Only labels of this event
+            before (int): Only labels with a smaller id, to page through the list
+
+        Returns:
+            list: Label dicts (`id`, `event`, `job_id`, `first_name`,
+                `last_name`, `hash`, `created_at` and `size`)
+        """
+        where, args = [], []
+        if event is not None:
+            where.append("event = ?")
+            args.append(event)
+        if before is not None:
+            where.append("labels.id < ?")
+            args.append(before)
+        sql = ("SELECT labels.id, event, job_id, first_name, last_name, labels.hash, created_at, size "
+               "FROM labels JOIN blobs ON blobs.hash = labels.hash")
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY labels.id DESC LIMIT ?"
+        with self._lock:
+            rows = self._connection().execute(sql, args + [limit]).fetchall()
+        return [_label_dict(row) for row in rows]
+
+    def events(self):
+        """
+        Returns:
+            list: `event`, `labels` and the `first` and `last` archive time per event
+        """
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT event, COUNT(*), MIN(created_at), MAX(created_at) FROM labels GROUP BY event ORDER BY event"
+            ).fetchall()
+        return [{"event": event, "labels": count, "first": first, "last": last}
+                for event, count, first, last in rows]
+
+    def stats(self):
+        with self._lock:
+            conn = self._connection()
+            labels = conn.execute("SELECT COUNT(*) FROM labels").fetchone()[0]
+            images, stored = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM blobs").fetchone()
+        return {
+            "path": self.path,
+            "labels": labels,
+            "unique_images": images,
+            "bytes": stored,
+            "max_bytes": self.max_bytes,
+            "retention_days": self.retention_days,
+            "pending": self._pending.qsize(),
+        }
+
+    def export(self, event=None):
+        """
+        Stream the archived labels as a zip file, one PNG per label plus a
+        labels.csv index, without holding the archive in memory.
+
+        Args:
+            event (str): Only labels of this event (default: all)
+
+        Yields:
+            bytes: Consecutive chunks of the zip file
+        """
+        # A connection of its own, so the export reads one consistent
+        # snapshot without blocking other requests
+        conn = self._open()
+        try:
+            sql = ("SELECT labels.id, event, job_id, first_name, last_name, labels.hash, created_at, size, data "
+                   "FROM labels JOIN blobs ON blobs.hash = labels.hash")
+            args = ()
+            if event is not None:
+                sql += " WHERE event = ?"
+                args = (event,)
+            rows = conn.execute(sql + " ORDER BY labels.id", args)
+
+            stream = _ZipStream()
+            index = io.StringIO()
+            writer = csv.writer(index)
+            writer.writerow(["id", "event", "job_id", "first_name", "last_name", "hash", "created_at", "file"])
+            with zipfile.ZipFile(stream, "w", zipfile.ZIP_STORED) as archive:
+                for row in rows:
+                    label, data = _label_dict(row[:8]), row[8]
+                    name = f"{_file_name(label['event'])}/{label['id']}-{_file_name(label['first_name'], label['last_name'])}.png"
+                    info = zipfile.ZipInfo(name, time.localtime(label["created_at"])[:6])
+                    archive.writestr(info, data)
+                    writer.writerow([label["id"], label["event"], label["job_id"], label["first_name"],
+                                     label["last_name"], label["hash"], label["created_at"], name])
+                    yield stream.take()
+                archive.writestr("labels.csv", index.getvalue())
+            yield stream.take()
+        finally:
+            conn.close()
+
+    # --- Internals ---
+
+    def _open(self):
+        conn = sqlite3.connect(
+            self.path,
+            timeout=self.busy_timeout,
+            isolation_level=None,
+            check_same_thread=False,
+        )
+        # Only takes effect on a new file; lets prune return space to the OS
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(SCHEMA)
+        return conn
+
+    def _connection(self):
+        # Reopen in forked children, see StateStore._connection
+        if self._conn is None or self._pid != os.getpid():
+            self._conn = self._open()
+            self._pid = os.getpid()
+        return self._conn
+
+    def _delete_orphans(self, conn):
+        conn.execute("DELETE FROM blobs WHERE NOT EXISTS (SELECT 1 FROM labels WHERE labels.hash = blobs.hash)")
+
+    def _write_loop(self):
+        next_prune = time.monotonic()
+        while True:
+            try:
+                # Wake up for the next prune even if no labels arrive
+                batch = [self._pending.get(timeout=max(0.0, next_prune - time.monotonic()))]
+            except queue.Empty:
+                batch = []
+            while batch and batch[-1] is not None and len(batch) < self.max_batch:
+                try:
+                    batch.append(self._pending.get_nowait())
+                except queue.Empty:
+                    break
+
+            records = [item for item in batch if isinstance(item, tuple)]
+            if records:
+                try:
+                    self._write(records)
+                except sqlite3.Error as e:
+                    logger.error("Error writing %d labels to the label archive: %s", len(records), e)
+            if time.monotonic() >= next_prune:
+                next_prune = time.monotonic() + self.prune_interval
+                try:
+                    self.prune()
+                except sqlite3.Error as e:
+                    logger.error("Error pruning the label archive: %s", e)
+            for item in batch:
+                if isinstance(item, threading.Event):
+                    item.set()
+            if batch and batch[-1] is None:
+                return
+
+    def _write(self, records):
+        with span("archive_write"), self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.executemany(
+                    "INSERT OR IGNORE INTO blobs (hash, size, data) VALUES (?, ?, ?)",
+                    [(digest, len(data), data) for _, _, _, _, digest, data, _ in records],
+                )
+                conn.executemany(
+                    "INSERT INTO labels (event, job_id, first_name, last_name, hash, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    [(event, job_id, first, last, digest, created)
+                     for event, job_id, first, last, digest, _, created in records],
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+
+class _ZipStream:
+    """Write-only file object that collects what zipfile writes, for streaming"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data, self._chunks = b"".join(self._chunks), []
+        return data
+
+
+def _label_dict(row):
+    label_id, event, job_id, first_name, last_name, digest, created_at, size = row
+    return {
+        "id": label_id,
+        "event": event,
+        "job_id": job_id,
+        "first_name": first_name,
+        "last_name": last_name,
+        "hash": digest,
+        "created_at": created_at,
+        "size": size,
+    }
+
+
+def _file_name(*parts):
+    """File name made of `parts`, with anything but letters, digits, - and _ removed"""
+    name = re.sub(r"[^\w-]+", "", "".join(part or "" for part in parts))
+    return name or "label"
@@ -0,0 +1,64 @@
+# label_cache.py
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+from metrics import LABEL_CACHE_REQUESTS
+
+
+class LabelCache:
+    """
+    Content-addressed cache of print-ready label payloads.
+
+    Entries are evicted least recently used first once the total payload
+    size exceeds `max_bytes`.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(**fields):
+        """Hash the fields that determine the printed output"""
+        encoded = json.dumps(fields, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            payload = self._entries.get(key)
+            if payload is None:
+                self.misses += 1
+            else:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        LABEL_CACHE_REQUESTS.inc(result="miss" if payload is None else "hit")
+        return payload
+
+    def put(self, key, payload):
+        if len(payload) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self._entries[key] = payload
+            self.size += len(payload)
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
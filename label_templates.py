@@ -0,0 +1,424 @@
+# label_templates.py
+import hashlib
+import io
+import json
+import os
+import re
+import threading
+
+from PIL import Image, ImageDraw
+
+from functions import (
+    AUTO_FIT_MARGIN,
+    FONT_PATH,
+    MIN_FONT_SIZE,
+    PREVIEW_WIDTH,
+    auto_fit,
+    check_color_mode,
+    draw_name,
+    get_font,
+    native_size,
+    render_label,
+    render_preview,
+    scaled_size,
+    text_bbox,
+    to_bitmap,
+)
+
+# qrcode is optional - without it templates with QR layers can't be loaded
+try:
+    import qrcode
+    QRCODE_AVAILABLE = True
+except ImportError:
+    QRCODE_AVAILABLE = False
+
+# Directory the JSON template files are loaded from
+TEMPLATE_DIR = os.environ.get("LABEL_TEMPLATE_DIR", "./label_templates")
+
+# Template names map directly to file names, so keep them simple
+TEMPLATE_NAME = re.compile(r"^[A-Za-z0-9_-]+$")
+
+LAYER_TYPES = ("rect", "text", "image", "qr")
+
+
+class TemplateError(ValueError):
+    """Raised when a template doesn't exist or can't be compiled"""
+
+
+class LabelTemplate:
+    """
+    A label design compiled from a JSON template.
+
+    Everything except the attendee's name is static, so the static layers
+    (rectangles, text, images, QR codes) are drawn once when the template
+    is compiled. Rendering a label copies that base image and only draws
+    the name into its box.
+
+    Template format::
+
+        {
+            "size": [731, 300],
+            "background": "white",
+            "layers": [
+                {"type": "rect", "box": [0, 250, 731, 50], "fill": "black"},
+                {"type": "text", "text": "SPEAKER", "box": [0, 250, 731, 50], "color": "white"},
+                {"type": "image", "path": "logo.png", "box": [10, 10, 120, 60]},
+                {"type": "qr", "data": "https://example.org", "box": [620, 10, 100, 100]}
+            ],
+            "name": {"box": [0, 60, 731, 190], "layout": "auto", "font_size": "auto"}
+        }
+
+    Boxes are [x, y, width, height]. Image paths are relative to the
+    template file.
+    """
+
+    def __init__(self, name, spec, base_dir=TEMPLATE_DIR):
+        self.name = name
+        self.description = spec.get("description", "")
+        try:
+            self.width, self.height = (int(v) for v in spec.get("size", (731, 300)))
+        except (TypeError, ValueError):
+            raise TemplateError(f"Template {name}: size must be [width, height]")
+        self.background = spec.get("background", "white")
+
+        name_field = spec.get("name") or {}
+        self.name_box = _parse_box(name_field.get("box", (0, 0, self.width, self.height)), name)
+        self.layout = name_field.get("layout", "auto")
+        self.font_size = name_field.get("font_size", "auto")
+        self.color = name_field.get("color", "black")
+        self.margin = int(name_field.get("margin", AUTO_FIT_MARGIN))
+
+        # Referenced files are part of the digest, so replacing a logo
+        # invalidates cached labels just like editing the JSON does
+        digest = hashlib.sha256(json.dumps(spec, sort_keys=True).encode("utf-8"))
+        self._base = self._draw_base(spec, base_dir, (self.width, self.height), 1.0, digest)
+        self.digest = digest.hexdigest()
+
+        # The same base in grayscale at the print head width, for 1-bit
+        # labels, and at the preview width
+        self._native_base, self._native_name_box, self._native_scale = self._scaled_base(
+            spec, base_dir, *native_size(self.width, self.height)
+        )
+        self._preview_base, self._preview_name_box, self._preview_scale = self._scaled_base(
+            spec, base_dir, *scaled_size(self.width, self.height, min(PREVIEW_WIDTH, self.width))
+        )
+
+    def resolve(self, first_name, last_name, layout=None, font_size=None, fit=False):
+        """
+        Resolve the name's layout and font size, filling in the template's
+        defaults and fitting 'auto' values to the name box.
+
+        Args:
+            fit (bool): Fit the font size to the name box even if one is
+                given, using it as the upper bound
+
+        Returns:
+            tuple: (layout, font_size)
+        """
+        layout = layout or self.layout
+        font_size = font_size or self.font_size
+        if fit or layout == "auto" or font_size == "auto":
+            _, _, width, height = self.name_box
+            layout, font_size = auto_fit(
+                first_name,
+                last_name,
+                width=width,
+                height=height,
+                layout=layout,
+                max_font_size=None if font_size == "auto" else int(font_size),
+                margin=self.margin,
+            )
+        return layout, int(font_size)
+
+    def render(self, first_name, last_name, layout=None, font_size=None, color_mode=None):
+        """
+        Render a label for one attendee.
+
+        Args:
+            color_mode (str): One of COLOR_MODES (default: LABEL_COLOR_MODE)
+
+        Returns:
+            PIL.Image.Image: The rendered label
+        """
+        layout, font_size = self.resolve(first_name, last_name, layout, font_size)
+        color_mode = check_color_mode(color_mode)
+        if color_mode == "rgb":
+            image, box = self._base.copy(), self.name_box
+        else:
+            image, box = self._native_base.copy(), self._native_name_box
+            font_size = max(1, int(font_size * self._native_scale))
+        draw_name(ImageDraw.Draw(image), first_name, last_name, layout, font_size,
+                  box, fill=self.color)
+        return to_bitmap(image, color_mode)
+
+    def preview(self, first_name, last_name, layout=None, font_size=None, color_mode=None):
+        """
+        Render a downscaled preview of a label from the precompiled
+        preview base.
+
+        Args:
+            color_mode (str): One of COLOR_MODES (default: LABEL_COLOR_MODE)
+
+        Returns:
+            PIL.Image.Image: The preview, mode "1", or "L" for "rgb"
+        """
+        layout, font_size = self.resolve(first_name, last_name, layout, font_size)
+        color_mode = check_color_mode(color_mode)
+        image = self._preview_base.copy()
+        draw_name(ImageDraw.Draw(image), first_name, last_name, layout,
+                  max(1, int(font_size * self._preview_scale)), self._preview_name_box, fill=self.color)
+        return to_bitmap(image, color_mode)
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "description": self.description,
+            "width": self.width,
+            "height": self.height,
+            "name_box": list(self.name_box),
+            "layout": self.layout,
+            "font_size": self.font_size,
+            "digest": self.digest,
+        }
+
+    def _scaled_base(self, spec, base_dir, width, height, scale):
+        """
+        The base in grayscale at another size, with the name box scaled to
+        match. The layers are drawn again at that size rather than
+        resampling the base, which would blur QR modules and text edges.
+        """
+        if (width, height) == (self.width, self.height):
+            base = self._base.convert("L")
+        else:
+            base = self._draw_base(spec, base_dir, (width, height), scale).convert("L")
+        name_box = tuple(int(v * scale) for v in self.name_box)
+        return base, name_box, scale
+
+    def _draw_base(self, spec, base_dir, size, scale, digest=None):
+        """Draw the static layers on a background of `size`, with every box scaled by `scale`"""
+        image = Image.new("RGB", size, self.background)
+        draw = ImageDraw.Draw(image)
+        for layer in spec.get("layers", []):
+            self._draw_layer(image, draw, layer, base_dir, scale, digest)
+        return image
+
+    def _draw_layer(self, image, draw, layer, base_dir, scale, digest):
+        kind = layer.get("type")
+        if kind not in LAYER_TYPES:
+            raise TemplateError(f"Template {self.name}: unknown layer type {kind!r}")
+        box = _parse_box(layer.get("box", (0, 0, self.width, self.height)), self.name)
+        x, y, width, height = (round(v * scale) for v in box)
+
+        if kind == "rect":
+            draw.rectangle((x, y, x + width - 1, y + height - 1),
+                           fill=layer.get("fill"), outline=layer.get("outline"))
+
+        elif kind == "text":
+            text = layer.get("text", "")
+            font_path = layer.get("font", FONT_PATH)
+            size = layer.get("font_size")
+            size = max(1, round(size * scale)) if size else _fit_text(text, font_path, width, height)
+            left, top, right, bottom = text_bbox(text, font_path, size)
+            align = layer.get("align", "center")
+            if align == "left":
+                text_x = x - left
+            elif align == "right":
+                text_x = x + width - right
+            else:
+                text_x = x + (width - (right - left)) // 2 - left
+            text_y = y + (height - (bottom - top)) // 2 - top
+            draw.text((text_x, text_y), text, fill=layer.get("color", "black"),
+                      font=get_font(font_path, size))
+
+        elif kind == "image":
+            path = os.path.join(base_dir, layer.get("path", ""))
+            try:
+                with open(path, "rb") as f:
+                    data = f.read()
+            except OSError as e:
+                raise TemplateError(f"Template {self.name}: cannot read image: {e}")
+            if digest is not None:
+                digest.update(hashlib.sha256(data).digest())
+            with Image.open(io.BytesIO(data)) as source:
+                picture = source.convert("RGBA")
+            picture.thumbnail((width, height), Image.LANCZOS)
+            offset = (x + (width - picture.width) // 2, y + (height - picture.height) // 2)
+            image.paste(picture, offset, picture)
+
+        elif kind == "qr":
+            if not QRCODE_AVAILABLE:
+                raise TemplateError(f"Template {self.name}: qrcode is not installed")
+            qr = qrcode.QRCode(border=layer.get("border", 0))
+            qr.add_data(layer.get("data", ""))
+            qr.make(fit=True)
+            code = qr.make_image(fill_color=layer.get("color", "black"),
+                                 back_color=layer.get("background", "white")).get_image()
+            side = min(width, height)
+            # Nearest neighbour keeps the modules sharp for scanners
+            code = code.convert("RGB").resize((side, side), Image.NEAREST)
+            image.paste(code, (x + (width - side) // 2, y + (height - side) // 2))
+
+
+def _parse_box(box, template_name):
+    try:
+        x, y, width, height = (int(v) for v in box)
+    except (TypeError, ValueError):
+        raise TemplateError(f"Template {template_name}: box must be [x, y, width, height]")
+    return x, y, width, height
+
+
+def _fit_text(text, font_path, width, height):
+    """Largest font size at which `text` fits inside width x height"""
+    low, high = MIN_FONT_SIZE, max(height, MIN_FONT_SIZE)
+    while low < high:
+        size = (low + high + 1) // 2
+        left, top, right, bottom = text_bbox(text, font_path, size)
+        if right - left <= width and bottom - top <= height:
+            low = size
+        else:
+            high = size - 1
+    return low
+
+
+# Compiled templates by name, with the mtime of the file they came from
+_templates = {}
+_templates_lock = threading.Lock()
+
+
+def template_path(name):
+    if not TEMPLATE_NAME.match(name or ""):
+        raise TemplateError(f"Invalid template name: {name!r}")
+    return os.path.join(TEMPLATE_DIR, f"{name}.json")
+
+
+def get_template(name):
+    """
+    Return the compiled template `name`.
+
+    Templates are compiled on first use and recompiled when their file
+    changes.
+
+    Raises:
+        TemplateError: If the template doesn't exist or is invalid
+    """
+    path = template_path(name)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        raise TemplateError(f"Template not found: {name}")
+
+    with _templates_lock:
+        cached = _templates.get(name)
+        if cached and cached[0] == mtime:
+            return cached[1]
+
+    try:
+        with open(path, "r") as f:
+            spec = json.load(f)
+    except ValueError as e:
+        raise TemplateError(f"Template {name} is not valid JSON: {e}")
+    template = LabelTemplate(name, spec, base_dir=os.path.dirname(path))
+
+    with _templates_lock:
+        _templates[name] = (mtime, template)
+    return template
+
+
+def list_templates():
+    """Names of the templates in TEMPLATE_DIR"""
+    if not os.path.isdir(TEMPLATE_DIR):
+        return []
+    return sorted(
+        name[:-len(".json")] for name in os.listdir(TEMPLATE_DIR)
+        if name.endswith(".json") and TEMPLATE_NAME.match(name[:-len(".json")])
+    )
+
+
+def resolve_params(params):
+    """
+    Fill in a label's automatic layout and font size.
+
+    Labels with a template, `auto_fit` or an 'auto' layout or font size
+    are fitted here, so the search runs on whatever renders the label
+    rather than on the request thread.
+
+    Returns:
+        dict: The parameters with a concrete layout and font size
+    """
+    layout, font_size = params.get("layout"), params.get("font_size")
+    if params.get("template"):
+        layout, font_size = get_template(params["template"]).resolve(
+            params["first_name"],
+            params["last_name"],
+            layout=layout,
+            font_size=font_size,
+            fit=bool(params.get("auto_fit")),
+        )
+    elif params.get("auto_fit") or layout == "auto" or font_size == "auto":
+        # A numeric font_size is used as the upper bound for the search
+        layout, font_size = auto_fit(
+            params["first_name"],
+            params["last_name"],
+            width=params["width"],
+            height=params["height"],
+            layout=layout,
+            max_font_size=None if font_size == "auto" else int(font_size),
+        )
+    else:
+        return params
+    return dict(params, layout=layout, font_size=font_size, auto_fit=False)
+
+
+def render_params(params):
+    """
+    Render the label described by a job's or batch row's parameters,
+    using its template if it names one.
+
+    Returns:
+        PIL.Image.Image: The rendered label
+    """
+    if params.get("template"):
+        return get_template(params["template"]).render(
+            params["first_name"],
+            params["last_name"],
+            layout=params.get("layout"),
+            font_size=params.get("font_size"),
+            color_mode=params.get("color_mode"),
+        )
+    return render_label(
+        params["first_name"],
+        params["last_name"],
+        layout=params["layout"],
+        font_size=params["font_size"],
+        width=params["width"],
+        height=params["height"],
+        color_mode=params.get("color_mode"),
+    )
+
+
+def preview_params(params):
+    """
+    Render a downscaled preview of the label described by request
+    parameters; layout and font size are resolved first.
+
+    Returns:
+        PIL.Image.Image: The preview, in the label's color mode
+    """
+    params = resolve_params(params)
+    if params.get("template"):
+        return get_template(params["template"]).preview(
+            params["first_name"],
+            params["last_name"],
+            layout=params.get("layout"),
+            font_size=params.get("font_size"),
+            color_mode=params.get("color_mode"),
+        )
+    return render_preview(
+        params["first_name"],
+        params["last_name"],
+        layout=params["layout"],
+        font_size=params["font_size"],
+        width=params["width"],
+        height=params["height"],
+        color_mode=params.get("color_mode"),
+    )
@@ -0,0 +1,65 @@
+# logging_config.py
+import logging
+import os
+import sys
+import threading
+import time
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Let through at most `limit` records per message per `interval` seconds.
+
+    Records are grouped by logger and unformatted message, so a message
+    repeated with different arguments (e.g. one line per printed label)
+    counts as one. The first record let through after a quiet period says
+    how many were dropped.
+    """
+
+    def __init__(self, limit=20, interval=60):
+        super().__init__()
+        self.limit = limit
+        self.interval = interval
+        self._windows = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        key = (record.name, record.msg)
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.interval:
+                suppressed = window[2] if window else 0
+                self._windows[key] = [now, 1, 0]
+            elif window[1] < self.limit:
+                window[1] += 1
+                suppressed = 0
+            else:
+                window[2] += 1
+                return False
+
+        if suppressed:
+            record.msg = f"{record.getMessage()} ({suppressed} similar messages suppressed)"
+            record.args = None
+        return True
+
+
+def configure_logging():
+    """
+    Set up leveled, rate-limited logging to stderr.
+
+    `LOG_LEVEL` sets the level (default: INFO); `LOG_RATE_LIMIT` messages
+    of the same kind are let through per `LOG_RATE_INTERVAL` seconds
+    (defaults: 20 per 60 s, 0 disables the limit). Does nothing if the
+    root logger is already configured, e.g. by the host application.
+    """
+    root = logging.getLogger()
+    if root.handlers:
+        return
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    limit = int(os.environ.get("LOG_RATE_LIMIT", 20))
+    if limit:
+        handler.addFilter(RateLimitFilter(limit, float(os.environ.get("LOG_RATE_INTERVAL", 60))))
+    root.addHandler(handler)
+    root.setLevel(os.environ.get("LOG_LEVEL", "INFO").upper())
@@ -1,6 +1,19 @@
-# Import the app from routes
-from routes import app
+import os
 
-# Run the application
+# Run the application with the development server; see gunicorn.conf.py
+# for running in production
 if __name__ == "__main__":
-    app.run(host='0.0.0.0', port=5555, debug=True)
\ No newline at end of file
+    # Imported here rather than at the top: batch render workers started
+    # with "spawn" (macOS, Windows) re-import this module, and must not
+    # start the printer monitor, journal replay and the rest of the app
+    from routes import app, shutdown
+
+    try:
+        app.run(
+            host=os.environ.get("HOST", "0.0.0.0"),
+            port=int(os.environ.get("PORT", 5555)),
+            debug=os.environ.get("FLASK_DEBUG") == "1",
+            threaded=True,
+        )
+    finally:
+        shutdown(timeout=float(os.environ.get("SHUTDOWN_TIMEOUT", 30)))
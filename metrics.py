@@ -0,0 +1,182 @@
+# metrics.py
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds (seconds) of the latency histogram buckets
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Every metric created, in the order they are exported
+REGISTRY = []
+
+
+class Metric:
+    """Base class: a named metric with a fixed set of label names"""
+
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def _format_labels(self, key, extra=()):
+        pairs = list(zip(self.label_names, key)) + list(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            values = dict(self._values)
+        lines.extend(self._samples(values))
+        return lines
+
+
+class Counter(Metric):
+    """A value that only goes up, e.g. the number of jobs printed"""
+
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self, values):
+        return [f"{self.name}{self._format_labels(key)} {value}" for key, value in values.items()]
+
+
+class Gauge(Metric):
+    """
+    A value that goes up and down. With `function` the value is read when
+    the metrics are exported, e.g. the current queue depth; it returns
+    either the value or a dict of {label values tuple: value}.
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labels=(), function=None):
+        super().__init__(name, documentation, labels)
+        self.function = function
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def _samples(self, values):
+        if self.function is not None:
+            values = self.function()
+            if not isinstance(values, dict):
+                values = {(): values}
+        return [f"{self.name}{self._format_labels(key)} {value}" for key, value in values.items()]
+
+
+class Histogram(Metric):
+    """Distribution of observed values, e.g. latencies, in cumulative buckets"""
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                # Per-bucket counts (plus +Inf), sum and count
+                series = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def _samples(self, values):
+        lines = []
+        for key, (counts, total, count) in values.items():
+            cumulative = 0
+            for bound, bucket in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{self.name}_bucket{self._format_labels(key, [('le', le)])} {cumulative}")
+            lines.append(f"{self.name}_sum{self._format_labels(key)} {total}")
+            lines.append(f"{self.name}_count{self._format_labels(key)} {count}")
+        return lines
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def render_metrics():
+    """All metrics in the Prometheus text exposition format"""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.expose())
+    return "\n".join(lines) + "\n"
+
+
+# --- Label printer metrics ---
+
+STAGE_SECONDS = Histogram(
+    "label_stage_duration_seconds",
+    "Time spent in each stage of rendering and printing a label",
+    labels=("stage", "printer", "layout"),
+)
+
+JOBS = Counter(
+    "label_jobs_total",
+    "Print jobs finished, by outcome",
+    labels=("state", "printer", "layout"),
+)
+
+PRINT_BATCH_SIZE = Histogram(
+    "label_print_batch_size",
+    "Labels merged into one print job",
+    labels=("printer",),
+    buckets=(2, 4, 8, 16, 32),
+)
+
+LP_ATTEMPTS = Counter(
+    "label_lp_attempts_total",
+    "lp invocations, including retries with alternative options",
+    labels=("printer", "options", "outcome"),
+)
+
+PROBES = Counter(
+    "label_printer_probes_total",
+    "Printer connection probes, by result",
+    labels=("method", "printer", "outcome"),
+)
+
+LABEL_CACHE_REQUESTS = Counter(
+    "label_cache_requests_total",
+    "Label cache lookups, by result",
+    labels=("result",),
+)
+
+
+@contextmanager
+def span(stage, **labels):
+    """
+    Time a block of code into STAGE_SECONDS.
+
+    Yields the labels as a dict, so labels that are only known once the
+    block has run (e.g. the layout auto-fit picked) can be filled in.
+    """
+    labels = dict(labels)
+    start = time.perf_counter()
+    try:
+        yield labels
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage=stage, **labels)
@@ -0,0 +1,223 @@
+# backends.py
+import io
+import logging
+import socket
+import subprocess
+
+from PIL import Image
+
+from metrics import LP_ATTEMPTS, span
+
+# brother_ql is optional - without it only the lp backend is available
+try:
+    from brother_ql.backends.helpers import send as brother_ql_send
+    from brother_ql.conversion import convert
+    from brother_ql.labels import ALL_LABELS
+    from brother_ql.raster import BrotherQLRaster
+    BROTHER_QL_AVAILABLE = True
+except ImportError:
+    BROTHER_QL_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Port Brother printers accept raw raster jobs on
+RAW_PORT = 9100
+
+
+class PrintBackend:
+    """
+    Interface for sending labels to a printer.
+
+    `prepare` converts a rendered label into whatever the printer expects
+    and `send` delivers it, so a label can be converted once and sent (or
+    re-sent) later.
+    """
+
+    name = None
+
+    # Whether a merged job is a different kind of document than a single
+    # label, which a printer may reject while still printing labels
+    merge_changes_format = False
+
+    def prepare(self, image):
+        raise NotImplementedError
+
+    def send(self, payload, learn=True):
+        raise NotImplementedError
+
+    def merge(self, payloads):
+        """
+        Combine prepared labels into one payload that the printer
+        receives as a single job, or return None if the backend can't.
+        """
+        return None
+
+    def print_image(self, image):
+        return self.send(self.prepare(image))
+
+
+class LpBackend(PrintBackend):
+    """Print through CUPS with the `lp` command"""
+
+    name = "lp"
+    merge_changes_format = True
+
+    # Option sets tried in order until lp accepts the job
+    OPTION_SETS = [
+        [],
+        ["-o", "raw"],
+        ["-o", "media=Custom.62x100mm"],
+    ]
+
+    def __init__(self, printer_address, timeout=10, profiles=None):
+        self.printer_address = printer_address
+        self.timeout = timeout
+        self.profiles = profiles
+
+    def prepare(self, image):
+        buffer = io.BytesIO()
+        image.save(buffer, format="PNG", compress_level=1)
+        return buffer.getvalue()
+
+    def merge(self, payloads):
+        """Combine PNG labels (or image paths) into one multi-page PDF, one page per label"""
+        images = [Image.open(p if isinstance(p, str) else io.BytesIO(p)) for p in payloads]
+        buffer = io.BytesIO()
+        # 300 dpi keeps every page at the label's printed size
+        images[0].save(buffer, format="PDF", save_all=True, append_images=images[1:], resolution=300)
+        return buffer.getvalue()
+
+    def send(self, payload, learn=True):
+        """
+        Run lp with each option set until one succeeds.
+
+        With `profiles` (an OptionProfiles), the option set that last
+        worked for this printer is tried first and a newly working one is
+        remembered.
+
+        Args:
+            payload (str or bytes): Path to an image file, or the encoded
+                image, which is piped to lp through stdin
+            learn (bool): Update the printer's profile from this job; off
+                for merged jobs, which say nothing about single labels
+        """
+        learn = learn and self.profiles is not None
+        in_memory = isinstance(payload, (bytes, bytearray))
+        option_sets = self.OPTION_SETS
+        if self.profiles is not None:
+            option_sets = self.profiles.order(self.printer_address, option_sets)
+
+        for i, options in enumerate(option_sets):
+            option_label = " ".join(options) or "default"
+            if i > 0:
+                logger.info("Trying alternative lp options: %s", option_label)
+            cmd = ["lp", "-d", self.printer_address] + options
+            with span("lp", printer=self.printer_address):
+                if in_memory:
+                    # lp reads the document from stdin when no file is given
+                    result = subprocess.run(cmd, input=payload, capture_output=True, timeout=self.timeout)
+                else:
+                    result = subprocess.run(cmd + [payload], capture_output=True, timeout=self.timeout)
+
+            succeeded = result.returncode == 0
+            LP_ATTEMPTS.inc(printer=self.printer_address, options=option_label,
+                            outcome="success" if succeeded else "failure")
+            if succeeded:
+                logger.debug("Printed on %s with lp options: %s", self.printer_address, option_label)
+                if learn:
+                    self.profiles.record_success(self.printer_address, options, attempts=i + 1)
+                return True
+            if learn and i == 0:
+                self.profiles.record_failure(self.printer_address, options)
+            logger.warning("lp on %s failed with options %s: %s", self.printer_address, option_label,
+                           result.stderr.decode(errors="replace").strip())
+
+        return False
+
+
+class BrotherQLBackend(PrintBackend):
+    """
+    Send Brother QL raster instructions directly to the printer, bypassing CUPS.
+
+    The identifier is either `tcp://host[:port]` for network printers or a
+    brother_ql pyusb identifier such as `usb://0x04f9:0x209d`.
+    """
+
+    name = "brother_ql"
+
+    def __init__(self, identifier, model="QL-820NWB", label="62", timeout=5):
+        if not BROTHER_QL_AVAILABLE:
+            raise RuntimeError("brother_ql is not installed")
+        self.identifier = identifier
+        self.model = model
+        self.label = label
+        self.timeout = timeout
+
+    def prepare(self, image):
+        # Scale to the printable width ourselves; brother_ql's own resize
+        # uses a filter that newer Pillow versions no longer provide
+        printable_width = self._printable_width()
+        if printable_width and image.size[0] != printable_width:
+            height = int(image.size[1] * printable_width / image.size[0])
+            image = image.resize((printable_width, height), Image.LANCZOS)
+
+        qlr = BrotherQLRaster(self.model)
+        return convert(qlr, [image], self.label, cut=True, rotate="0")
+
+    def merge(self, payloads):
+        # Each payload is a complete raster job; back to back they print
+        # in order over one connection
+        return b"".join(payloads)
+
+    def send(self, payload, learn=True):
+        try:
+            with span("send", printer=self.identifier):
+                if self.identifier.startswith("tcp://"):
+                    host, port = parse_tcp_identifier(self.identifier)
+                    with socket.create_connection((host, port), timeout=self.timeout) as sock:
+                        sock.sendall(payload)
+                    logger.debug("Sent %d bytes to %s:%s", len(payload), host, port)
+                    return True
+
+                status = brother_ql_send(payload, self.identifier, backend_identifier="pyusb")
+                return status.get("outcome") != "error"
+        except Exception as e:
+            logger.warning("Error sending to %s: %s", self.identifier, e)
+            return False
+
+    def _printable_width(self):
+        for label in ALL_LABELS:
+            if label.identifier == self.label:
+                return label.dots_printable[0]
+        return None
+
+
+def parse_tcp_identifier(identifier):
+    """Split `tcp://host[:port]` (or a bare host) into (host, port)"""
+    address = identifier[len("tcp://"):] if identifier.startswith("tcp://") else identifier
+    host, _, port = address.partition(":")
+    return host, int(port) if port else RAW_PORT
+
+
+def get_backend(method, address, model="QL-820NWB", profiles=None):
+    """
+    Return the print backend for a connection method.
+
+    Args:
+        method (str): "system" (CUPS), "network" (raw TCP) or "usb"
+        address (str): Printer name, host[:port] or USB identifier
+        model (str): Printer model
+        profiles (OptionProfiles, optional): Remembered lp options per printer
+
+    Returns:
+        PrintBackend or None: None if there is no printer address
+    """
+    if not address:
+        return None
+    if method == "network":
+        identifier = address if address.startswith("tcp://") else f"tcp://{address}"
+        return BrotherQLBackend(identifier, model=model)
+    if method == "usb":
+        identifier = address if address.startswith("usb://") else f"usb://{address}"
+        return BrotherQLBackend(identifier, model=model)
+    return LpBackend(address, profiles=profiles)
@@ -1,20 +1,36 @@
 # connection.py
+import logging
 import subprocess
 import os
 import re
+import socket
+
+from metrics import PROBES, span
+from printer_manager.backends import BROTHER_QL_AVAILABLE, parse_tcp_identifier
+
+if BROTHER_QL_AVAILABLE:
+    from brother_ql.backends import backend_factory
+
+logger = logging.getLogger(__name__)
 
 def test_printer_connection(method, address, model):
     """Test if we can connect to the printer"""
+    with span("probe", printer=address):
+        connected = _probe_printer(method, address, model)
+    PROBES.inc(method=method, printer=address, outcome="up" if connected else "down")
+    return connected
+
+def _probe_printer(method, address, model):
     if method == "system":
         # For system printers, check if the printer exists in the system
         try:
-            print(f"Testing connection to system printer: {address}")
+            logger.debug("Testing connection to system printer: %s", address)
             
             if os.name == 'posix':  # macOS or Linux
                 result = subprocess.run(["lpstat", "-p", address], 
                                       capture_output=True, text=True, timeout=5)
                 connected = result.returncode == 0
-                print(f"lpstat connection test result: {connected}")
+                logger.debug("lpstat connection test result: %s", connected)
                 return connected
             else:  # Windows
                 # For Windows, use wmic to check printer existence
@@ -23,18 +39,18 @@ def test_printer_connection(method, address, model):
                     capture_output=True, text=True, timeout=5
                 )
                 connected = address in result.stdout
-                print(f"wmic connection test result: {connected}")
+                logger.debug("wmic connection test result: %s", connected)
                 return connected
         except Exception as e:
             # Try an alternative check if the first method fails
-            print(f"Primary connection test failed: {e}")
+            logger.warning("Primary connection test failed: %s", e)
             try:
                 if os.name == 'posix':  # macOS or Linux
                     # Try a simple lp command with -o printer-info
                     result = subprocess.run(["lp", "-d", address, "-o", "printer-info"],
                                           capture_output=True, text=True, timeout=5)
                     connected = "no such printer" not in result.stderr.lower()
-                    print(f"Alternative connection test result: {connected}")
+                    logger.debug("Alternative connection test result: %s", connected)
                     return connected
                 else:  # Windows - Try PowerShell
                     result = subprocess.run(
@@ -42,13 +58,39 @@ def test_printer_connection(method, address, model):
                         capture_output=True, text=True, timeout=5
                     )
                     connected = result.returncode == 0
-                    print(f"PowerShell connection test result: {connected}")
+                    logger.debug("PowerShell connection test result: %s", connected)
                     return connected
             except Exception as e2:
-                print(f"Alternative connection test failed: {e2}")
+                logger.warning("Alternative connection test failed: %s", e2)
                 return False
     
-    print("No valid connection method specified")
+    elif method == "network":
+        # Brother printers accept raw jobs on port 9100 - check we can open it
+        host, port = parse_tcp_identifier(address)
+        logger.debug("Testing connection to network printer: %s:%s", host, port)
+        try:
+            with socket.create_connection((host, port), timeout=5):
+                pass
+            return True
+        except OSError as e:
+            logger.warning("Network connection test failed: %s", e)
+            return False
+    elif method == "usb":
+        # Look for the printer among the USB devices brother_ql can see
+        if not BROTHER_QL_AVAILABLE:
+            logger.warning("brother_ql is not installed, USB printers are unavailable")
+            return False
+        try:
+            devices = backend_factory("pyusb")["list_available_devices"]()
+        except Exception as e:
+            logger.warning("USB connection test failed: %s", e)
+            return False
+        identifier = address if address.startswith("usb://") else f"usb://{address}"
+        connected = any(d["identifier"].startswith(identifier) for d in devices)
+        logger.debug("USB connection test result: %s", connected)
+        return connected
+    
+    logger.warning("No valid connection method specified")
     return False
 
 def create_print_function(printer_config):
@@ -117,7 +159,7 @@ def update_print_module(printer_config):
     # Ensure the printer_manager directory exists
     os.makedirs("printer_manager", exist_ok=True)
     
-    print(f"Updating print_module.py with printer: {printer_config.get('address', 'None')}")
+    logger.info("Updating print_module.py with printer: %s", printer_config.get('address', 'None'))
     
     with open("printer_manager/print_module.py", "w") as f:
         f.write("""
@@ -127,7 +169,7 @@ import subprocess
 
 """ + create_print_function(printer_config))
     
-    print(f"print_module.py updated successfully")
+    logger.info("print_module.py updated successfully")
 
     # Create init file if it doesn't exist
     init_path = "printer_manager/__init__.py"
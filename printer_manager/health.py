@@ -0,0 +1,120 @@
+# health.py
+import logging
+import threading
+import time
+
+from printer_manager.connection import test_printer_connection
+
+logger = logging.getLogger(__name__)
+
+
+class HealthMonitor:
+    """
+    Probes known printers in the background and caches the results.
+
+    Each watched printer is probed on its own schedule with `probe`
+    (defaults to test_printer_connection). Readers only ever look at the
+    cache, so checking the status of a printer never spawns a subprocess.
+    Callbacks registered with `on_change` are invoked with
+    (address, connected) whenever a probe result differs from the last one.
+    """
+
+    def __init__(self, probe=test_printer_connection, interval=10, ttl=30):
+        self.probe = probe
+        self.interval = interval
+        self.ttl = ttl
+        self._printers = {}
+        self._results = {}
+        self._callbacks = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start the background probe thread (idempotent)"""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="printer-health", daemon=True)
+            self._thread.start()
+
+    def on_change(self, callback):
+        self._callbacks.append(callback)
+
+    def watch(self, method, address, model, interval=None):
+        """
+        Add a printer to the probe schedule.
+
+        Args:
+            method (str): Connection method
+            address (str): Printer name/address
+            model (str): Printer model
+            interval (float, optional): Seconds between probes for this printer
+        """
+        interval = interval or self.interval
+        with self._lock:
+            # Don't re-probe straight away if we already have a fresh result
+            result = self._results.get(address)
+            self._printers[address] = {
+                "method": method,
+                "model": model,
+                "interval": interval,
+                "next_due": result["checked_at"] + interval if result else 0,
+            }
+        self.start()
+        self._wakeup.set()
+
+    def unwatch(self, address):
+        with self._lock:
+            self._printers.pop(address, None)
+            self._results.pop(address, None)
+
+    def record(self, address, connected):
+        """Store a probe result obtained elsewhere (e.g. during connect)"""
+        now = time.time()
+        with self._lock:
+            previous = self._results.get(address)
+            self._results[address] = {"connected": connected, "checked_at": now}
+            printer = self._printers.get(address)
+            if printer:
+                printer["next_due"] = now + printer["interval"]
+        if previous is None or previous["connected"] != connected:
+            for callback in self._callbacks:
+                try:
+                    callback(address, connected)
+                except Exception as e:
+                    logger.error("Error in printer health callback: %s", e)
+
+    def get(self, address):
+        """
+        Return the cached probe result for a printer.
+
+        Returns:
+            dict or None: `connected`, `checked_at`, `age` and `stale`
+                (older than the TTL), or None if never probed
+        """
+        with self._lock:
+            result = self._results.get(address)
+        if result is None:
+            return None
+        age = time.time() - result["checked_at"]
+        return dict(result, age=age, stale=age > self.ttl)
+
+    def _run(self):
+        while True:
+            now = time.time()
+            with self._lock:
+                due = [(a, dict(p)) for a, p in self._printers.items() if p["next_due"] <= now]
+            for address, printer in due:
+                try:
+                    connected = bool(self.probe(printer["method"], address, printer["model"]))
+                except Exception as e:
+                    logger.warning("Health probe for %s failed: %s", address, e)
+                    connected = False
+                self.record(address, connected)
+
+            with self._lock:
+                next_due = min((p["next_due"] for p in self._printers.values()), default=None)
+            timeout = self.interval if next_due is None else max(0.0, next_due - time.time())
+            self._wakeup.wait(timeout)
+            self._wakeup.clear()
@@ -0,0 +1,139 @@
+# pool.py
+import threading
+import time
+from collections import deque
+
+# Window used to compute each printer's throughput
+THROUGHPUT_WINDOW = 60
+
+
+class PrinterPool:
+    """
+    The set of printers jobs can be dispatched to.
+
+    Each printer tracks its health (fed from the health monitor), how many
+    jobs are currently assigned to it and how many it has completed, so
+    jobs can go to the least-loaded healthy printer.
+    """
+
+    def __init__(self):
+        self._printers = {}
+        self._lock = threading.Lock()
+
+    def add(self, method, address, model, healthy=True):
+        with self._lock:
+            printer = self._printers.get(address)
+            if printer is None:
+                printer = {
+                    "address": address,
+                    "queue_depth": 0,
+                    "printed": 0,
+                    "failed": 0,
+                    "last_print_at": None,
+                    "completions": deque(),
+                }
+                self._printers[address] = printer
+            printer.update(method=method, model=model, healthy=healthy)
+
+    def remove(self, address):
+        with self._lock:
+            return self._printers.pop(address, None) is not None
+
+    def set_health(self, address, healthy):
+        with self._lock:
+            if address in self._printers:
+                self._printers[address]["healthy"] = healthy
+
+    def __contains__(self, address):
+        with self._lock:
+            return address in self._printers
+
+    def __len__(self):
+        with self._lock:
+            return len(self._printers)
+
+    def config(self):
+        """Connection settings of all printers, for persisting"""
+        with self._lock:
+            return [self._settings(p) for p in self._printers.values()]
+
+    def healthy_count(self):
+        with self._lock:
+            return sum(1 for p in self._printers.values() if p["healthy"])
+
+    def choose(self, exclude=()):
+        """
+        Return the least-loaded healthy printer without assigning a job to it.
+
+        Args:
+            exclude (iterable): Addresses not to consider, e.g. printers
+                that already failed this job
+
+        Returns:
+            dict or None: method, address and model of the chosen printer,
+                or None if no healthy printer is available
+        """
+        with self._lock:
+            printer = self._least_loaded(exclude)
+            return self._settings(printer) if printer else None
+
+    def acquire(self, exclude=()):
+        """Like choose(), but counts a job against the printer until release()"""
+        with self._lock:
+            printer = self._least_loaded(exclude)
+            if printer is None:
+                return None
+            printer["queue_depth"] += 1
+            return self._settings(printer)
+
+    def release(self, address, success):
+        """Record the outcome of a job assigned with acquire()"""
+        now = time.time()
+        with self._lock:
+            printer = self._printers.get(address)
+            if printer is None:
+                return
+            printer["queue_depth"] = max(0, printer["queue_depth"] - 1)
+            if success:
+                printer["printed"] += 1
+                printer["last_print_at"] = now
+                printer["completions"].append(now)
+            else:
+                printer["failed"] += 1
+            self._trim(printer, now)
+
+    def stats(self):
+        """Per-printer health, queue depth and throughput"""
+        now = time.time()
+        with self._lock:
+            result = []
+            for p in self._printers.values():
+                self._trim(p, now)
+                result.append({
+                    "method": p["method"],
+                    "address": p["address"],
+                    "model": p["model"],
+                    "healthy": p["healthy"],
+                    "queue_depth": p["queue_depth"],
+                    "printed": p["printed"],
+                    "failed": p["failed"],
+                    "last_print_at": p["last_print_at"],
+                    "labels_per_minute": len(p["completions"]) * 60 / THROUGHPUT_WINDOW,
+                })
+            return result
+
+    def _least_loaded(self, exclude):
+        candidates = [
+            p for p in self._printers.values()
+            if p["healthy"] and p["address"] not in exclude
+        ]
+        return min(candidates, key=lambda p: p["queue_depth"], default=None)
+
+    @staticmethod
+    def _settings(printer):
+        return {"method": printer["method"], "address": printer["address"], "model": printer["model"]}
+
+    def _trim(self, printer, now):
+        completions = printer["completions"]
+        while completions and completions[0] < now - THROUGHPUT_WINDOW:
+            completions.popleft()
@@ -0,0 +1,117 @@
+# profiles.py
+import time
+
+
+class OptionProfiles:
+    """
+    Remembers which `lp` option set each printer accepted.
+
+    The option set that last worked for a printer is tried first on the
+    next label, so a printer that only accepts one of the alternatives
+    doesn't pay for the failed attempts every time. The profile is dropped
+    as soon as its option set fails, and relearned from the default order.
+
+    Printers that rejected a merged (multi-page PDF) job are remembered
+    too, so their labels are sent one at a time from then on.
+
+    Profiles are kept in a StateStore under `key`, so they survive
+    restarts and are shared by all server processes. The store is only
+    written when a profile changes, not for every label.
+    """
+
+    def __init__(self, store, key="lp_profiles"):
+        self.store = store
+        self.key = key
+        self.merge_key = key + "_merge_rejected"
+
+    def get(self, address):
+        """
+        Returns:
+            dict or None: `options`, `learned_at` and `skipped_attempts`
+                (the option sets that failed before this one was learned,
+                which each later label no longer tries)
+        """
+        return self.all().get(address)
+
+    def all(self):
+        return self.store.get(self.key, {})
+
+    def order(self, address, option_sets):
+        """Return `option_sets` with the printer's remembered option set first"""
+        profile = self.get(address)
+        if profile is None or profile["options"] not in option_sets:
+            return list(option_sets)
+        preferred = profile["options"]
+        return [preferred] + [options for options in option_sets if options != preferred]
+
+    def record_success(self, address, options, attempts=1):
+        """Remember `options` for the printer if it isn't already its profile"""
+        profile = self.get(address)
+        if profile is not None and profile["options"] == options:
+            return
+
+        def change(profiles):
+            profiles[address] = {
+                "options": list(options),
+                "learned_at": time.time(),
+                "skipped_attempts": attempts - 1,
+            }
+            return profiles
+
+        self.store.update(self.key, change, {})
+
+    def record_failure(self, address, options):
+        """Forget the printer's profile if its remembered option set failed"""
+        profile = self.get(address)
+        if profile is None or profile["options"] != options:
+            return
+        self.reset(address)
+
+    def merges(self, address):
+        """Whether the printer may get several labels as one merged job"""
+        return address not in self.store.get(self.merge_key, {})
+
+    def record_merge_rejected(self, address):
+        """Stop merging labels for a printer that rejected a merged job"""
+        if not self.merges(address):
+            return
+
+        def change(rejected):
+            rejected[address] = time.time()
+            return rejected
+
+        self.store.update(self.merge_key, change, {})
+
+    def reset(self, address=None):
+        """
+        Forget the profile of one printer, or of all printers.
+
+        Returns:
+            bool: Whether there was anything to forget
+        """
+        return self._forget(self.key, address)
+
+    def reset_merges(self, address=None):
+        """
+        Send merged jobs again to one printer, or to all printers, that
+        rejected them. Unlike the option profile, this isn't forgotten
+        when a single label fails.
+
+        Returns:
+            bool: Whether there was anything to forget
+        """
+        return self._forget(self.merge_key, address)
+
+    def _forget(self, key, address):
+        removed = []
+
+        def change(entries):
+            if address is None:
+                removed.extend(entries)
+                return {}
+            if entries.pop(address, None) is not None:
+                removed.append(address)
+            return entries
+
+        self.store.update(key, change, {})
+        return bool(removed)
@@ -1,42 +1,121 @@
 # scanner.py
+import logging
 import os
 import subprocess
 import json
 import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-def get_system_printers():
-    """Get list of printers installed in the system"""
+logger = logging.getLogger(__name__)
+
+
+# Timeout for each discovery command; lpinfo probes network backends and is slower
+SCAN_TIMEOUT = float(os.environ.get("PRINTER_SCAN_TIMEOUT", 5))
+LPINFO_TIMEOUT = float(os.environ.get("PRINTER_LPINFO_TIMEOUT", 15))
+
+# How long a scan result is served before it is refreshed in the background
+SCAN_CACHE_TTL = float(os.environ.get("PRINTER_SCAN_CACHE_TTL", 60))
+
+# Maximum number of lpoptions probes run at the same time
+PROBE_WORKERS = 8
+
+_scan_cache = {"devices": None, "scanned_at": None}
+_scan_lock = threading.Lock()
+_refreshing = threading.Event()
+
+
+def get_system_printers(refresh=False):
+    """
+    Get list of printers installed in the system.
+    
+    Results are cached. Once the cache is older than SCAN_CACHE_TTL the
+    cached devices are still returned immediately while a rescan runs in
+    the background. Only the very first scan (or refresh=True) blocks.
+    
+    Args:
+        refresh (bool): Rescan now instead of using the cache
+    
+    Returns:
+        list: Devices with `name`, `address` and `type`
+    """
+    devices = _scan_cache["devices"]
+    if refresh or devices is None:
+        return _rescan()
+    
+    if time.time() - _scan_cache["scanned_at"] > SCAN_CACHE_TTL:
+        refresh_in_background()
+    return devices
+
+
+def get_scan_info():
+    """When the cached scan was taken and whether a rescan is running"""
+    return {"scanned_at": _scan_cache["scanned_at"], "refreshing": _refreshing.is_set()}
+
+
+def refresh_in_background():
+    """Start a background rescan unless one is already running"""
+    with _scan_lock:
+        if _refreshing.is_set():
+            return
+        _refreshing.set()
+    threading.Thread(target=_background_rescan, name="printer-scan", daemon=True).start()
+
+
+def _background_rescan():
+    try:
+        _rescan()
+    finally:
+        _refreshing.clear()
+
+
+def _rescan():
+    devices = scan_system_printers()
+    _scan_cache["devices"] = devices
+    _scan_cache["scanned_at"] = time.time()
+    return devices
+
+
+def _is_brother_printer(printer_name):
+    """Check the printer's options for signs of a Brother QL (optional)"""
+    try:
+        info_result = subprocess.run(["lpoptions", "-p", printer_name, "-l"], 
+                                  capture_output=True, text=True, timeout=SCAN_TIMEOUT)
+        return "brother" in info_result.stdout.lower() or "ql" in info_result.stdout.lower()
+    except:
+        return False
+
+
+def scan_system_printers():
+    """Scan the system for installed printers, bypassing the cache"""
     devices = []
     
     try:
         if os.name == 'posix':  # macOS or Linux
             if 'darwin' in os.sys.platform:  # macOS
                 # Use lpstat to get printer list on macOS
-                result = subprocess.run(["lpstat", "-p"], capture_output=True, text=True)
+                result = subprocess.run(["lpstat", "-p"], capture_output=True, text=True,
+                                        timeout=SCAN_TIMEOUT)
                 if result.returncode == 0:
-                    for line in result.stdout.splitlines():
-                        if line.startswith("printer "):
-                            # Extract printer name
-                            printer_name = line.split()[1]
-                            
-                            # Check if it's a Brother printer (optional)
-                            is_brother = False
-                            try:
-                                info_result = subprocess.run(["lpoptions", "-p", printer_name, "-l"], 
-                                                          capture_output=True, text=True)
-                                if "brother" in info_result.stdout.lower() or "ql" in info_result.stdout.lower():
-                                    is_brother = True
-                            except:
-                                pass
-                            
-                            devices.append({
-                                'name': f"System Printer: {printer_name}" + (" (Brother)" if is_brother else ""),
-                                'address': printer_name,  # Use printer name as the address
-                                'type': 'system'
-                            })
+                    # Extract printer names
+                    printer_names = [line.split()[1] for line in result.stdout.splitlines()
+                                     if line.startswith("printer ")]
+                    
+                    # Check which ones are Brother printers, all at the same time
+                    with ThreadPoolExecutor(max_workers=PROBE_WORKERS) as executor:
+                        brother_flags = list(executor.map(_is_brother_printer, printer_names))
+                    
+                    for printer_name, is_brother in zip(printer_names, brother_flags):
+                        devices.append({
+                            'name': f"System Printer: {printer_name}" + (" (Brother)" if is_brother else ""),
+                            'address': printer_name,  # Use printer name as the address
+                            'type': 'system'
+                        })
             else:  # Linux
                 # Use lpstat for Linux as well
-                result = subprocess.run(["lpstat", "-a"], capture_output=True, text=True)
+                result = subprocess.run(["lpstat", "-a"], capture_output=True, text=True,
+                                        timeout=SCAN_TIMEOUT)
                 if result.returncode == 0:
                     for line in result.stdout.splitlines():
                         if " accepting requests" in line:
@@ -50,7 +129,8 @@ def get_system_printers():
                 # If no printers found with lpstat, try CUPS method
                 if not devices:
                     try:
-                        result = subprocess.run(["lpinfo", "-v"], capture_output=True, text=True)
+                        result = subprocess.run(["lpinfo", "-v"], capture_output=True, text=True,
+                                                timeout=LPINFO_TIMEOUT)
                         if result.returncode == 0:
                             for line in result.stdout.splitlines():
                                 if "://" in line:  # It's a printer URI
@@ -70,7 +150,7 @@ def get_system_printers():
             try:
                 result = subprocess.run(
                     ["wmic", "printer", "get", "name"],
-                    capture_output=True, text=True, timeout=5
+                    capture_output=True, text=True, timeout=SCAN_TIMEOUT
                 )
                 if result.returncode == 0:
                     for line in result.stdout.splitlines()[1:]:  # Skip header
@@ -86,7 +166,7 @@ def get_system_printers():
                 try:
                     result = subprocess.run(
                         ["powershell", "-Command", "Get-Printer | Format-Table Name"],
-                        capture_output=True, text=True, timeout=5
+                        capture_output=True, text=True, timeout=SCAN_TIMEOUT
                     )
                     if result.returncode == 0:
                         for line in result.stdout.splitlines()[3:]:  # Skip header
@@ -100,6 +180,6 @@ def get_system_printers():
                 except:
                     pass
     except Exception as e:
-        print(f"Error getting system printers: {e}")
+        logger.warning("Error getting system printers: %s", e)
     
     return devices
\ No newline at end of file
@@ -1,22 +1,50 @@
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, Response, request, jsonify, render_template, stream_with_context
 from flask_cors import CORS
+import logging
 import os
+import re
 import time
 from functions import (
-    create_simple_label,
-    print_name,
+    ARCHIVE_LABELS,
+    FONT_PATH,
+    archive_label,
+    check_color_mode,
+    encode_label,
+    font_file_hash,
+    label_archive,
     load_printer_state,
+    lp_profiles,
+    printer_state_store,
 )
-from printer_manager.scanner import get_system_printers
+from attendees import AttendeeList
+from batch import Batch, parse_attendees
+from events import EventBus
+from job_journal import JobJournal
+from job_queue import JobQueue, QueueClosedError, QueueFullError
+from label_cache import LabelCache
+from label_templates import (
+    TemplateError,
+    get_template,
+    list_templates,
+    preview_params,
+    render_params,
+    resolve_params,
+)
+from logging_config import configure_logging
+from metrics import JOBS, PRINT_BATCH_SIZE, STAGE_SECONDS, Gauge, render_metrics, span
+from printer_manager.scanner import get_scan_info, get_system_printers
+from printer_manager.backends import get_backend
 from printer_manager.connection import test_printer_connection
+from printer_manager.health import HealthMonitor
+from printer_manager.pool import PrinterPool
 
+configure_logging()
+logger = logging.getLogger(__name__)
 
 # Initialize Flask
 app = Flask(__name__)
-CORS(app)
-
-# Global printer connection state - persistent across app restarts
-printer_state_file = "printer_state.json"
+# The preview reports the layout it resolved in headers the test page reads
+CORS(app, expose_headers=["X-Label-Layout", "X-Label-Font-Size"])
 
 # Default printer state
 default_printer_state = {
@@ -29,52 +57,158 @@ default_printer_state = {
 }
 
 
-# Save printer state to file
-def save_printer_state(state):
-    try:
-        with open(printer_state_file, "w") as f:
-            import json
+# Initialize global printer state
+printer_state = load_printer_state()
 
-            json.dump(state, f)
-    except Exception as e:
-        print(f"Error saving printer state: {e}")
+# Server-Sent Events fan-out for printer and job updates
+event_bus = EventBus()
 
 
-# Initialize global printer state
-printer_state = load_printer_state()
+def publish_printer_state():
+    """Push the printer state to event subscribers if it changed"""
+    event_bus.publish("printer", printer_state, key="printer")
+
+
+# Background printer liveness probes - the status endpoint only reads this cache
+health_monitor = HealthMonitor(
+    interval=float(os.environ.get("PRINTER_PROBE_INTERVAL", 10)),
+    ttl=float(os.environ.get("PRINTER_STATUS_TTL", 30)),
+)
+
+
+# Printers jobs are dispatched to, restored from the saved state
+printer_pool = PrinterPool()
+
+
+def saved_printers(state):
+    """The printer list of a saved state"""
+    printers = state.get("printers")
+    if printers is None and state.get("address"):
+        # State saved before printer pools existed
+        printers = [
+            {
+                "method": state.get("method") or "system",
+                "address": state["address"],
+                "model": state.get("model", "QL-820NWB"),
+            }
+        ]
+    return printers or []
+
+
+def sync_printer_pool(state, healthy=True):
+    """
+    Add and remove printers so the pool matches the saved printer list,
+    which other server processes may have changed.
+    """
+    printers = {p["address"]: p for p in saved_printers(state)}
+    for current in printer_pool.config():
+        if current["address"] not in printers:
+            printer_pool.remove(current["address"])
+            health_monitor.unwatch(current["address"])
+    for address, saved in printers.items():
+        if address not in printer_pool:
+            printer_pool.add(saved["method"], address, saved["model"], healthy=healthy)
+            health_monitor.watch(saved["method"], address, saved["model"])
+
+
+def set_printer_state(state):
+    """Replace the in-memory printer state and tell subscribers"""
+    printer_state.clear()
+    printer_state.update(state)
+    publish_printer_state()
+
+
+def update_printer_state(change=None):
+    """
+    Save the printer state, deriving the connection summary from the pool.
+
+    `change`, if given, modifies the saved state first. It runs inside
+    the store's write transaction together with the summary, so printers
+    added or removed by other server processes are never overwritten.
+    """
+
+    def apply(state):
+        if change is not None:
+            change(state)
+        sync_printer_pool(state)
+
+        total = len(printer_pool)
+        healthy = printer_pool.healthy_count()
+        state["printers"] = printer_pool.config()
+        state["connected"] = healthy > 0
+
+        if total == 0:
+            state["status"] = "Not connected"
+        elif total == 1:
+            method = state.get("method") or "system"
+            state["status"] = f"Connected via {method.upper()}" if healthy else "Printer disconnected"
+        else:
+            state["status"] = f"{healthy} of {total} printers online"
+        return state
+
+    set_printer_state(printer_state_store.update("printer", apply, default=default_printer_state))
+
+
+def handle_health_change(address, connected):
+    """Keep the printer pool and global state in sync with the health monitor"""
+    if address not in printer_pool:
+        return
+    printer_pool.set_health(address, connected)
+    update_printer_state()
+
+
+def handle_state_change(key, state):
+    """Pick up printer state saved by another server process"""
+    if key != "printer":
+        return
+    sync_printer_pool(state)
+    set_printer_state(state)
+
+
+sync_printer_pool(printer_state, healthy=printer_state.get("connected", False))
+health_monitor.on_change(handle_health_change)
+printer_state_store.on_change(handle_state_change)
 
 
 # API routes for printer connection management
 @app.route("/api/printer/status", methods=["GET"])
 def get_printer_status():
-    global printer_state
-
-    # Verify connection is still valid
-    if printer_state.get("connected", False) and printer_state.get("address"):
-        if not test_printer_connection(
-            printer_state.get("method", "system"),
-            printer_state.get("address"),
-            printer_state.get("model", "QL-820NWB"),
-        ):
-            # Connection is no longer valid
-            printer_state["connected"] = False
-            printer_state["status"] = "Printer disconnected"
-            save_printer_state(printer_state)
+    # Only touches the database if another process changed the state
+    status = printer_state_store.get("printer", printer_state)
+    health = health_monitor.get(printer_state.get("address"))
+    status["checked_at"] = health["checked_at"] if health else None
+    status["stale"] = health["stale"] if health else True
 
-    return jsonify(printer_state)
+    response = jsonify(status)
+    # The body only changes when a probe result or the state changes, so
+    # pollers that send If-None-Match get an empty 304 in the common case
+    response.add_etag()
+    response.cache_control.no_cache = True
+    if health:
+        response.headers["Age"] = str(int(health["age"]))
+    return response.make_conditional(request)
+
+
+@app.route("/api/events", methods=["GET"])
+def stream_events():
+    """Stream printer state and job progress as Server-Sent Events"""
+    initial = [("printer", printer_state)]
+    return Response(
+        event_bus.stream(initial),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @app.route("/api/printer/scan/system", methods=["POST"])
 def handle_scan_system():
-    """Get all printers installed in the system"""
-    devices = get_system_printers()
-    return jsonify({"devices": devices})
+    """Get all printers installed in the system, from the scan cache when possible"""
+    devices = get_system_printers(refresh=request.args.get("refresh") == "1")
+    return jsonify(dict(get_scan_info(), devices=devices))
 
 
 @app.route("/api/printer/connect", methods=["POST"])
 def handle_connect():
-    global printer_state
-
     data = request.get_json()
 
     if "address" not in data or "method" not in data:
@@ -84,25 +218,427 @@ def handle_connect():
     address = data["address"]
 
     printer_state["status"] = f"Connecting to {method} printer at {address}..."
+    publish_printer_state()
 
-    if test_printer_connection(method, address, printer_state["model"]):
-        printer_state["connected"] = True
-        printer_state["method"] = method
-        printer_state["address"] = address
-        printer_state["status"] = f"Connected via {method.upper()}"
-        printer_state["last_attempt"] = time.time()
+    model = printer_state.get("model", "QL-820NWB")
+    if test_printer_connection(method, address, model):
+        health_monitor.record(address, True)
 
-        # Save the state
-        save_printer_state(printer_state)
+        def connect(state):
+            # Add the printer to the pool; previously connected printers stay in it
+            printers = [p for p in saved_printers(state) if p["address"] != address]
+            state["printers"] = printers + [{"method": method, "address": address, "model": model}]
+            state["method"] = method
+            state["address"] = address
+            state["last_attempt"] = time.time()
+
+        update_printer_state(connect)
     else:
-        printer_state["connected"] = False
-        printer_state["status"] = f"Failed to connect to {method} printer at {address}"
-        printer_state["last_attempt"] = time.time()
-        save_printer_state(printer_state)
+
+        def fail(state):
+            state["connected"] = printer_pool.healthy_count() > 0
+            state["status"] = f"Failed to connect to {method} printer at {address}"
+            state["last_attempt"] = time.time()
+            return state
+
+        set_printer_state(printer_state_store.update("printer", fail, default=default_printer_state))
 
     return jsonify(printer_state)
 
 
+@app.route("/api/printers", methods=["GET"])
+def list_printers():
+    """Health, queue depth and throughput of every printer in the pool"""
+    printers = printer_pool.stats()
+    profiles = lp_profiles.all()
+    for printer in printers:
+        health = health_monitor.get(printer["address"])
+        printer["checked_at"] = health["checked_at"] if health else None
+        printer["profile"] = profiles.get(printer["address"])
+        printer["merges"] = lp_profiles.merges(printer["address"])
+    return jsonify({"printers": printers})
+
+
+@app.route("/api/printers/<path:address>", methods=["DELETE"])
+def remove_printer(address):
+    """Take a printer out of the pool"""
+    if address not in printer_pool:
+        return jsonify({"error": "Printer not found"}), 404
+
+    def remove(state):
+        state["printers"] = [p for p in saved_printers(state) if p["address"] != address]
+        if state.get("address") == address:
+            # Show one of the remaining printers as the current one
+            remaining = state["printers"]
+            state["method"] = remaining[-1]["method"] if remaining else None
+            state["address"] = remaining[-1]["address"] if remaining else None
+
+    update_printer_state(remove)
+    lp_profiles.reset(address)
+    return jsonify(printer_state)
+
+
+@app.route("/api/printer/profiles", methods=["GET"])
+def list_printer_profiles():
+    """The lp option set each printer last accepted"""
+    return jsonify({"profiles": lp_profiles.all()})
+
+
+@app.route("/api/printer/profiles/<path:address>", methods=["GET"])
+def get_printer_profile(address):
+    profile = lp_profiles.get(address)
+    if profile is None:
+        return jsonify({"error": "No profile for this printer"}), 404
+    return jsonify(profile)
+
+
+@app.route("/api/printer/profiles", methods=["DELETE"])
+@app.route("/api/printer/profiles/<path:address>", methods=["DELETE"])
+def reset_printer_profiles(address=None):
+    """
+    Forget the remembered lp options of one printer, or of all printers,
+    and send them merged jobs again if they rejected them before
+    """
+    forgot_profile = lp_profiles.reset(address)
+    forgot_merges = lp_profiles.reset_merges(address)
+    if not (forgot_profile or forgot_merges) and address is not None:
+        return jsonify({"error": "No profile for this printer"}), 404
+    return jsonify({"profiles": lp_profiles.all()})
+
+
+# --- Print queue ---
+# Print-ready payloads of recent labels, for repeats and reprints
+label_cache = LabelCache(max_bytes=int(os.environ.get("LABEL_CACHE_MB", 64)) * 1024 * 1024)
+
+
+def label_cache_key(params, backend_name, model):
+    """Cache key for the print-ready payload of a label"""
+    template = params.get("template")
+    return LabelCache.make_key(
+        first_name=params["first_name"],
+        last_name=params["last_name"],
+        layout=params["layout"],
+        font_size=params["font_size"],
+        width=params["width"],
+        height=params["height"],
+        font=font_file_hash(FONT_PATH),
+        template=template,
+        template_digest=get_template(template).digest if template else None,
+        color_mode=check_color_mode(params.get("color_mode")),
+        backend=backend_name,
+        model=model,
+    )
+
+
+def render_job_image(job):
+    """Render the label image for a job's parameters"""
+    with span("draw", layout=job.params.get("layout") or ""):
+        return render_params(job.params)
+
+
+def prepare_payload(job, printer, image=None):
+    """
+    Get the print-ready payload of a job's label for a printer.
+
+    Payloads are cached by content, so repeat and reprinted labels skip
+    layout and conversion entirely.
+
+    Returns:
+        tuple: (backend, payload, image); image is None on a cache hit
+            unless one was passed in
+    """
+    backend = get_backend(printer["method"], printer["address"], printer["model"], profiles=lp_profiles)
+    key = label_cache_key(job.params, backend.name, printer["model"])
+    job.result["cache_key"] = key
+
+    payload = label_cache.get(key)
+    job.result["cached"] = payload is not None
+    if payload is None:
+        if image is None:
+            image = render_job_image(job)
+        with span("encode", printer=printer["address"], layout=job.params.get("layout") or ""):
+            payload = backend.prepare(image)
+        label_cache.put(key, payload)
+    return backend, payload, image
+
+
+def render_job(job):
+    """
+    Render the label for a queued job and convert it for the printer.
+
+    The job is assigned to the least-loaded healthy printer in the pool.
+    Everything stays in memory; the conversion for that printer's backend
+    (PNG for lp, raster instructions for brother_ql) happens once here.
+    """
+    # Fit the name here rather than on the request thread
+    with span("layout") as labels:
+        resolved = resolve_params(job.params)
+        labels["layout"] = resolved.get("layout") or ""
+    with job.lock:
+        job.params = resolved
+
+    printer = printer_pool.acquire()
+    job.result["printer"] = printer["address"] if printer else None
+    if printer is None:
+        return {"printer": None, "image": None}
+
+    try:
+        backend, payload, image = prepare_payload(job, printer)
+    except Exception:
+        printer_pool.release(printer["address"], False)
+        raise
+    job.result["backend"] = backend.name
+    return {"printer": printer, "backend": backend, "payload": payload, "image": image}
+
+
+def archive_job(job, rendered):
+    """Keep a copy of the job's label in the label archive if archiving is on for it"""
+    if not job.params.get("archive", ARCHIVE_LABELS):
+        return
+    if rendered["image"] is None:
+        rendered["image"] = render_job_image(job)
+    job.result["archive_hash"] = archive_label(
+        encode_label(rendered["image"]),
+        job.params["first_name"],
+        job.params["last_name"],
+        job_id=job.id,
+        event=job.params.get("event"),
+    )
+
+
+def print_job(job, rendered):
+    """
+    Send a rendered label to its printer, failing over to the other
+    healthy printers in the pool if it can't be printed there.
+    """
+    archive_job(job, rendered)
+    return send_job(job, rendered)
+
+
+def send_job(job, rendered, failed=False):
+    """
+    Send a job's label on its own, with failover (print_job without archiving).
+
+    Args:
+        failed (bool): The label's printer just failed to take it as part
+            of a merged job, so fail over without sending it there again
+    """
+    printer = rendered["printer"]
+    image = rendered["image"]
+
+    if printer is None:
+        job.result["error"] = "No printer connected"
+        return False
+
+    backend, payload = rendered["backend"], rendered["payload"]
+    tried = []
+    while True:
+        address = printer["address"]
+        tried.append(address)
+        job.result["printer"] = address
+        job.result["backend"] = backend.name
+        logger.debug("Printing job %s on printer %s via %s", job.id, address, backend.name)
+
+        success = False
+        try:
+            if not failed:
+                success = backend.send(payload)
+        finally:
+            printer_pool.release(address, success)
+        failed = False
+        if success:
+            return True
+
+        # Take the printer out of rotation until the health monitor sees it again
+        health_monitor.record(address, False)
+        printer = printer_pool.acquire(exclude=tried)
+        if printer is None:
+            job.result["error"] = f"Print failed on {', '.join(tried)}"
+            return False
+        job.result["failed_over_from"] = list(tried)
+        try:
+            backend, payload, image = prepare_payload(job, printer, image)
+        except Exception:
+            printer_pool.release(printer["address"], False)
+            raise
+
+
+def print_jobs(jobs, rendered):
+    """
+    Send several rendered labels, merging the ones going to the same
+    printer into a single print job.
+
+    If a printer's backend can't merge labels or the merged job fails,
+    its labels are sent one by one instead (with failover), so every
+    label's success is still known.
+
+    Returns:
+        list: True or False per job
+    """
+    results = [False] * len(jobs)
+    # Jobs still holding the printer they were assigned; send_job releases
+    # it from then on, and anything left when an error ends the batch
+    # early is released below
+    assigned = {i for i, labels in enumerate(rendered) if labels["printer"] is not None}
+    try:
+        by_printer = {}
+        for index, (job, labels) in enumerate(zip(jobs, rendered)):
+            archive_job(job, labels)
+            if labels["printer"] is None:
+                results[index] = send_job(job, labels)
+            else:
+                by_printer.setdefault(labels["printer"]["address"], []).append(index)
+
+        for address, indexes in by_printer.items():
+            merged = None
+            if len(indexes) > 1:
+                merged = send_merged([jobs[i] for i in indexes], [rendered[i] for i in indexes])
+            if merged:
+                for i in indexes:
+                    assigned.discard(i)
+                    printer_pool.release(address, True)
+                    results[i] = True
+                continue
+            for i in indexes:
+                assigned.discard(i)
+                results[i] = send_job(jobs[i], rendered[i], failed=merged is False)
+    finally:
+        for i in assigned:
+            printer_pool.release(rendered[i]["printer"]["address"], False)
+    return results
+
+
+def send_merged(jobs, rendered):
+    """
+    Print labels for the same printer as one job.
+
+    A printer that rejects a merged job isn't sent merged jobs again. If
+    the job couldn't be delivered at all, the printer is marked
+    disconnected so its labels fail over to other printers.
+
+    Returns:
+        bool or None: True if the merged job was accepted, False if
+            sending it failed and the printer should be skipped, None if
+            the labels weren't merged. The labels stay assigned to the
+            printer either way; the caller releases it
+    """
+    printer, backend = rendered[0]["printer"], rendered[0]["backend"]
+    address = printer["address"]
+    if not lp_profiles.merges(address):
+        return None
+    with span("merge", printer=address):
+        payload = backend.merge([labels["payload"] for labels in rendered])
+    if payload is None:
+        return None
+
+    logger.debug("Printing %d jobs on printer %s via %s as one job", len(jobs), address, backend.name)
+    # A merged job's options say nothing about single labels, so it
+    # doesn't touch the printer's lp profile
+    if not backend.send(payload, learn=False):
+        if backend.merge_changes_format:
+            logger.warning("Printer %s rejected a merged job of %d labels, no longer merging its labels",
+                           address, len(jobs))
+            lp_profiles.record_merge_rejected(address)
+            return None
+        logger.warning("Merged job of %d labels failed on %s, failing its labels over", len(jobs), address)
+        health_monitor.record(address, False)
+        return False
+    PRINT_BATCH_SIZE.observe(len(jobs), printer=address)
+    for job in jobs:
+        job.result.update(printer=address, backend=backend.name, merged=len(jobs))
+    return True
+
+
+print_queue = JobQueue(
+    render_job,
+    print_job,
+    workers=int(os.environ.get("PRINT_WORKERS", 2)),
+    max_queued=int(os.environ.get("PRINT_QUEUE_SIZE", 100)),
+    print_batch=print_jobs,
+    batch_size=int(os.environ.get("PRINT_BATCH_SIZE", 8)),
+    batch_wait=float(os.environ.get("PRINT_BATCH_WAIT_MS", 0)) / 1000,
+)
+print_queue.on_change(lambda job: event_bus.publish("job", job.to_dict()))
+
+
+def record_job_metrics(job):
+    """Count finished jobs and time their whole trip through the queue"""
+    if not job.finished:
+        return
+    with job.lock:
+        labels = {"printer": job.result.get("printer") or "", "layout": job.params.get("layout") or ""}
+        elapsed = job.timestamps[job.state] - job.timestamps["queued"]
+    JOBS.inc(state=job.state, **labels)
+    STAGE_SECONDS.observe(elapsed, stage="job", **labels)
+
+
+print_queue.on_change(record_job_metrics)
+
+Gauge("label_queue_pending", "Print jobs waiting for a worker", function=print_queue.pending)
+Gauge(
+    "label_printer_in_flight",
+    "Labels being printed per printer",
+    labels=("printer",),
+    function=lambda: {(p["address"],): p["queue_depth"] for p in printer_pool.stats()},
+)
+Gauge("label_cache_bytes", "Size of the cached label payloads", function=lambda: label_cache.size)
+
+# Durable record of print jobs, for replay after a restart and duplicate checks
+job_journal = JobJournal(
+    os.environ.get("JOB_JOURNAL", "print_journal.jsonl"),
+    sync=os.environ.get("JOB_JOURNAL_SYNC", "batch"),
+    flush_interval=float(os.environ.get("JOB_JOURNAL_FLUSH_MS", 50)) / 1000,
+    compact_bytes=int(float(os.environ.get("JOB_JOURNAL_COMPACT_MB", 16)) * 1024 * 1024),
+)
+print_queue.on_change(job_journal.record)
+
+# Prune archived labels from the start, not only once new labels arrive
+label_archive.start()
+
+# Registered attendees, searched by name at check-in
+attendee_list = AttendeeList(
+    os.environ.get("ATTENDEE_LIST", "attendees.csv"),
+    check_interval=float(os.environ.get("ATTENDEE_LIST_CHECK_MS", 1000)) / 1000,
+)
+
+# "allow" prints repeat labels and reports them, "reject" refuses them unless forced
+duplicate_policy = os.environ.get("DUPLICATE_LABELS", "allow")
+
+# Replay jobs that were queued or printing when the server last stopped
+for replay_id, replay_params in job_journal.unfinished():
+    try:
+        print_queue.submit(replay_params, job_id=replay_id)
+        logger.info("Replaying print job %s", replay_id)
+    except QueueFullError:
+        logger.warning("Print queue is full, not replaying job %s", replay_id)
+        job_journal.append(
+            {"op": "failed", "id": replay_id, "t": time.time(), "error": "Not replayed: print queue full"}
+        )
+
+
+def begin_shutdown():
+    """Stop taking print jobs and end event streams so open requests can finish"""
+    print_queue.close()
+    event_bus.close()
+
+
+def shutdown(timeout=None):
+    """
+    Shut down gracefully: finish the queued print jobs and flush the journal.
+
+    Jobs that are still unfinished after `timeout` seconds stay in the
+    journal and are replayed on the next start.
+    """
+    begin_shutdown()
+    pending = print_queue.pending()
+    if pending:
+        logger.info("Draining %d queued print jobs before shutting down", pending)
+    if not print_queue.shutdown(wait=True, timeout=timeout):
+        logger.warning("Print queue not drained in time; unfinished jobs will be replayed on restart")
+    label_archive.close()
+    job_journal.close()
+
+
 # --- Routes ---
 @app.route("/")
 def index():
@@ -117,72 +653,421 @@ def test():
 @app.route("/print-simple", methods=["POST"])
 def handle_print_simple():
     try:
-        global printer_state
-        data = request.get_json()
-
-        # Required parameters
-        if "first_name" not in data or "last_name" not in data:
-            return jsonify({"error": "Missing first or last name in request body"}), 400
-
-        first_name = data["first_name"]
-        last_name = data["last_name"]
-
-        # Optional parameters with defaults
-        layout = data.get("layout", "side_by_side")  # 'side_by_side' or 'stacked'
-        font_size = data.get("font_size", 300)
-        width = data.get("width", 731)  # 62mm at 300dpi
-        height = data.get("height", 300)
-
-        # Print debug info
-        print(f"Creating simple label for: {first_name} {last_name}")
-        print(f"Layout: {layout}, Font size: {font_size}")
-        print(f"Dimensions: {width}x{height}")
-        print(f"Using printer: {printer_state.get('address', 'Not connected')}")
-
-        # Create the label
-        image_path = create_simple_label(
-            first_name,
-            last_name,
-            layout=layout,
-            font_size=font_size,
-            width=width,
-            height=height,
-        )
+        with span("validate"):
+            data = request.get_json()
 
-        # Print the image - pass the printer address from the global state
-        printer_address = (
-            printer_state.get("address")
-            if printer_state.get("connected", False)
-            else None
-        )
-        print_success = print_name(image_path, printer_address)
+            # Required parameters
+            if "first_name" not in data or "last_name" not in data:
+                return jsonify({"error": "Missing first or last name in request body"}), 400
+
+            first_name = data["first_name"]
+            last_name = data["last_name"]
+
+            # Optional parameters with defaults
+            layout = data.get("layout", "side_by_side")  # 'side_by_side', 'stacked' or 'auto'
+            font_size = data.get("font_size", 300)  # a size or 'auto'
+            width = data.get("width", 731)  # 62mm at 300dpi
+            height = data.get("height", 300)
+            archive = data.get("archive", ARCHIVE_LABELS)
+            event = data.get("event")
+            template_name = data.get("template")
+            color_mode = check_color_mode(data.get("color_mode"))
+
+            if template_name:
+                # The template defines the label size and where the name goes;
+                # layout and font size default to the template's own settings
+                template = get_template(template_name)
+                width, height = template.width, template.height
+                layout = data.get("layout")
+                font_size = data.get("font_size")
+
+            # Check-in: has this attendee already got a label?
+            previous = job_journal.printed(first_name, last_name)
+            if previous and duplicate_policy == "reject" and not data.get("force"):
+                return jsonify({"error": "A label was already printed for this attendee", "duplicate": previous}), 409
+
+        logger.debug("Queueing simple label for %s %s: layout %s, font size %s, %sx%s",
+                     first_name, last_name, layout, font_size, width, height)
+
+        # Hand the job to the print workers and return immediately
+        with span("enqueue"):
+            job = print_queue.submit(
+                {
+                    "first_name": first_name,
+                    "last_name": last_name,
+                    "layout": layout,
+                    "font_size": font_size,
+                    "width": width,
+                    "height": height,
+                    "archive": archive,
+                    "event": event,
+                    "template": template_name,
+                    "color_mode": color_mode,
+                    # Resolved by the print worker, see render_job
+                    "auto_fit": bool(data.get("auto_fit")),
+                }
+            )
 
         return (
             jsonify(
                 {
-                    "message": "Print initiated",
-                    "success": print_success,
-                    "printer": printer_address,
-                    "data": {
-                        "first_name": first_name,
-                        "last_name": last_name,
-                        "image_path": image_path,
-                        "layout": layout,
-                        "font_size": font_size,
-                        "width": width,
-                        "height": height,
-                    },
+                    "message": "Print queued",
+                    "job_id": job.id,
+                    "status_url": f"/api/jobs/{job.id}",
+                    "data": job.params,
+                    "duplicate": previous,
                 }
             ),
-            200,
+            202,
         )
 
+    except ValueError as e:
+        # Unknown templates and color modes
+        return jsonify({"error": str(e)}), 400
+    except (QueueFullError, QueueClosedError) as e:
+        return jsonify({"error": str(e)}), 503
     except Exception as e:
-        print(f"Error in print-simple endpoint: {str(e)}")
+        logger.exception("Error in print-simple endpoint: %s", e)
         return jsonify({"error": str(e)}), 500
 
 
+# Largest label size and font size a preview is rendered for
+PREVIEW_MAX_SIZE = 5000
+
+
+@app.route("/api/preview", methods=["POST"])
+def handle_preview():
+    """
+    Render a downscaled preview of a label without printing it.
+
+    Takes the same JSON body as /print-simple and returns a PNG in the
+    label's color mode, built in memory with the same layout code, so the label stock, the
+    print queue and the disk are left alone. The resolved layout and font
+    size are sent in the X-Label-Layout and X-Label-Font-Size headers.
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        params = {
+            "first_name": str(data.get("first_name") or ""),
+            "last_name": str(data.get("last_name") or ""),
+            "layout": data.get("layout", "side_by_side"),
+            "font_size": data.get("font_size", 300),
+            "width": int(data.get("width", 731)),
+            "height": int(data.get("height", 300)),
+            "template": data.get("template"),
+            "auto_fit": bool(data.get("auto_fit")),
+            "color_mode": check_color_mode(data.get("color_mode")),
+        }
+        if params["template"]:
+            template = get_template(params["template"])
+            params["width"], params["height"] = template.width, template.height
+            params["layout"] = data.get("layout")
+            params["font_size"] = data.get("font_size")
+        if not (0 < params["width"] <= PREVIEW_MAX_SIZE and 0 < params["height"] <= PREVIEW_MAX_SIZE):
+            raise ValueError(f"Label size must be between 1 and {PREVIEW_MAX_SIZE} pixels")
+        if params["font_size"] not in (None, "auto"):
+            params["font_size"] = int(params["font_size"])
+            if not 0 < params["font_size"] <= PREVIEW_MAX_SIZE:
+                raise ValueError(f"Font size must be between 1 and {PREVIEW_MAX_SIZE}")
+
+        with span("preview") as labels:
+            params = resolve_params(params)
+            labels["layout"] = params["layout"]
+            png = encode_label(preview_params(params))
+    except ValueError as e:
+        # Unknown templates and color modes, malformed sizes
+        return jsonify({"error": str(e)}), 400
+
+    return Response(
+        png,
+        mimetype="image/png",
+        headers={
+            "Cache-Control": "no-store",
+            "X-Label-Layout": params["layout"],
+            "X-Label-Font-Size": str(params["font_size"]),
+        },
+    )
+
+
+@app.route("/api/reprint/<job_id>", methods=["POST"])
+def handle_reprint(job_id):
+    """Print a previous job again, from the label cache when possible"""
+    original = print_queue.get(job_id)
+    if original is None:
+        return jsonify({"error": "Job not found"}), 404
+
+    cached = label_cache.get(original.result.get("cache_key")) is not None
+    try:
+        job = print_queue.submit(dict(original.params, reprint_of=job_id))
+    except (QueueFullError, QueueClosedError) as e:
+        return jsonify({"error": str(e)}), 503
+
+    return (
+        jsonify(
+            {
+                "message": "Reprint queued",
+                "job_id": job.id,
+                "status_url": f"/api/jobs/{job.id}",
+                "cached": cached,
+            }
+        ),
+        202,
+    )
+
+
+# --- Batch printing ---
+batches = {}
+
+# Finished batches whose progress is kept for /api/batch, newest first
+BATCH_HISTORY = int(os.environ.get("BATCH_HISTORY", 50))
+
+
+def prune_batches():
+    """Forget the oldest finished batches beyond BATCH_HISTORY"""
+    finished = [batch_id for batch_id, batch in batches.items() if batch.finished]
+    for batch_id in finished[:max(0, len(finished) - BATCH_HISTORY)]:
+        batches.pop(batch_id, None)
+
+
+@app.route("/api/batch", methods=["POST"])
+def handle_batch():
+    """
+    Render and print labels for an uploaded attendee list (CSV or JSON Lines).
+
+    Label options sent as form fields apply to every row that doesn't set
+    its own. With render_only the labels are only rendered into the label
+    cache, so printing them later at check-in skips rendering.
+    """
+    if print_queue.closed:
+        return jsonify({"error": "Server is shutting down"}), 503
+
+    upload = request.files.get("file")
+    if upload is None:
+        return jsonify({"error": "Missing attendee file"}), 400
+
+    printer = printer_pool.choose()
+    if printer is None:
+        return jsonify({"error": "No printer connected"}), 409
+
+    try:
+        attendees = parse_attendees(upload.read(), upload.filename or "")
+    except Exception as e:
+        return jsonify({"error": f"Could not read attendee file: {e}"}), 400
+
+    template_name = request.form.get("template") or None
+    font_size = request.form.get("font_size", "300")
+    # Check the options and templates up front; fitting the names happens
+    # in the render workers
+    try:
+        if font_size != "auto" and not font_size.strip().isdigit():
+            raise ValueError(f"font_size must be a number or 'auto', not {font_size!r}")
+        defaults = {
+            "layout": request.form.get("layout", "side_by_side"),
+            "font_size": font_size if font_size == "auto" else int(font_size),
+            "width": request.form.get("width", 731, type=int),
+            "height": request.form.get("height", 300, type=int),
+            "template": template_name,
+            "color_mode": request.form.get("color_mode") or None,
+        }
+        if template_name:
+            # Unless the form overrides them, the template's own name settings apply
+            defaults["layout"] = request.form.get("layout")
+            defaults["font_size"] = defaults["font_size"] if "font_size" in request.form else None
+        attendees = [dict(defaults, **attendee) for attendee in attendees]
+        for attendee in attendees:
+            attendee["color_mode"] = check_color_mode(attendee["color_mode"])
+            if attendee["template"]:
+                template = get_template(attendee["template"])
+                attendee["width"], attendee["height"] = template.width, template.height
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    backend_name = get_backend(printer["method"], printer["address"]).name
+    model = printer["model"]
+
+    def cache_label(params, payload):
+        label_cache.put(label_cache_key(params, backend_name, model), payload)
+
+    batch = Batch(
+        attendees,
+        printer,
+        workers=int(os.environ.get("BATCH_RENDER_WORKERS", 0)) or None,
+        render_only=request.form.get("render_only", "false").lower() in ("1", "true", "yes"),
+        on_label=cache_label,
+        on_printed=lambda index, params: job_journal.record_printed(
+            f"{batch.id}-{index + 1}", params, printer["address"]
+        ),
+    )
+    prune_batches()
+    batches[batch.id] = batch
+    batch.start()
+
+    return (
+        jsonify(
+            {
+                "message": "Batch started",
+                "batch_id": batch.id,
+                "status_url": f"/api/batch/{batch.id}",
+                "total": len(attendees),
+            }
+        ),
+        202,
+    )
+
+
+@app.route("/api/batch", methods=["GET"])
+def list_batches():
+    return jsonify({"batches": [b.to_dict() for b in reversed(list(batches.values()))]})
+
+
+@app.route("/api/batch/<batch_id>", methods=["GET"])
+def get_batch(batch_id):
+    batch = batches.get(batch_id)
+    if batch is None:
+        return jsonify({"error": "Batch not found"}), 404
+    return jsonify(batch.to_dict())
+
+
+@app.route("/api/batch/<batch_id>/<action>", methods=["POST"])
+def control_batch(batch_id, action):
+    """Pause, resume or cancel a running batch"""
+    batch = batches.get(batch_id)
+    if batch is None:
+        return jsonify({"error": "Batch not found"}), 404
+    if action not in ("pause", "resume", "cancel"):
+        return jsonify({"error": f"Unknown action: {action}"}), 400
+
+    if not getattr(batch, action)():
+        return jsonify({"error": f"Cannot {action} a batch that is {batch.state}"}), 409
+    return jsonify(batch.to_dict())
+
+
+@app.route("/api/templates", methods=["GET"])
+def handle_list_templates():
+    """List the label templates that can be passed to /print-simple"""
+    templates = []
+    for name in list_templates():
+        try:
+            templates.append(get_template(name).to_dict())
+        except TemplateError as e:
+            templates.append({"name": name, "error": str(e)})
+    return jsonify({"templates": templates})
+
+
+@app.route("/api/attendees/printed", methods=["GET"])
+def check_printed():
+    """Check-in lookup: has a label been printed for this attendee?"""
+    first_name = request.args.get("first_name", "")
+    last_name = request.args.get("last_name", "")
+    if not first_name and not last_name:
+        return jsonify({"error": "Missing first or last name"}), 400
+    previous = job_journal.printed(first_name, last_name)
+    return jsonify({"printed": previous is not None, "last": previous})
+
+
+@app.route("/api/attendees/search", methods=["GET"])
+def search_attendees():
+    """
+    Check-in typeahead: registered attendees whose name matches `q`, with
+    their label options and whether their label was already printed.
+    """
+    query = request.args.get("q", "")
+    limit = min(max(request.args.get("limit", default=10, type=int), 1), 50)
+    start = time.perf_counter()
+    with span("search"):
+        results = attendee_list.search(query, limit)
+    for attendee in results:
+        attendee["printed"] = job_journal.printed(attendee["first_name"], attendee["last_name"])
+    return jsonify(
+        {
+            "query": query,
+            "results": results,
+            "took_ms": round((time.perf_counter() - start) * 1000, 2),
+        }
+    )
+
+
+@app.route("/api/attendees", methods=["GET"])
+def attendee_stats():
+    return jsonify(attendee_list.stats())
+
+
+@app.route("/api/attendees", methods=["POST"])
+def upload_attendees():
+    """
+    Replace the registered attendee list (CSV or JSON Lines, the same
+    format as /api/batch). Only the attendees that changed are updated in
+    the search index.
+    """
+    upload = request.files.get("file")
+    if upload is None:
+        return jsonify({"error": "Missing attendee file"}), 400
+    try:
+        added, removed = attendee_list.save(upload.read())
+    except Exception as e:
+        return jsonify({"error": f"Could not read attendee file: {e}"}), 400
+    return jsonify(dict(attendee_list.stats(), added=added, removed=removed))
+
+
+@app.route("/api/jobs", methods=["GET"])
+def list_jobs():
+    """List recent print jobs, newest first"""
+    limit = request.args.get("limit", default=50, type=int)
+    jobs = [job.to_dict() for job in print_queue.list(limit)]
+    return jsonify({"jobs": jobs, "pending": print_queue.pending()})
+
+
+@app.route("/api/jobs/<job_id>", methods=["GET"])
+def get_job(job_id):
+    job = print_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job.to_dict())
+
+
+@app.route("/api/archive", methods=["GET"])
+def archive_stats():
+    """Size and limits of the label archive and the events in it"""
+    return jsonify(dict(label_archive.stats(), events=label_archive.events()))
+
+
+@app.route("/api/archive/labels", methods=["GET"])
+def list_archived_labels():
+    """List archived labels, newest first; `before` pages through older ones"""
+    labels = label_archive.labels(
+        event=request.args.get("event"),
+        limit=min(request.args.get("limit", default=100, type=int), 1000),
+        before=request.args.get("before", type=int),
+    )
+    return jsonify({"labels": labels})
+
+
+@app.route("/api/archive/labels/<int:label_id>", methods=["GET"])
+def get_archived_label(label_id):
+    archived = label_archive.get(label_id)
+    if archived is None:
+        return jsonify({"error": "Label not found"}), 404
+    label, data = archived
+    return Response(data, mimetype="image/png", headers={"ETag": label["hash"]})
+
+
+@app.route("/api/archive/export", methods=["GET"])
+def export_archive():
+    """Download the archived labels of an event (or all of them) as a zip file"""
+    event = request.args.get("event")
+    name = re.sub(r"[^\w-]+", "", event or "") or "labels"
+    return Response(
+        stream_with_context(label_archive.export(event)),
+        mimetype="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="{name}.zip"'},
+    )
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    """Stage timings and counters of this process, in the Prometheus text format"""
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
 
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5555, debug=True)
+    app.run(host="0.0.0.0", port=5555, debug=os.environ.get("FLASK_DEBUG") == "1")
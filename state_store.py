@@ -0,0 +1,157 @@
+# state_store.py
+import copy
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class StateStore:
+    """
+    Key/value state shared between processes, stored in SQLite in WAL mode.
+
+    Values are JSON documents kept in memory; reads only go to the
+    database when another process has committed a change since the last
+    read (detected with `PRAGMA data_version`, which doesn't re-read any
+    data). Writes are atomic transactions, and `update` runs a whole
+    read-modify-write under SQLite's write lock, so concurrent workers
+    can't overwrite each other's changes.
+
+    Callbacks registered with `on_change` are invoked with (key, value)
+    when a change made by another process is noticed, either on a read or
+    by the watcher thread that polls every `poll_interval` seconds.
+    """
+
+    def __init__(self, path, legacy_path=None, poll_interval=1.0, busy_timeout=5.0):
+        self.path = path
+        self.legacy_path = legacy_path
+        self.poll_interval = poll_interval
+        self.busy_timeout = busy_timeout
+        self._values = {}
+        self._version = None
+        self._conn = None
+        self._pid = None
+        self._callbacks = []
+        self._watcher = None
+        self._lock = threading.RLock()
+
+    def get(self, key, default=None):
+        """Return a copy of the value stored under `key`"""
+        self._refresh()
+        with self._lock:
+            encoded = self._values.get(key)
+        return copy.deepcopy(default) if encoded is None else json.loads(encoded)
+
+    def set(self, key, value):
+        """Store `value` under `key`; unchanged values aren't written"""
+        return self.update(key, lambda _: value)
+
+    def update(self, key, change, default=None):
+        """
+        Atomically replace the value under `key` with `change(value)`.
+
+        Args:
+            key (str): Key to update
+            change (callable): Receives a copy of the current value (or of
+                `default`) and returns the new value
+            default: Value passed to `change` if nothing is stored yet
+
+        Returns:
+            The new value
+        """
+        with self._lock:
+            conn = self._connection()
+            # BEGIN IMMEDIATE takes the database write lock up front, so
+            # no other process can commit between our read and write
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute("SELECT value FROM state WHERE key = ?", (key,)).fetchone()
+                current = copy.deepcopy(default) if row is None else json.loads(row[0])
+                value = change(current)
+                encoded = json.dumps(value, sort_keys=True)
+                if row is None or row[0] != encoded:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)", (key, encoded)
+                    )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            self._values[key] = encoded
+        return json.loads(encoded)
+
+    def on_change(self, callback):
+        """Call `callback(key, value)` when another process changes a value"""
+        self._callbacks.append(callback)
+        with self._lock:
+            if self._watcher is None:
+                self._watcher = threading.Thread(target=self._watch, name="state-store", daemon=True)
+                self._watcher.start()
+
+    def _connection(self):
+        # SQLite connections must not be shared with a forked child (e.g.
+        # gunicorn workers forked from a preloaded app), so reopen per process
+        if self._conn is None or self._pid != os.getpid():
+            conn = sqlite3.connect(
+                self.path,
+                timeout=self.busy_timeout,
+                isolation_level=None,
+                check_same_thread=False,
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            self._conn = conn
+            self._pid = os.getpid()
+            self._version = None
+            self._import_legacy(conn)
+        return self._conn
+
+    def _import_legacy(self, conn):
+        """Seed an empty store from the JSON file used before the store existed"""
+        if not self.legacy_path or not os.path.exists(self.legacy_path):
+            return
+        try:
+            with open(self.legacy_path, "r") as f:
+                legacy = json.load(f)
+        except Exception as e:
+            logger.warning("Error reading legacy printer state: %s", e)
+            return
+        # INSERT OR IGNORE so only the first process to get here imports it
+        conn.execute(
+            "INSERT OR IGNORE INTO state (key, value) VALUES (?, ?)",
+            ("printer", json.dumps(legacy, sort_keys=True)),
+        )
+
+    def _refresh(self):
+        """Reload the values if another process committed since the last read"""
+        changed = []
+        with self._lock:
+            conn = self._connection()
+            version = conn.execute("PRAGMA data_version").fetchone()[0]
+            if version == self._version:
+                return
+            values = dict(conn.execute("SELECT key, value FROM state").fetchall())
+            if self._version is not None:
+                changed = [k for k, v in values.items() if self._values.get(k) != v]
+            self._values = values
+            self._version = version
+
+        for key in changed:
+            for callback in self._callbacks:
+                try:
+                    callback(key, json.loads(values[key]))
+                except Exception as e:
+                    logger.error("Error in state change callback: %s", e)
+
+    def _watch(self):
+        while True:
+            time.sleep(self.poll_interval)
+            try:
+                self._refresh()
+            except sqlite3.Error as e:
+                logger.warning("Error checking printer state store: %s", e)
@@ -12,11 +12,13 @@ const deviceList = document.getElementById('device-list');
 
 // Buttons
 const scanSystemBtn = document.getElementById('scan-system');
+const connectNetworkBtn = document.getElementById('connect-network');
 const printTestBtn = document.getElementById('print-test');
 
 // Input fields
 const firstNameInput = document.getElementById('first-name');
 const lastNameInput = document.getElementById('last-name');
+const networkAddressInput = document.getElementById('network-address');
 
 // Global state
 let printerConnected = false;
@@ -146,6 +148,20 @@ scanSystemBtn.addEventListener('click', function() {
         });
 });
 
+// Connect directly to a network printer (raw raster over port 9100)
+connectNetworkBtn.addEventListener('click', function() {
+    const address = networkAddressInput.value.trim();
+    
+    if (!address) {
+        alert('Please enter the printer IP address');
+        return;
+    }
+    
+    statusElement.textContent = `Connecting to ${address}...`;
+    statusElement.className = 'connection-status searching';
+    connectToDevice('network', address);
+});
+
 // Print test
 printTestBtn.addEventListener('click', function() {
     const firstName = firstNameInput.value;
@@ -189,11 +205,175 @@ printTestBtn.addEventListener('click', function() {
     });
 });
 
+// Check-in: search the registered attendees and print with one click
+const attendeeSearchInput = document.getElementById('attendee-search');
+const attendeeResults = document.getElementById('attendee-results');
+const checkinStatus = document.getElementById('checkin-status');
+
+// Label options an attendee row may carry, passed on to /print-simple
+const LABEL_OPTIONS = ['layout', 'font_size', 'width', 'height', 'template', 'color_mode'];
+
+let searchTimer = null;
+let searchController = null;
+let selectedIndex = -1;
+
+/**
+ * Search attendees as the user types; stale requests are aborted
+ * @param {string} query - Search text
+ */
+function searchAttendees(query) {
+    if (searchController) {
+        searchController.abort();
+    }
+    if (!query.trim()) {
+        showAttendees([]);
+        return;
+    }
+    searchController = new AbortController();
+    fetch(`/api/attendees/search?q=${encodeURIComponent(query)}&limit=10`, { signal: searchController.signal })
+        .then(response => response.json())
+        .then(data => showAttendees(data.results || []))
+        .catch(error => {
+            if (error.name !== 'AbortError') {
+                console.error('Error searching attendees:', error);
+            }
+        });
+}
+
+/**
+ * Show the search results, each with a print button
+ * @param {Array} attendees - Matching attendees
+ */
+function showAttendees(attendees) {
+    attendeeResults.innerHTML = '';
+    selectedIndex = attendees.length ? 0 : -1;
+
+    attendees.forEach((attendee, index) => {
+        const item = document.createElement('div');
+        item.className = 'attendee-item' + (index === selectedIndex ? ' selected' : '');
+
+        const name = document.createElement('span');
+        name.textContent = `${attendee.first_name || ''} ${attendee.last_name || ''}`;
+        if (attendee.match === 'fuzzy') {
+            const hint = document.createElement('span');
+            hint.className = 'fuzzy';
+            hint.textContent = 'similar';
+            name.appendChild(hint);
+        }
+        if (attendee.printed) {
+            const badge = document.createElement('span');
+            badge.className = 'printed';
+            badge.textContent = `printed ${attendee.printed.count}x`;
+            name.appendChild(badge);
+        }
+
+        const button = document.createElement('button');
+        button.textContent = 'Print';
+        button.disabled = !printerConnected;
+
+        item.appendChild(name);
+        item.appendChild(button);
+        item.addEventListener('click', () => printAttendee(attendee, button));
+        attendeeResults.appendChild(item);
+    });
+}
+
+/**
+ * Queue a name tag for an attendee with their label options
+ * @param {Object} attendee - Search result
+ * @param {HTMLElement} button - The attendee's print button
+ */
+function printAttendee(attendee, button) {
+    if (!printerConnected) {
+        alert('Please connect to a printer first');
+        return;
+    }
+
+    const body = { first_name: attendee.first_name || '', last_name: attendee.last_name || '' };
+    LABEL_OPTIONS.forEach(option => {
+        if (attendee[option] !== undefined && attendee[option] !== null) {
+            body[option] = attendee[option];
+        }
+    });
+
+    button.disabled = true;
+    fetch('/print-simple', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json'
+        },
+        body: JSON.stringify(body)
+    })
+    .then(response => response.json())
+    .then(data => {
+        if (data.error) {
+            checkinStatus.textContent = 'Error: ' + data.error;
+        } else {
+            checkinStatus.textContent = `Printing ${body.first_name} ${body.last_name}` +
+                (data.duplicate ? ' (printed before)' : '');
+            attendeeSearchInput.value = '';
+            showAttendees([]);
+            attendeeSearchInput.focus();
+        }
+        button.disabled = false;
+    })
+    .catch(error => {
+        console.error('Error:', error);
+        checkinStatus.textContent = 'Error: ' + error;
+        button.disabled = false;
+    });
+}
+
+attendeeSearchInput.addEventListener('input', function() {
+    clearTimeout(searchTimer);
+    searchTimer = setTimeout(() => searchAttendees(this.value), 100);
+});
+
+// Arrow keys pick a result, Enter prints it
+attendeeSearchInput.addEventListener('keydown', function(event) {
+    const items = attendeeResults.querySelectorAll('.attendee-item');
+    if (!items.length) {
+        return;
+    }
+    if (event.key === 'ArrowDown' || event.key === 'ArrowUp') {
+        event.preventDefault();
+        items[selectedIndex].classList.remove('selected');
+        const step = event.key === 'ArrowDown' ? 1 : items.length - 1;
+        selectedIndex = (selectedIndex + step) % items.length;
+        items[selectedIndex].classList.add('selected');
+        items[selectedIndex].scrollIntoView({ block: 'nearest' });
+    } else if (event.key === 'Enter') {
+        event.preventDefault();
+        items[selectedIndex].click();
+    }
+});
+
 // Initial setup - disable print button until connected
 printTestBtn.disabled = true;
 
+/**
+ * Subscribe to server-pushed printer updates, falling back to polling
+ * in browsers without EventSource support
+ */
+function subscribeToStatus() {
+    if (!window.EventSource) {
+        setInterval(fetchStatus, 2000);
+        return;
+    }
+    
+    const events = new EventSource('/api/events');
+    events.addEventListener('printer', event => {
+        updateConnectionStatus(JSON.parse(event.data));
+    });
+    events.onerror = () => {
+        // EventSource reconnects by itself; show that we lost the server meanwhile
+        statusElement.textContent = 'Reconnecting to server...';
+        statusElement.className = 'connection-status searching';
+    };
+}
+
 // Initial status fetch
 fetchStatus();
 
-// Periodically update status
-setInterval(fetchStatus, 2000);
\ No newline at end of file
+// Receive status changes as they happen
+subscribeToStatus();
\ No newline at end of file
@@ -0,0 +1,98 @@
+import importlib
+import os
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# The app opens its journal, archive and state files when it's imported;
+# keep them out of the working directory
+STATE_DIR = tempfile.mkdtemp(prefix="label-printer-tests-")
+for _name, _file_name in (("JOB_JOURNAL", "print_journal.jsonl"), ("LABEL_ARCHIVE", "label_archive.db"),
+                          ("PRINTER_STATE_DB", "printer_state.db"), ("ATTENDEE_LIST", "attendees.csv")):
+    os.environ.setdefault(_name, os.path.join(STATE_DIR, _file_name))
+
+
+class FakePrinter(socketserver.ThreadingTCPServer):
+    """TCP server on a free local port that stores each job it receives"""
+
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self):
+        self.jobs = []
+        super().__init__(("127.0.0.1", 0), _FakePrinterHandler)
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def wait_for_jobs(self, count, timeout=2):
+        """Wait until `count` connections were read to the end"""
+        deadline = time.monotonic() + timeout
+        while len(self.jobs) < count and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return self.jobs
+
+
+class _FakePrinterHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        chunks = []
+        while True:
+            data = self.request.recv(65536)
+            if not data:
+                break
+            chunks.append(data)
+        self.server.jobs.append(b"".join(chunks))
+
+
+@pytest.fixture
+def fake_printer():
+    printer = FakePrinter()
+    threading.Thread(target=printer.serve_forever, daemon=True).start()
+    yield printer
+    printer.shutdown()
+    printer.server_close()
+
+
+@pytest.fixture
+def fake_lp(tmp_path, monkeypatch):
+    """
+    Put a fake `lp` first on PATH. It logs its arguments and the document
+    it reads to `lp.log` and rejects jobs for printers named `bad*`.
+
+    Returns:
+        pathlib.Path: The log file
+    """
+    log = tmp_path / "lp.log"
+    script = tmp_path / "lp"
+    script.write_text(
+        "#!/bin/sh\n"
+        f'echo "$*" >> "{log}"\n'
+        "cat > /dev/null\n"
+        'case "$2" in bad*) echo "rejected" >&2; exit 1;; esac\n'
+        'echo "request id is fake-1"\n'
+    )
+    script.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{tmp_path}{os.pathsep}{os.environ['PATH']}")
+    return log
+
+
+@pytest.fixture(scope="session")
+def routes():
+    """The Flask app module, shut down after the last test"""
+    module = importlib.import_module("routes")
+    yield module
+    module.shutdown(timeout=5)
+
+
+@pytest.fixture
+def client(routes):
+    routes.app.config["TESTING"] = True
+    return routes.app.test_client()
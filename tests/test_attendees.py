@@ -0,0 +1,87 @@
+import os
+
+import pytest
+
+from attendees import AttendeeIndex, AttendeeList
+
+
+@pytest.fixture
+def attendee_file(tmp_path):
+    path = tmp_path / "attendees.csv"
+    path.write_text("first_name,last_name,font_size\nAda,Lovelace,120\nGrace,Hopper,\n")
+    return path
+
+
+def names(results):
+    return [(a["first_name"], a["last_name"]) for a in results]
+
+
+def test_search_matches_word_prefixes_in_any_order_ignoring_accents():
+    index = AttendeeIndex()
+    for first_name, last_name in (("Ada", "Lovelace"), ("Zoë", "Ólafsdóttir"), ("Adam", "Smith")):
+        index.add({"first_name": first_name, "last_name": last_name})
+
+    assert names(index.search("lov ada")) == [("Ada", "Lovelace")]
+    assert names(index.search("zoe olafs")) == [("Zoë", "Ólafsdóttir")]
+    # Whole words rank before prefixes
+    assert names(index.search("ada")) == [("Ada", "Lovelace"), ("Adam", "Smith")]
+
+
+def test_search_falls_back_to_similar_spellings():
+    index = AttendeeIndex()
+    index.add({"first_name": "Grace", "last_name": "Hopper"})
+
+    results = index.search("grase hoper")
+    assert names(results) == [("Grace", "Hopper")]
+    assert results[0]["match"] == "fuzzy"
+
+
+@pytest.mark.parametrize("kept", [95, 5], ids=["incremental", "rebuild"])
+def test_replace_only_applies_the_difference(kept):
+    index = AttendeeIndex()
+    attendees = [{"first_name": "Ada", "last_name": f"Lovelace{i:03}"} for i in range(100)]
+    index.replace(attendees)
+    ids = {a["last_name"]: a["id"] for a in index.search("ada", limit=100)}
+
+    new = attendees[:kept] + [{"first_name": "Grace", "last_name": "Hopper"}]
+    assert index.replace(new) == (1, 100 - kept)
+
+    assert len(index) == kept + 1
+    assert {a["last_name"]: a["id"] for a in index.search("ada", limit=100)} == {
+        name: ids[name] for name in list(ids)[:kept]
+    }
+    assert names(index.search("hopper")) == [("Grace", "Hopper")]
+    assert [a for a in index.search("lovelace099") if a["match"] == "prefix"] == []
+
+
+def rewrite(path, text):
+    """Replace the file's contents and make sure its mtime changes"""
+    stat = os.stat(path)
+    path.write_text(text)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+
+def test_list_picks_up_changes_to_the_file(attendee_file):
+    attendees = AttendeeList(str(attendee_file), check_interval=0)
+    assert [a["last_name"] for a in attendees.search("ada")] == ["Lovelace"]
+
+    rewrite(attendee_file, "first_name,last_name\nAda,Lovelace\nAlan,Turing\n")
+
+    assert [a["last_name"] for a in attendees.search("a")] == ["Lovelace", "Turing"]
+    assert attendees.search("grace") == []
+
+
+def test_unreadable_file_keeps_the_previous_list(attendee_file):
+    attendees = AttendeeList(str(attendee_file), check_interval=0)
+    attendees.refresh()
+
+    rewrite(attendee_file, "first_name,last_name,font_size\nAda,Lovelace,large\n")
+
+    assert [a["last_name"] for a in attendees.search("grace")] == ["Hopper"]
+    stats = attendees.stats()
+    assert (stats["attendees"], "large" in stats["error"]) == (2, True)
+
+    rewrite(attendee_file, "first_name,last_name\nAlan,Turing\n")
+
+    assert [a["last_name"] for a in attendees.search("alan")] == ["Turing"]
+    assert attendees.stats()["error"] is None
@@ -0,0 +1,76 @@
+import io
+import socket
+
+import pytest
+from PIL import Image, ImageDraw
+
+from printer_manager.backends import BROTHER_QL_AVAILABLE, BrotherQLBackend, LpBackend, get_backend
+
+needs_brother_ql = pytest.mark.skipif(not BROTHER_QL_AVAILABLE, reason="brother_ql is not installed")
+
+
+def label(text="Ada Lovelace", size=(731, 300)):
+    image = Image.new("RGB", size, "white")
+    ImageDraw.Draw(image).text((20, 100), text, fill="black")
+    return image
+
+
+def closed_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@needs_brother_ql
+def test_brother_ql_send_delivers_raster_intact(fake_printer):
+    backend = BrotherQLBackend(f"tcp://127.0.0.1:{fake_printer.port}")
+    payload = backend.prepare(label())
+
+    assert backend.send(payload)
+    assert fake_printer.wait_for_jobs(1) == [payload]
+
+
+@needs_brother_ql
+def test_brother_ql_merge_sends_labels_in_order_over_one_connection(fake_printer):
+    backend = BrotherQLBackend(f"tcp://127.0.0.1:{fake_printer.port}")
+    payloads = [backend.prepare(label(name)) for name in ("Ada Lovelace", "Grace Hopper", "Alan Turing")]
+
+    assert backend.send(backend.merge(payloads))
+    assert fake_printer.wait_for_jobs(1) == [b"".join(payloads)]
+
+
+@needs_brother_ql
+def test_brother_ql_send_to_unreachable_printer_fails():
+    backend = BrotherQLBackend(f"tcp://127.0.0.1:{closed_port()}", timeout=1)
+
+    assert backend.send(backend.prepare(label())) is False
+
+
+def test_lp_send_pipes_label_to_lp(fake_lp):
+    backend = LpBackend("QL-820NWB")
+
+    assert backend.send(backend.prepare(label()))
+    assert fake_lp.read_text().splitlines() == ["-d QL-820NWB"]
+
+
+def test_lp_send_tries_every_option_set_before_failing(fake_lp):
+    backend = LpBackend("bad-printer")
+
+    assert backend.send(backend.prepare(label())) is False
+    assert len(fake_lp.read_text().splitlines()) == len(LpBackend.OPTION_SETS)
+
+
+def test_lp_merge_makes_one_pdf_page_per_label():
+    backend = LpBackend("QL-820NWB")
+    payloads = [backend.prepare(label(name)) for name in ("Ada Lovelace", "Grace Hopper")]
+
+    merged = backend.merge(payloads)
+
+    assert merged.startswith(b"%PDF")
+    assert merged.count(b"/Type /Page\n") == 2
+
+
+def test_get_backend_picks_by_connection_method():
+    assert isinstance(get_backend("system", "QL-820NWB"), LpBackend)
+    if BROTHER_QL_AVAILABLE:
+        assert isinstance(get_backend("network", "127.0.0.1:9100"), BrotherQLBackend)
@@ -0,0 +1,95 @@
+import json
+import os
+from types import SimpleNamespace
+
+import pytest
+
+from job_journal import JobJournal
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "journal.jsonl")
+
+
+def job(job_id, state, first_name="Ada", last_name="Lovelace"):
+    params = {"first_name": first_name, "last_name": last_name}
+    return SimpleNamespace(id=job_id, state=state, params=params, result={"printer": "QL-1"}, error="offline")
+
+
+def records(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+
+def test_reopening_replays_unfinished_jobs_once(path):
+    journal = JobJournal(path, sync="always")
+    for job_id in ("a", "b", "c"):
+        journal.record(job(job_id, "queued"))
+    journal.record(job("a", "done"))
+    journal.record(job("b", "failed"))
+    journal.close()
+
+    journal = JobJournal(path)
+    try:
+        assert journal.unfinished() == [("c", {"first_name": "Ada", "last_name": "Lovelace"})]
+        assert journal.unfinished() == []
+        assert journal.printed("ada", "LOVELACE")["job_id"] == "a"
+    finally:
+        journal.close()
+
+
+def test_opening_compacts_to_summaries_and_unfinished_jobs(path):
+    journal = JobJournal(path, sync="always")
+    for i in range(3):
+        journal.record(job(f"done-{i}", "queued"))
+        journal.record(job(f"done-{i}", "done"))
+    journal.record(job("open", "queued", first_name="Grace", last_name="Hopper"))
+    journal.close()
+
+    JobJournal(path).close()
+
+    assert [(r["op"], r.get("count"), r.get("id")) for r in records(path)] == [
+        ("printed", 3, None),
+        ("queued", None, "open"),
+    ]
+
+
+def test_journal_is_compacted_while_it_grows(path):
+    journal = JobJournal(path, sync="always", compact_bytes=4096)
+    try:
+        journal.record(job("open", "queued", first_name="Grace", last_name="Hopper"))
+        for i in range(200):
+            journal.record(job(f"done-{i}", "queued"))
+            journal.record(job(f"done-{i}", "done"))
+
+        assert os.path.getsize(path) < 8192
+        assert len(journal._unread) < 200
+        assert journal.printed("Ada", "Lovelace")["count"] == 200
+    finally:
+        journal.close()
+
+    journal = JobJournal(path)
+    try:
+        assert journal.printed("Ada", "Lovelace")["count"] == 200
+        assert [job_id for job_id, _ in journal.unfinished()] == ["open"]
+    finally:
+        journal.close()
+
+
+def test_prints_from_another_process_are_counted_once(path):
+    owner = JobJournal(path, sync="always", compact_bytes=1)
+    sibling = JobJournal(path, sync="always")
+    try:
+        inode = os.stat(path).st_ino
+        sibling.record(job("a", "done"))
+        owner.record(job("b", "done"))
+
+        assert owner.printed("Ada", "Lovelace")["count"] == 2
+        assert owner.printed("Ada", "Lovelace")["count"] == 2
+        assert sibling.printed("Ada", "Lovelace")["count"] == 2
+        # Not compacted under the sibling's open file
+        assert os.stat(path).st_ino == inode
+    finally:
+        sibling.close()
+        owner.close()
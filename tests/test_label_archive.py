@@ -0,0 +1,111 @@
+import csv
+import io
+import time
+import zipfile
+
+import pytest
+
+import functions
+from label_archive import LabelArchive
+
+
+@pytest.fixture
+def archive(tmp_path):
+    archive = LabelArchive(str(tmp_path / "archive.db"), max_bytes=10_000, retention_days=1)
+    yield archive
+    archive.close()
+
+
+def age(archive, days):
+    """Make every archived label `days` older"""
+    archive._connection().execute("UPDATE labels SET created_at = created_at - ?", (days * 86400,))
+
+
+def test_identical_labels_are_stored_once(archive):
+    first = archive.add(b"png" * 100, "Ada", "Lovelace")
+    second = archive.add(b"png" * 100, "Ada", "Lovelace", job_id="reprint")
+    archive.flush()
+
+    assert first == second
+    stats = archive.stats()
+    assert (stats["labels"], stats["unique_images"], stats["bytes"]) == (2, 1, 300)
+
+
+def test_labels_are_listed_newest_first_and_by_event(archive):
+    archive.add(b"a", "Ada", "Lovelace", event="day-1")
+    archive.add(b"b", "Grace", "Hopper", event="day-2")
+    archive.flush()
+
+    assert [label["first_name"] for label in archive.labels()] == ["Grace", "Ada"]
+    assert [label["first_name"] for label in archive.labels(event="day-1")] == ["Ada"]
+    label, data = archive.get(archive.labels(event="day-2")[0]["id"])
+    assert (label["last_name"], data) == ("Hopper", b"b")
+
+
+def test_prune_deletes_labels_past_retention(archive):
+    archive.add(b"old", "Ada", "Lovelace")
+    archive.flush()
+    age(archive, 2)
+    archive.add(b"new", "Grace", "Hopper")
+    archive.flush()
+
+    assert archive.prune() == 1
+    assert [label["first_name"] for label in archive.labels()] == ["Grace"]
+    assert archive.stats()["unique_images"] == 1
+
+
+def test_prune_deletes_oldest_labels_until_they_fit(archive):
+    for i in range(30):
+        archive.add(bytes([i]) * 1000, "Ada", f"Lovelace {i}")
+    archive.flush()
+    archive.prune()
+
+    stats = archive.stats()
+    assert stats["bytes"] <= archive.max_bytes
+    # Only as many as needed, and the oldest first
+    assert stats["labels"] == 10
+    assert archive.labels(limit=1)[0]["last_name"] == "Lovelace 29"
+
+
+def test_started_archive_prunes_without_new_labels(tmp_path):
+    path = str(tmp_path / "archive.db")
+    archive = LabelArchive(path, retention_days=1)
+    archive.add(b"old", "Ada", "Lovelace")
+    archive.flush()
+    age(archive, 2)
+    archive.close()
+
+    archive = LabelArchive(path, retention_days=1, prune_interval=0.1)
+    try:
+        archive.start()
+        deadline = time.monotonic() + 2
+        while archive.stats()["labels"] and time.monotonic() < deadline:
+            time.sleep(0.02)
+        assert archive.stats()["labels"] == 0
+    finally:
+        archive.close()
+
+
+def test_export_streams_a_zip_with_an_index(archive):
+    archive.add(b"png-a", "Ada", "Lovelace", event="day-1")
+    archive.add(b"png-b", "Grace", "Hopper", event="day-2")
+    archive.flush()
+
+    with zipfile.ZipFile(io.BytesIO(b"".join(archive.export(event="day-1")))) as exported:
+        index = list(csv.DictReader(io.StringIO(exported.read("labels.csv").decode())))
+        assert [row["first_name"] for row in index] == ["Ada"]
+        assert exported.read(index[0]["file"]) == b"png-a"
+
+
+def test_create_simple_label_only_archives_when_asked(archive, monkeypatch):
+    monkeypatch.setattr(functions, "label_archive", archive)
+    monkeypatch.setattr(functions, "ARCHIVE_LABELS", False)
+
+    data = functions.create_simple_label("Ada", "Lovelace", font_size=120)
+    archive.flush()
+    assert data.startswith(b"\x89PNG")
+    assert archive.stats()["labels"] == 0
+
+    functions.create_simple_label("Ada", "Lovelace", font_size=120, archive=True)
+    archive.flush()
+    assert archive.stats()["labels"] == 1
@@ -0,0 +1,36 @@
+import io
+
+import pytest
+from PIL import Image
+
+from functions import render_preview
+
+
+def preview(client, **params):
+    response = client.post("/api/preview", json=dict({"first_name": "Ada", "last_name": "Lovelace"}, **params))
+    return response, (Image.open(io.BytesIO(response.data)) if response.status_code == 200 else None)
+
+
+@pytest.mark.parametrize("color_mode, mode", [("threshold", "1"), ("dither", "1"), ("rgb", "L")])
+def test_preview_is_rendered_in_the_label_color_mode(client, color_mode, mode):
+    response, image = preview(client, color_mode=color_mode, font_size=120)
+
+    assert response.status_code == 200
+    assert image.mode == mode
+    assert response.headers["X-Label-Font-Size"] == "120"
+
+
+def test_preview_rejects_unknown_color_mode(client):
+    response, _ = preview(client, color_mode="sepia")
+
+    assert response.status_code == 400
+    assert "sepia" in response.get_json()["error"]
+
+
+def test_dithered_preview_differs_from_threshold():
+    args = ("Ada", "Lovelace")
+    threshold = render_preview(*args, font_size=120, color_mode="threshold")
+    dither = render_preview(*args, font_size=120, color_mode="dither")
+
+    assert threshold.size == dither.size
+    assert threshold.tobytes() != dither.tobytes()
@@ -0,0 +1,96 @@
+import uuid
+
+import pytest
+
+from job_queue import PrintJob
+from printer_manager.pool import PrinterPool
+
+
+@pytest.fixture
+def printers(routes, fake_lp, monkeypatch):
+    """
+    Put lp printers in the app's pool; the fake lp rejects the ones named
+    `bad*`. Names are unique per test, as the health monitor and the lp
+    profiles remember printers.
+
+    Returns:
+        callable: Takes name prefixes, returns the printer names
+    """
+    monkeypatch.setattr(routes.health_monitor, "watch", lambda *args, **kwargs: None)
+    monkeypatch.setattr(routes.health_monitor, "unwatch", lambda *args, **kwargs: None)
+
+    def add(*prefixes):
+        names = [f"{prefix}-{uuid.uuid4().hex[:6]}" for prefix in prefixes]
+        saved = [{"method": "system", "address": name, "model": "QL-820NWB"} for name in names]
+        routes.update_printer_state(lambda state: state.__setitem__("printers", saved))
+        return names
+
+    yield add
+    routes.update_printer_state(lambda state: state.__setitem__("printers", []))
+
+
+def rendered_on(routes, address, last_names):
+    """Jobs rendered for and assigned to one printer, as render_job would"""
+    jobs, rendered = [], []
+    for last_name in last_names:
+        job = PrintJob({"first_name": "Ada", "last_name": last_name, "layout": "side_by_side",
+                        "font_size": 120, "width": 731, "height": 300})
+        printer = routes.printer_pool.acquire(exclude=[p["address"] for p in routes.printer_pool.config()
+                                                       if p["address"] != address])
+        backend, payload, image = routes.prepare_payload(job, printer)
+        jobs.append(job)
+        rendered.append({"printer": printer, "backend": backend, "payload": payload, "image": image})
+    return jobs, rendered
+
+
+def sent_to(log, name):
+    return [line for line in log.read_text().splitlines() if line.startswith(f"-d {name}")]
+
+
+def test_labels_for_one_printer_are_sent_as_one_job(routes, printers, fake_lp):
+    good, = printers("ql")
+    jobs, rendered = rendered_on(routes, good, ["Lovelace", "Byron"])
+
+    assert routes.print_jobs(jobs, rendered) == [True, True]
+    assert [job.result["merged"] for job in jobs] == [2, 2]
+    assert len(sent_to(fake_lp, good)) == 1
+    stats, = routes.printer_pool.stats()
+    assert (stats["queue_depth"], stats["printed"]) == (0, 2)
+
+
+def test_rejected_merged_job_falls_back_to_single_labels_with_failover(routes, printers, fake_lp):
+    bad, good = printers("bad", "ql")
+    jobs, rendered = rendered_on(routes, bad, ["Lovelace", "Byron", "King"])
+
+    assert routes.print_jobs(jobs, rendered) == [True, True, True]
+    assert [job.result["printer"] for job in jobs] == [good] * 3
+    assert jobs[0].result["failed_over_from"] == [bad]
+    # lp can't merge for this printer, so it isn't sent merged jobs again
+    assert not routes.lp_profiles.merges(bad)
+    assert len(sent_to(fake_lp, good)) == 3
+    assert {p["address"]: p["queue_depth"] for p in routes.printer_pool.stats()} == {bad: 0, good: 0}
+
+
+def test_job_fails_when_every_printer_fails(routes, printers):
+    first, second = printers("bad", "bad")
+    jobs, rendered = rendered_on(routes, first, ["Lovelace"])
+
+    assert routes.print_jobs(jobs, rendered) == [False]
+    assert jobs[0].result["error"] == f"Print failed on {first}, {second}"
+    assert all(p["queue_depth"] == 0 for p in routes.printer_pool.stats())
+
+
+def test_pool_assigns_the_least_loaded_healthy_printer():
+    pool = PrinterPool()
+    for address in ("a", "b", "c"):
+        pool.add("system", address, "QL-820NWB")
+    pool.set_health("c", False)
+
+    assert [pool.acquire()["address"] for _ in range(4)] == ["a", "b", "a", "b"]
+    assert pool.acquire(exclude=["a", "b"]) is None
+
+    pool.release("a", True)
+    pool.release("a", False)
+    assert pool.choose()["address"] == "a"
+    stats = {p["address"]: p for p in pool.stats()}
+    assert (stats["a"]["queue_depth"], stats["a"]["printed"], stats["a"]["failed"]) == (0, 1, 1)
@@ -0,0 +1,54 @@
+import threading
+
+import pytest
+
+from state_store import StateStore
+
+
+@pytest.fixture
+def stores(tmp_path):
+    """Two stores on one database, standing in for two server processes"""
+    path = str(tmp_path / "state.db")
+    return StateStore(path), StateStore(path)
+
+
+def test_reads_are_served_from_memory_until_another_process_writes(stores):
+    first, second = stores
+    first.set("printer", {"address": "a"})
+    assert second.get("printer") == {"address": "a"}
+
+    version = second._version
+    assert second.get("printer") == {"address": "a"}
+    assert second._version == version
+
+    first.set("printer", {"address": "b"})
+    assert second.get("printer") == {"address": "b"}
+    assert second._version != version
+
+
+def test_change_by_another_process_calls_back_once(stores):
+    first, second = stores
+    first.set("printer", {"address": "a"})
+    second.get("printer")
+    changes = []
+    second.on_change(lambda key, value: changes.append((key, value)))
+
+    first.set("printer", {"address": "b"})
+    second.get("printer")
+    second.get("printer")
+
+    assert changes == [("printer", {"address": "b"})]
+
+
+def test_updates_from_several_processes_are_not_lost(stores):
+    def increment(store):
+        for _ in range(50):
+            store.update("count", lambda value: value + 1, default=0)
+
+    threads = [threading.Thread(target=increment, args=(store,)) for store in stores]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert [store.get("count") for store in stores] == [100, 100]
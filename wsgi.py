@@ -0,0 +1,3 @@
+# wsgi.py
+# Entry point for production WSGI servers: gunicorn -c gunicorn.conf.py wsgi:app
+from routes import app  # noqa: F401